@@ -0,0 +1,83 @@
+import os
+import sys
+import time
+import logging
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import yaml
+import parser_config
+
+# Times parsing of a large config file: a cold parse (first load), an unchanged file
+# (content hash hit) and a file with one program changed (parsed again, only that
+# program validated). Then the same programs split into conf.d includes, where a
+# change only parses the file it is in.
+
+
+def write(path: str, programs: int, changed: int = None, first: int = 0):
+    with open(path, "w") as file:
+        file.write("programs:\n")
+
+        for i in range(first, first + programs):
+            file.write(f"  program{i}:\n"
+                       f"    command: \"sleep {3600 if i != changed else 60}\"\n"
+                       f"    numprocs: 1\n"
+                       f"    autorestart: always\n"
+                       f"    stopsignal: SIGTERM\n"
+                       f"    stdout: /dev/null\n"
+                       f"    stderr: /dev/null\n")
+
+
+def timed(path: str) -> float:
+    started = time.perf_counter()
+
+    parser_config.create_parser(path, logging.getLogger()).parse()
+
+    return (time.perf_counter() - started) * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Config parsing benchmark")
+    parser.add_argument("--programs", type=int, default=10000)
+    parser.add_argument("--files", type=int, default=100, help="conf.d files the programs are split into")
+
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "taskmaster.yaml")
+
+        write(path, args.programs)
+
+        print({
+            "programs": args.programs,
+            "loader": parser_config.SafeLoader.__name__,
+            "libyaml": yaml.__with_libyaml__,
+            "cold_ms": timed(path),
+            "unchanged_ms": timed(path),
+        })
+
+        write(path, args.programs, changed=args.programs // 2)
+
+        print({"one_changed_ms": timed(path)})
+
+        per_file = max(args.programs // args.files, 1)
+        path = os.path.join(workdir, "included.yaml")
+
+        os.mkdir(os.path.join(workdir, "conf.d"))
+
+        with open(path, "w") as file:
+            file.write("include: conf.d/*.yaml\n")
+
+        for i in range(args.files):
+            write(os.path.join(workdir, "conf.d", f"{i}.yaml"), per_file, first=i * per_file)
+
+        cold = timed(path)
+        unchanged = timed(path)
+
+        write(os.path.join(workdir, "conf.d", "0.yaml"), per_file, changed=0)
+
+        print({"files": args.files, "cold_ms": cold, "unchanged_ms": unchanged, "one_changed_ms": timed(path)})
@@ -0,0 +1,53 @@
+import os
+import gc
+import sys
+import logging
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from taskmaster import Taskmaster
+
+# Loads a config of `count` processes (not started, only the supervisor side is measured)
+# and reports the memory and the number of gc tracked objects each process costs.
+
+
+def config(groups: int, count: int):
+    return {f"group{i}": {"command": "sleep 60", "numprocs": count // groups, "autostart": False} for i in range(groups)}
+
+
+def measure(taskmaster: Taskmaster, groups: int, count: int):
+    gc.collect()
+
+    objects = len(gc.get_objects())
+
+    tracemalloc.start()
+
+    taskmaster.reload(config(groups, count))
+
+    gc.collect()
+
+    allocated, _ = tracemalloc.get_traced_memory()
+
+    tracemalloc.stop()
+
+    return {
+        "processes": count,
+        "groups": groups,
+        "total_kib": allocated / 1024,
+        "bytes_per_process": allocated / count,
+        "gc_objects_per_process": (len(gc.get_objects()) - objects) / count,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Process table memory benchmark")
+    parser.add_argument("--count", type=int, default=10000)
+    parser.add_argument("--groups", type=int, default=10)
+
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+
+    print(measure(Taskmaster(logging.getLogger()), args.groups, args.count))
@@ -0,0 +1,58 @@
+import os
+import sys
+import time
+import logging
+import argparse
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from taskmaster import Taskmaster
+
+# Crash-loops a group at increasing sizes and reports reap latency, daemon thread count
+# and pid registry size. All should stay flat while the exit rate grows.
+# Restart backoff and the restart rate limit are disabled, they would throttle the exits.
+
+
+def run(taskmaster: Taskmaster, numprocs: int, seconds: float):
+    before = taskmaster.reaper_stats()["reaped"]
+
+    taskmaster.reload({f"crash{numprocs}": {"command": "true", "numprocs": numprocs, "startsecs": 0, "autorestart": "always",
+                                                 "backoffsecs": 0}})
+
+    threads = 0
+    deadline = time.monotonic() + seconds
+
+    while time.monotonic() < deadline:
+        threads = max(threads, threading.active_count())
+        time.sleep(0.05)
+
+    taskmaster.reload({})
+
+    stats = taskmaster.reaper_stats()
+    registry = taskmaster.registry_stats()
+
+    return {
+        "numprocs": numprocs,
+        "exits_per_sec": (stats["reaped"] - before) / seconds,
+        "max_batch": stats["max_batch"],
+        "max_latency_ms": stats["max_latency"] * 1000,
+        "max_threads": threads,
+        "registry_size": registry["size"],
+        "registry_stale": registry["stale"],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reaper benchmark")
+    parser.add_argument("--seconds", type=float, default=3)
+    parser.add_argument("--sizes", type=int, nargs="*", default=[10, 50, 200, 500])
+
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+
+    taskmaster = Taskmaster(logging.getLogger())
+
+    for size in args.sizes:
+        print(run(taskmaster, size, args.seconds))
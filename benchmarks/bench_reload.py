@@ -0,0 +1,55 @@
+import os
+import sys
+import time
+import copy
+import logging
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from taskmaster import Taskmaster
+
+# Times Taskmaster.reload of a large config (processes are not autostarted, only the
+# supervisor side is measured) for an unchanged config, a hot change on every group
+# and a numprocs bump on every group.
+
+
+def config(groups: int, numprocs: int):
+    return {f"group{i}": {"command": "sleep 60", "numprocs": numprocs, "autostart": False} for i in range(groups)}
+
+
+def timed(taskmaster: Taskmaster, config) -> float:
+    started = time.perf_counter()
+
+    taskmaster.reload(copy.deepcopy(config))
+
+    return (time.perf_counter() - started) * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reload benchmark")
+    parser.add_argument("--groups", type=int, default=50)
+    parser.add_argument("--numprocs", type=int, default=100)
+
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+
+    taskmaster = Taskmaster(logging.getLogger())
+    current = config(args.groups, args.numprocs)
+    result = {"processes": args.groups * args.numprocs, "initial_ms": timed(taskmaster, current)}
+
+    result["unchanged_ms"] = timed(taskmaster, current)
+
+    for program in current.values():
+        program["startretries"] = 5
+        program["autorestart"] = "always"
+
+    result["hot_change_ms"] = timed(taskmaster, current)
+
+    for program in current.values():
+        program["numprocs"] += 1
+
+    result["numprocs_change_ms"] = timed(taskmaster, current)
+
+    print(result)
@@ -0,0 +1,52 @@
+import os
+import sys
+import time
+import logging
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from taskmaster import Taskmaster
+from taskmaster.sampler import Sampler
+
+# Starts `count` sleeping processes and times sweeps of the /proc sampler over them,
+# reporting the share of one core the sampler costs at the given interval.
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Resource sampler benchmark")
+    parser.add_argument("--count", type=int, default=5000)
+    parser.add_argument("--interval", type=float, default=5.0)
+    parser.add_argument("--sweeps", type=int, default=5)
+
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+
+    taskmaster = Taskmaster(logging.getLogger(), sample_interval=0)
+    taskmaster.reload({"sleepers": {"command": "sleep 600", "numprocs": args.count, "startsecs": 0}})
+
+    while sum(p["total"] for p in taskmaster.progress().values()) > 0:
+        time.sleep(0.1)
+
+    targets = [(target, taskmaster.pid(*target)) for target in taskmaster.select(["all"])]
+    sampler = Sampler(lambda: targets, 0, logging.getLogger()) # sweeps are driven by hand
+    sweeps = list()
+
+    for _ in range(args.sweeps):
+        started = time.process_time()
+
+        sampler.sweep()
+
+        sweeps.append(time.process_time() - started)
+
+    sampled = sampler.stats()["processes"]
+
+    taskmaster.stop("sleepers", timeout=30)
+
+    print({
+        "processes": sampled,
+        "sweep_cpu_ms": min(sweeps) * 1000,
+        "per_process_us": min(sweeps) / max(sampled, 1) * 1e6,
+        "core_percent": min(sweeps) / args.interval * 100,
+    })
@@ -0,0 +1,64 @@
+import os
+import sys
+import time
+import random
+import logging
+import argparse
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from taskmaster.scheduler import Scheduler
+
+# Schedules N timers spread over a few seconds, cancels half of them (like stop timers
+# cancelled on a clean exit) and reports how late the remaining ones fired.
+
+
+def run(count: int, spread: float):
+    scheduler = Scheduler(logging.getLogger())
+    lateness = list()
+    done = threading.Event()
+    remaining = count // 2 + count % 2
+
+    def fire(deadline: float):
+        nonlocal remaining
+
+        lateness.append(time.monotonic() - deadline)
+        remaining -= 1
+
+        if remaining == 0:
+            done.set()
+
+    scheduler.start()
+
+    handles = list()
+
+    for i in range(count):
+        delay = random.uniform(0.1, spread)
+        handles.append(scheduler.call_later(delay, fire, time.monotonic() + delay))
+
+    for handle in handles[1::2]:
+        handle.cancel()
+
+    done.wait()
+    scheduler.stop()
+    lateness.sort()
+
+    return {
+        "timers": count,
+        "threads": threading.active_count(),
+        "p50_ms": lateness[len(lateness) // 2] * 1000,
+        "p99_ms": lateness[int(len(lateness) * 0.99)] * 1000,
+        "max_ms": lateness[-1] * 1000,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Timer scheduler benchmark")
+    parser.add_argument("--spread", type=float, default=2)
+    parser.add_argument("--sizes", type=int, nargs="*", default=[1000, 10000, 50000])
+
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        print(run(size, args.spread))
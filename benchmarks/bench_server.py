@@ -0,0 +1,98 @@
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+sys.path.insert(0, ROOT)
+
+import protocol
+
+# Starts a taskmaster server on a scratch config and measures how many commands per second
+# it answers while N clients hammer it concurrently, each keeping `depth` requests in flight.
+
+CONFIG = """programs:
+  sleep:
+    command: sleep 360
+    numprocs: 10
+    startsecs: 0
+"""
+
+
+async def client(socket_path: str, command: str, depth: int, deadline: float) -> int:
+    reader, writer = await asyncio.open_unix_connection(socket_path)
+    count = 0
+
+    writer.write(protocol.MAGIC)
+
+    while time.monotonic() < deadline:
+        writer.write(b"".join(protocol.encode_frame({"id": i, "command": command}) for i in range(depth)))
+        await writer.drain()
+
+        done = 0
+
+        while done < depth:
+            response = await protocol.read_frame(reader)
+
+            if response is None:
+                return count
+
+            done += 1 if response["done"] else 0
+
+        count += depth
+
+    writer.close()
+
+    return count
+
+
+async def run(socket_path: str, clients: int, depth: int, seconds: float, command: str):
+    deadline = time.monotonic() + seconds
+    counts = await asyncio.gather(*[client(socket_path, command, depth, deadline) for _ in range(clients)])
+
+    return {
+        "clients": clients,
+        "depth": depth,
+        "command": command,
+        "commands": sum(counts),
+        "commands_per_sec": sum(counts) / seconds,
+        "slowest_client": min(counts),
+    }
+
+
+def start_server(workdir: str, socket_path: str) -> subprocess.Popen:
+    with open(os.path.join(workdir, "taskmaster.yaml"), "w") as file:
+        file.write(CONFIG)
+
+    server = subprocess.Popen([sys.executable, os.path.join(ROOT, "taskmasterserver.py"), socket_path],
+                              cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    while not os.path.exists(socket_path):
+        time.sleep(0.05)
+
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Control server benchmark")
+    parser.add_argument("--clients", type=int, nargs="*", default=[1, 10, 100])
+    parser.add_argument("--depth", type=int, default=1, help="Pipelined requests in flight per client")
+    parser.add_argument("--seconds", type=float, default=3)
+    parser.add_argument("--command", type=str, default="status sleep:")
+
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        socket_path = os.path.join(workdir, "taskmaster.sock")
+        server = start_server(workdir, socket_path)
+
+        try:
+            for clients in args.clients:
+                print(asyncio.run(run(socket_path, clients, args.depth, args.seconds, args.command)))
+        finally:
+            server.terminate()
+            server.wait()
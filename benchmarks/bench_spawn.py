@@ -0,0 +1,59 @@
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from taskmaster.program import Program
+from taskmaster.spawn import BACKENDS
+
+# Measures spawn-to-exec latency of each spawn backend while the daemon RSS grows.
+# A close-on-exec pipe is shared with the child: the parent sees EOF on it exactly
+# when the child has exec'd (or exited), whatever the backend does in between.
+
+
+def spawn_to_exec(backend, program: Program) -> float:
+    read_fd, write_fd = os.pipe2(os.O_CLOEXEC)
+    started = time.perf_counter()
+
+    pid = backend(program, os.devnull, os.devnull)
+
+    os.close(write_fd)
+    os.read(read_fd, 1)
+
+    elapsed = time.perf_counter() - started
+
+    os.close(read_fd)
+    os.waitpid(pid, 0)
+
+    return elapsed
+
+
+def run(rss_mb: int, spawns: int):
+    ballast = bytearray(rss_mb * 1024 * 1024)
+
+    for i in range(0, len(ballast), 4096):
+        ballast[i] = 1 # touch every page so that it is really mapped
+
+    program = Program({"command": "true"})
+    result = {"rss_mb": rss_mb}
+
+    for name, backend in BACKENDS.items():
+        samples = sorted(spawn_to_exec(backend, program) for _ in range(spawns))
+
+        result[f"{name}_p50_ms"] = samples[len(samples) // 2] * 1000
+        result[f"{name}_p99_ms"] = samples[int(len(samples) * 0.99)] * 1000
+
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Spawn backend benchmark")
+    parser.add_argument("--spawns", type=int, default=200)
+    parser.add_argument("--rss", type=int, nargs="*", default=[0, 256, 1024], help="Ballast in MiB")
+
+    args = parser.parse_args()
+
+    for rss_mb in args.rss:
+        print(run(rss_mb, args.spawns))
@@ -0,0 +1,98 @@
+import os
+import sys
+import time
+import socket
+import logging
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from taskmaster import Taskmaster
+from taskmaster.process import ProcessState
+
+# Starts a group of python programs importing a set of heavy standard library modules,
+# with the default spawn backend (posix_spawn + exec of a fresh interpreter) and with
+# `spawn: zygote` preloading the same modules. Reports the time from the reload to all
+# instances RUNNING (startsecs 0, with the pid known: the spawn call returned) and to all instances ready:
+# each one sends a datagram once its imports are done, which is when it can serve.
+
+MODULES = ["asyncio", "decimal", "email.mime.multipart", "http.server", "xml.dom.minidom", "sqlite3",
+           "unittest", "logging.handlers", "concurrent.futures", "urllib.request", "argparse", "json"]
+
+WORKER = """
+import sys, socket, time
+{imports}
+socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM).sendto(b"ready", sys.argv[1])
+time.sleep(3600)
+"""
+
+
+def run(taskmaster: Taskmaster, workdir: str, spawn: str, numprocs: int, timeout: float):
+    script = os.path.join(workdir, "worker.py")
+    address = os.path.join(workdir, f"ready.{spawn}")
+
+    with open(script, "w") as file:
+        file.write(WORKER.format(imports="\n".join(f"import {module}" for module in MODULES)))
+
+    ready = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    ready.bind(address)
+    ready.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+
+    config = {"command": f"{sys.executable} {script} {address}", "numprocs": numprocs, "startsecs": 0,
+              "stdout": "NONE", "stderr": "NONE", "autorestart": "never", "spawn": spawn, "preload": MODULES}
+
+    started = time.monotonic()
+    running_at = None
+    count = 0
+
+    taskmaster.reload({spawn: config})
+
+    ready.settimeout(0.01)
+
+    while count < numprocs and time.monotonic() - started < timeout:
+        try:
+            ready.recv(16)
+
+            count += 1
+        except socket.timeout:
+            pass
+
+        if running_at is None and all(process.state == ProcessState.running and process.pid > 0 for process in taskmaster.status(spawn)):
+            running_at = time.monotonic()
+
+    ready_at = time.monotonic()
+    running_at = running_at if running_at is not None else ready_at
+
+    taskmaster.reload({})
+
+    while any(process.pid > 0 for process in taskmaster.status(spawn) or []):
+        time.sleep(0.05)
+
+    ready.close()
+    os.unlink(address)
+
+    return {
+        "spawn": spawn,
+        "numprocs": numprocs,
+        "running_ms": (running_at - started) * 1000,
+        "ready_ms": (ready_at - started) * 1000,
+        "ready": count,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Zygote spawn benchmark")
+    parser.add_argument("--sizes", type=int, nargs="*", default=[1, 50, 200])
+    parser.add_argument("--timeout", type=float, default=120)
+
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+
+    taskmaster = Taskmaster(logging.getLogger(), startparallelism=256)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in args.sizes:
+            for spawn in ("posix_spawn", "zygote"):
+                print(run(taskmaster, workdir, spawn, size, args.timeout))
@@ -0,0 +1,339 @@
+import os
+import sys
+import copy
+import json
+import time
+import signal
+import socket
+import asyncio
+import logging
+import argparse
+import platform
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+sys.path.insert(0, ROOT)
+
+import protocol
+from taskmaster import Taskmaster
+from taskmaster.statusreader import StatusReader
+
+# Benchmark suite of the supervisor hot paths, runs offline against real daemons started
+# in scratch directories and writes every result to one JSON file:
+#   time_to_running   N sleepers from daemon start to all RUNNING (read from the status segment)
+#   reload_churn      in-process reloads alternating numprocs and hot field changes
+#   command_latency   status round trips while C clients query concurrently
+#   attach            bytes/s delivered to clients attached to captured log_spammer processes
+#   crash_storm       daemon CPU, RSS and threads while randomly_fails processes crash-loop
+# With --baseline, metrics worse than the baseline by more than --tolerance are reported
+# (names ending in _per_sec are higher-is-better, all others lower-is-better).
+
+PROCESSES = os.path.join(ROOT, "processes")
+
+
+class Daemon:
+    """
+    taskmasterserver.py running on a config written into a scratch directory
+    Started in a session of its own: its children share its process group, so they can
+        all be killed with it (the daemon leaves them running when it exits)
+    """
+    def __init__(self, workdir: str, programs: str, *flags: str):
+        self.workdir = workdir
+        self.socket_path = os.path.join(workdir, "taskmaster.sock")
+        self.status_path = os.path.join(workdir, "taskmaster.status")
+
+        with open(os.path.join(workdir, "taskmaster.yaml"), "w") as file:
+            file.write("programs:\n" + programs)
+
+        self.started_at = time.monotonic()
+        self.process = subprocess.Popen([sys.executable, os.path.join(ROOT, "taskmasterserver.py"), self.socket_path,
+                                         "--status-file", self.status_path, *flags],
+                                        cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                        start_new_session=True)
+
+        while not os.path.exists(self.socket_path) or not os.path.exists(self.status_path):
+            if self.process.poll() is not None:
+                raise RuntimeError("daemon exited during startup")
+
+            time.sleep(0.01)
+
+    def usage(self):
+        """
+        (cpu seconds, rss bytes, threads) of the daemon
+        """
+        with open(f"/proc/{self.process.pid}/stat", "rb") as file:
+            fields = file.read().rsplit(b")", 1)[1].split()
+
+        with open(f"/proc/{self.process.pid}/statm", "rb") as file:
+            rss = int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK"), rss, int(fields[17])
+
+    def stop(self):
+        self.process.terminate()
+
+        try:
+            self.process.wait(timeout=60)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL) # children left behind would skew the next scenarios
+        except ProcessLookupError:
+            pass
+
+
+def program(name: str, command: str, numprocs: int, **settings) -> str:
+    lines = [f"  {name}:", f"    command: \"{command}\"", f"    numprocs: {numprocs}"]
+
+    for key, value in settings.items():
+        lines.append(f"    {key}: {json.dumps(value)}")
+
+    return "\n".join(lines) + "\n"
+
+
+def percentile(samples, rank: float) -> float:
+    samples = sorted(samples)
+
+    return samples[min(int(len(samples) * rank), len(samples) - 1)] if len(samples) > 0 else 0.0
+
+
+def time_to_running(workdir: str, count: int, timeout: float):
+    daemon = Daemon(workdir, program("sleepers", "sleep 3600", count, startsecs=0))
+    reader = StatusReader(daemon.status_path)
+    running = 0
+
+    try:
+        deadline = time.monotonic() + timeout
+
+        while time.monotonic() < deadline:
+            running = sum(1 for status in reader.snapshot() if status.state == "running")
+
+            if running >= count:
+                break
+
+            time.sleep(0.01)
+
+        elapsed = time.monotonic() - daemon.started_at
+    finally:
+        reader.close()
+        daemon.stop()
+
+    return {"processes": count, "running": running, "seconds": elapsed, "processes_per_sec": running / elapsed}
+
+
+def reload_churn(groups: int, numprocs: int, iterations: int):
+    taskmaster = Taskmaster(logging.getLogger(), sample_interval=0, trace_size=0)
+    base = {f"group{i}": {"command": "sleep 3600", "numprocs": numprocs, "autostart": False} for i in range(groups)}
+    changed = copy.deepcopy(base)
+
+    for config in changed.values():
+        config["numprocs"] += 1
+        config["startretries"] = 5
+
+    taskmaster.reload(copy.deepcopy(base))
+
+    samples = list()
+
+    for i in range(iterations):
+        config = copy.deepcopy(changed if i % 2 == 0 else base)
+        started = time.perf_counter()
+
+        taskmaster.reload(config)
+
+        samples.append(time.perf_counter() - started)
+
+    taskmaster.reload({})
+
+    return {"processes": groups * numprocs, "reloads": iterations,
+            "p50_ms": percentile(samples, 0.5) * 1000, "max_ms": max(samples) * 1000,
+            "reloads_per_sec": iterations / sum(samples)}
+
+
+async def _query(socket_path: str, command: str, deadline: float, latencies: list):
+    reader, writer = await asyncio.open_unix_connection(socket_path)
+
+    writer.write(protocol.MAGIC)
+
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+
+        writer.write(protocol.encode_frame({"id": 0, "command": command}))
+        await writer.drain()
+
+        while True:
+            response = await protocol.read_frame(reader)
+
+            if response is None or response["done"]:
+                break
+
+        latencies.append(time.perf_counter() - started)
+
+    writer.close()
+
+
+def command_latency(workdir: str, clients: int, numprocs: int, seconds: float, command: str):
+    daemon = Daemon(workdir, program("sleepers", "sleep 3600", numprocs, startsecs=0))
+    latencies = list()
+
+    async def run():
+        deadline = time.monotonic() + seconds
+
+        await asyncio.gather(*[_query(daemon.socket_path, command, deadline, latencies) for _ in range(clients)])
+
+    try:
+        asyncio.run(run())
+    finally:
+        daemon.stop()
+
+    return {"clients": clients, "command": command, "requests": len(latencies),
+            "p50_ms": percentile(latencies, 0.5) * 1000, "p99_ms": percentile(latencies, 0.99) * 1000,
+            "requests_per_sec": len(latencies) / seconds}
+
+
+async def _attach(socket_path: str, target: str, deadline: float, received: list):
+    reader, writer = await asyncio.open_unix_connection(socket_path)
+    size = 0
+
+    writer.write(protocol.MAGIC + protocol.encode_frame({"id": 0, "command": f"attach {target}"}))
+    await writer.drain()
+
+    try:
+        while time.monotonic() < deadline:
+            response = await asyncio.wait_for(protocol.read_frame(reader), timeout=max(deadline - time.monotonic(), 0.01))
+
+            if response is None or response["done"]:
+                break
+
+            size += len(response["output"])
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        writer.close()
+
+    received.append(size)
+
+
+def attach(workdir: str, spammers: int, clients: int, seconds: float):
+    daemon = Daemon(workdir, program("spam", f"{sys.executable} {PROCESSES}/log_spammer.py", spammers, startsecs=0, capture=True))
+    received = list()
+
+    async def run():
+        await asyncio.sleep(1) # let the spammers start
+        deadline = time.monotonic() + seconds
+
+        await asyncio.gather(*[_attach(daemon.socket_path, f"spam:spam{i % spammers}", deadline, received) for i in range(clients)])
+
+    try:
+        asyncio.run(run())
+    finally:
+        daemon.stop()
+
+    return {"spammers": spammers, "clients": clients, "bytes": sum(received),
+            "bytes_per_sec": sum(received) / seconds, "slowest_client_bytes": min(received) if len(received) > 0 else 0}
+
+
+def crash_storm(workdir: str, count: int, seconds: float):
+    daemon = Daemon(workdir, program("storm", f"{sys.executable} {PROCESSES}/randomly_fails.py 0", count,
+                                     startsecs=0, autorestart="always"))
+    peak_rss = peak_threads = 0
+
+    try:
+        time.sleep(1)
+
+        cpu_before, _, _ = daemon.usage()
+        started = time.monotonic()
+
+        while time.monotonic() - started < seconds:
+            _, rss, threads = daemon.usage()
+
+            peak_rss = max(peak_rss, rss)
+            peak_threads = max(peak_threads, threads)
+
+            time.sleep(0.1)
+
+        cpu_after, _, _ = daemon.usage()
+        elapsed = time.monotonic() - started
+    finally:
+        daemon.stop()
+
+    return {"processes": count, "cpu_percent": (cpu_after - cpu_before) / elapsed * 100,
+            "peak_rss_mb": peak_rss / 1024 / 1024, "peak_threads": peak_threads}
+
+
+def regressions(results, baseline, tolerance: float):
+    found = list()
+
+    for scenario, metrics in results.items():
+        for name, value in metrics.items():
+            old = baseline.get(scenario, {}).get(name)
+
+            if not isinstance(value, (int, float)) or not isinstance(old, (int, float)) or old == 0:
+                continue
+
+            worse = old / value if name.endswith("_per_sec") else value / old
+
+            if worse > 1 + tolerance:
+                found.append(f"{scenario}.{name}: {old:.4g} -> {value:.4g}")
+
+    return found
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Supervisor benchmark suite")
+    parser.add_argument("--output", default="benchmark-results.json", help="JSON file the results are written to")
+    parser.add_argument("--baseline", default=None, help="Previous results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown against the baseline (0.2 - 20%%)")
+    parser.add_argument("--only", nargs="*", default=None, help="Scenarios to run, all by default")
+    parser.add_argument("--processes", type=int, default=1000)
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--seconds", type=float, default=5)
+
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+
+    scenarios = {
+        "time_to_running": lambda workdir: time_to_running(workdir, args.processes, 120),
+        "reload_churn": lambda workdir: reload_churn(50, max(args.processes // 50, 1), 20),
+        "command_latency": lambda workdir: command_latency(workdir, args.clients, 100, args.seconds, "status all"),
+        "attach": lambda workdir: attach(workdir, 10, args.clients, args.seconds),
+        "crash_storm": lambda workdir: crash_storm(workdir, max(args.processes // 10, 1), args.seconds),
+    }
+
+    results = dict()
+
+    for name, scenario in scenarios.items():
+        if args.only is not None and name not in args.only:
+            continue
+
+        with tempfile.TemporaryDirectory() as workdir:
+            results[name] = scenario(workdir)
+
+        print(name, results[name], flush=True)
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "host": socket.gethostname(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        },
+        "results": results,
+    }
+
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline) as file:
+            found = regressions(results, json.load(file)["results"], args.tolerance)
+
+        for line in found:
+            print(f"regression: {line}")
+
+        sys.exit(1 if len(found) > 0 else 0)
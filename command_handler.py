@@ -1,36 +1,42 @@
-import threading
-import socket
+import asyncio
 import time
 
 from taskmaster import Process
-import parser_config
 
 
 class CommandHandler:
-    def __init__(self, taskmaster, logger):
+    def __init__(self, taskmaster, logger, timeout=None):
 
         self.taskmaster = taskmaster
         self.available_commands = [
             "exit", "reload", "restart",
             "start", "pid", "status",
             "quit", "stop", "version",
-            "help"
+            "help", "attach", "tail", "progress", "stats", "trace",
+            "reexec"
         ]
         self.command_help = {
-            "start": "start <name>\tStart a single process\nstart <gname>:*\t\tStart all processes in a group\nstart <name> <name>\tStart multiple processes or groups\nstart all\t\tStart all processes",
-            "stop": "stop <name>\tStop a single process\nstop <gname>:*\t\tStop all processes in a group\nstop <name> <name>\tStop multiple processes or groups\nstop all\t\tStop all processes",
-            "status": "status <name>\tGet status for a single process\nstatus <gname>:*\tGet status for all processes in a group\nstatus <name> <name>\tGet status for multiple named processes\nstatus\t\t\tGet all process status info",
-            "restart": "restart\t\tRestart the remote taskmasterd",
+            "start": "start <name>\tStart a single process\nstart <gname>:*\t\tStart all processes in a group\nstart <name> <name>\tStart multiple processes or groups\nstart all\t\tStart all processes\nstart web*:*\t\tStart processes matching shell globs\nstart /<regex>/\t\tStart processes whose <gname>:<name> matches <regex>",
+            "stop": "stop <name>\tStop a single process\nstop <gname>:*\t\tStop all processes in a group\nstop <name> <name>\tStop multiple processes or groups\nstop all\t\tStop all processes\nstop web*:*\t\tStop processes matching shell globs\nstop /<regex>/\t\tStop processes whose <gname>:<name> matches <regex>",
+            "status": "status <name>\tGet status for a single process\nstatus <gname>:*\tGet status for all processes in a group\nstatus <name> <name>\tGet status for multiple named processes\nstatus\t\t\tGet all process status info\nstatus web*:*\t\tGet status for processes matching shell globs\nstatus /<regex>/\tGet status for processes whose <gname>:<name> matches <regex>",
+            "restart": "restart <name>\tRestart a single process\nrestart <gname>:*\tRestart all processes in a group\nrestart <name> <name>\tRestart multiple processes or groups\nrestart all\t\tRestart all processes",
             "reload": "reload\t\tReload configuration file",
+            "reexec": "reexec\t\tRe-execute the daemon (e.g. after an upgrade), running processes are adopted, not restarted",
             "help": "help\t\tPrint a list of available actions\nhelp <action>\t\tPrint help for <action>",
             "quit": "quit\t\tExit the taskmasterd shell.",
             "exit": "exit\t\tExit the taskmasterd shell.",
             "version": "version\t\tShow the version of the remote taskmasterd process",
             "pid": "pid <name>\tGet pid for a single process\npid <gname>:*\t\tGet pid for all processes in a group\npid <name> <name>\tGet pid for multiple named processes\npid\t\t\tGet all process pid info",
-            "config": "config <path>\t\tReload configuration file from path and use command reload to apply changes"
+            "config": "config <path>\t\tReload configuration file from path and use command reload to apply changes",
+            "progress": "progress\t\tShow groups which are still being launched",
+            "trace": "trace <name>\tRecent lifecycle events of a process (queued, spawn, exec, running, stop, exit...)\ntrace <gname>:*\t\tRecent lifecycle events of all processes in a group",
+            "stats": "stats <name>\tCPU, memory and IO of a process, from the last sample\nstats <gname>:*\t\tCPU, memory and IO of all processes in a group\nstats\t\t\tCPU, memory and IO of all processes",
+            "attach": "attach <gname>:<name>\tFollow stdout of a process",
+            "tail": "tail <gname>:<name>\tLast 1600 bytes of stdout of a process\ntail <gname>:<name> <bytes>\tLast <bytes> bytes of stdout of a process"
         }
         self.program_status = {}
         self.logger = logger
+        self.timeout = timeout
 
     def get_total_processes_in_group(self, group_name, process_name):
         status = self.taskmaster.status(group_name, process_name if len(process_name) > 0 else None)
@@ -41,14 +47,41 @@ class CommandHandler:
         else:
             return 0
 
-    def start_task(self, client_socket, group_name, process_name):
-        client_socket.send(str(self.taskmaster.start(group_name, process_name if len(process_name) > 0 else None)).encode())
+    def select(self, writer, selectors):
+        """
+        Resolves selectors into (group, process) targets, reports why when nothing can be selected
+        """
+        try:
+            targets = self.taskmaster.select(selectors)
+        except ValueError as e:
+            writer.write(f"Error: {e}\n".encode())
+            return None
 
-    def stop_task(self, client_socket, group_name, process_name):
-        client_socket.send(str(self.taskmaster.stop(group_name, process_name if len(process_name) > 0 else None)).encode())
+        if len(targets) == 0:
+            writer.write(f"Error: no process matches {' '.join(selectors)}\n".encode())
+            return None
 
-    def restart_task(self, client_socket, group_name, process_name):
-        result = self.taskmaster.restart(group_name, process_name if len(process_name) > 0 else None)
+        return targets
+
+    async def start_task(self, writer, selectors):
+        targets = self.select(writer, selectors)
+        if targets is None:
+            return
+        result = await self.collect(self.taskmaster.start_targets_async(targets))
+        writer.write(str(result).encode())
+
+    async def stop_task(self, writer, selectors):
+        targets = self.select(writer, selectors)
+        if targets is None:
+            return
+        result = await self.collect(self.taskmaster.stop_targets_async(targets))
+        writer.write(str(result).encode())
+
+    async def restart_task(self, writer, selectors):
+        targets = self.select(writer, selectors)
+        if targets is None:
+            return
+        result = await self.collect(self.taskmaster.restart_targets_async(targets))
 
         if result is not None:
             for k, v in result.items():
@@ -57,66 +90,174 @@ class CommandHandler:
                 else:
                     self.logger.info(f"Program {k}({v[0]}) failed to restart")
 
-        client_socket.send(str(result).encode())
+        writer.write(str(result).encode())
 
-    def get_pid(self, client_socket, group_name, process_name):
-        result: int = self.taskmaster.pid(group_name, process_name)
-        if result > 0:
-            response = str(result) + "\n"
-        else:
-            response = f"{group_name}:{process_name} UNKNOWN\n"
-        client_socket.send(response.encode())
+    async def collect(self, futures):
+        """
+        Awaits process futures on the event loop, other clients keep being served meanwhile
+        """
+        if futures is None:
+            return None
+
+        if len(futures) > 0:
+            await asyncio.wait([asyncio.wrap_future(future) for future in futures.values()], timeout=self.timeout)
+
+        return {name: future.result() if future.done() else (0, False) for name, future in futures.items()}
 
-    def attach(self, client_socket: socket.socket, group_name, process_name):
-        while True:
-            logs = self.taskmaster.attach(group_name, process_name)
+    def get_pid(self, writer, selectors):
+        targets = self.select(writer, selectors)
+        if targets is None:
+            return
+        response = ""
+        for group_name, process_name in targets:
+            result: int = self.taskmaster.pid(group_name, process_name)
+            prefix = f"{group_name}:{process_name} " if len(targets) > 1 else ""
+            if result > 0:
+                response += prefix + str(result) + "\n"
+            else:
+                response += f"{group_name}:{process_name} UNKNOWN\n"
+        writer.write(response.encode())
 
-            if logs is None:
-                break;
+    async def attach(self, writer: asyncio.StreamWriter, group_name, process_name, reader: asyncio.StreamReader = None):
+        """
+        reader: of a plain text client, read until EOF: the writer of a client which went away
+            is not closing until a write fails, which never comes while the log is idle
+        """
+        loop = asyncio.get_running_loop()
+        ready = asyncio.Event()
+        subscription = self.taskmaster.attach(group_name, process_name, lambda: loop.call_soon_threadsafe(ready.set))
 
-            try:
-                client_socket.send(logs.encode())
-            except Exception:
-                break;
+        if subscription is None:
+            writer.write(f"Error: {group_name}:{process_name} has no log to attach to\n".encode())
+            return
 
-            time.sleep(0.5)
+        closed = asyncio.ensure_future(_until_eof(reader)) if reader is not None else None
+        closed.add_done_callback(lambda _: ready.set()) if closed is not None else None
 
-    def get_status(self, client_socket, group_name, process_name):
-        response = self.taskmaster.status(group_name, process_name if len(process_name) > 0 else None)
+        try:
+            while not writer.is_closing() and (closed is None or not closed.done()):
+                try:
+                    await asyncio.wait_for(ready.wait(), timeout=1)
+                except asyncio.TimeoutError:
+                    continue
 
-        if isinstance(response, list):
-            status_string = ""
+                ready.clear()
+                logs, dropped = subscription.take()
 
-            for i in response:
-                status_string += str(i) + "\n"
+                if dropped > 0:
+                    writer.write(f"\n[... {dropped} bytes dropped, client too slow ...]\n".encode())
+
+                writer.write(logs)
+                await writer.drain()
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            closed.cancel() if closed is not None else None
+            self.taskmaster.detach(subscription)
+
+    def tail(self, writer, group_name, process_name, size):
+        logs = self.taskmaster.tail(group_name, process_name, size)
+
+        if logs is None:
+            writer.write(f"Error: {group_name}:{process_name} has no log\n".encode())
         else:
-            status_string = str(response) + "\n"
+            writer.write(logs)
+
+    def get_progress(self, writer):
+        progress = self.taskmaster.progress()
+
+        if len(progress) == 0:
+            writer.write("No launch in progress\n".encode())
+            return
+
+        response = ""
+        for group, p in progress.items():
+            response += (f"{group}: {p['spawned']}/{p['total']} spawned, {p['failed']} not started, "
+                         f"{p['queued']} queued, {p['inflight']} in flight, {p['elapsed']:.1f}s\n")
+        writer.write(response.encode())
 
-        client_socket.send(status_string.encode())
+    def get_stats(self, writer, selectors):
+        targets = self.select(writer, selectors)
+        if targets is None:
+            return
 
-    def reload_task(self, config_data, client_socket):
-        if config_data is None:
+        response = ""
+        for group_name, process_name, sample in self.taskmaster.stats(targets):
+            if sample is None:
+                response += f"{group_name}:{process_name} not sampled\n"
+            else:
+                response += (f"{group_name}:{process_name} pid {sample.pid} cpu {sample.cpu:.1f}% "
+                             f"rss {sample.rss / 1024 / 1024:.1f}MiB threads {sample.threads} "
+                             f"read {sample.read_rate / 1024:.1f}KiB/s write {sample.write_rate / 1024:.1f}KiB/s\n")
+        writer.write(response.encode())
+
+    def get_trace(self, writer, selectors, limit=50):
+        targets = self.select(writer, selectors)
+        if targets is None:
+            return
+
+        traces = self.taskmaster.trace(targets, limit)
+        if len(traces) == 0:
+            writer.write("No lifecycle event recorded\n".encode())
+            return
+
+        now = time.monotonic()
+        response = ""
+        for (group_name, process_name), events in traces.items():
+            response += f"{group_name}:{process_name}\n"
+            previous = None
+            for timestamp, _, _, pid, phase, detail in events:
+                delta = f"+{(timestamp - previous) * 1000:.3f}ms" if previous is not None else f"{timestamp - now:.3f}s"
+                response += f"  {delta:>14} {phase}" + (f" pid {pid}" if pid > 0 else "") + (f" ({detail})" if detail is not None else "") + "\n"
+                previous = timestamp
+        writer.write(response.encode())
+
+    def get_status(self, writer, selectors):
+        targets = self.select(writer, selectors)
+        if targets is None:
+            return
+
+        status_string = ""
+
+        for group_name, process in self.taskmaster.status_targets(targets):
+            status_string += str(process) + "\n"
+
+        writer.write(status_string.encode())
+
+    async def reload_task(self, config_path, writer, reload):
+        if config_path is None:
             response = "Error: Invalid configuration or need to add configuration with command: config <path>\n"
             self.logger.error("Error: Invalid configuration or need to add configuration")
         else:
-            prs = parser_config.create_parser(config_data, self.logger)
-            config_data = prs.parse()["programs"]
-            print(config_data)
-            self.taskmaster.reload(config_data)
-            response = "Configuration updated\n"
-            self.logger.info("Configuration updated")
-        client_socket.send(response.encode())
-
-    def send_help_info(self, client_socket):
+            error = await reload()
+            if error is None:
+                response = "Configuration updated\n"
+                self.logger.info("Configuration updated")
+            else:
+                response = f"Error: {error} (the current configuration is kept)\n"
+        writer.write(response.encode())
+
+    def send_help_info(self, writer):
         help_info = "default commands (type help <topic>):\n"
         help_info += "=====================================\n"
         help_info += " ".join(self.available_commands) + "\n"
-        client_socket.send(help_info.encode())
+        writer.write(help_info.encode())
 
-    def send_command_help(self, client_socket, command):
+    def send_command_help(self, writer, command):
         if command in self.command_help:
             help_info = f"{command}: {self.command_help[command]}\n"
-            client_socket.send(help_info.encode())
+            writer.write(help_info.encode())
         else:
             response = f"Help information not available for command: {command}\n"
-            client_socket.send(response.encode())
+            writer.write(response.encode())
+
+
+async def _until_eof(reader: asyncio.StreamReader):
+    """
+    Discards what an attached client sends, returns once it is gone
+    """
+    try:
+        while len(await reader.read(4096)) > 0:
+            pass
+    except (ConnectionError, OSError):
+        pass
@@ -1,48 +1,157 @@
 import yaml
 import os
+import glob
+import hashlib
 import validation
 
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError: # PyYAML built without libyaml
+    from yaml import SafeLoader
+
+
+class ConfigError(Exception):
+    """
+    The configuration cannot be loaded, the message says why
+    """
+
+
+class _File:
+    """
+    Index entry of one config file: the stat is compared first, the content hash only
+        when the stat changed, and the file is parsed again only when the hash changed
+    """
+    __slots__ = ("mtime", "size", "digest", "data")
+
+    def __init__(self, mtime, size, digest, data):
+        self.mtime = mtime
+        self.size = size
+        self.digest = digest
+        self.data = data
+
+
+# file path -> _File of every config file loaded (main file and includes)
+_index = {}
+# (main file path, {file path: programs it defines}) of the last parse, unchanged files
+# keep the very same programs dict, which is how the changed programs are found
+_last = None
+
 
 # This class is used to parse the taskmaster.yaml file and return the data as a dictionary
+# The main file may include other files: include: conf.d/*.yaml (a glob or a list of globs,
+# relative to the main file) which define more programs, but no includes of their own.
 class Parser_config:
 
     def __init__(self, file_path, logger):
         self.file_path = file_path
         self.logger = logger
+        self.changed = None # programs defined by the files changed since the last parse, None - unknown, diff all
+        self.watched = {} # directory -> file name patterns which make up the configuration, filled by parse
 
 
     def parse(self):
-        if os.path.isfile(self.file_path) and \
-                (self.file_path.lower().endswith('.yaml') or self.file_path.lower().endswith('.yml')):
-            with open(self.file_path, 'r') as stream:
-                try:
-                    config_data = yaml.safe_load(stream)
-                    if config_data is not None and isinstance(config_data, dict):
-                        if validation.validate_config(config_data):
-                            return config_data
-                        else:
-                            print("File content is not a valid YAML dictionary: " + self.file_path)
-                            self.logger.error("File content is not a valid YAML dictionary: " + self.file_path)
-                            exit(1)
-                    else:
-                        print("File content is not a valid YAML dictionary: " + self.file_path)
-                        self.logger.error("File content is not a valid YAML dictionary: " + self.file_path)
-                        exit(1)
-                except yaml.YAMLError as exc:
-                    if hasattr(exc, 'problem_mark'):
-                        mark = exc.problem_mark
-                        error_location = f"Line {mark.line + 1}, Column {mark.column + 1}"
-                        print(f"YAML parsing error at {error_location}: {exc.problem}")
-                        self.logger.error(f"YAML parsing error at {error_location}: {exc.problem}")
-                        exit(1)
-                    else:
-                        print("Error parsing YAML: " + str(exc))
-                        self.logger.error("Error parsing YAML: " + str(exc))
-                        exit(1)
+        global _last
+
+        if not os.path.isfile(self.file_path) or \
+                not (self.file_path.lower().endswith('.yaml') or self.file_path.lower().endswith('.yml')):
+            self._fail("Invalid or missing .yaml or .yml file: " + self.file_path)
+
+        main = self._load(self.file_path)
+        files = {self.file_path: main.get('programs', {})}
+        self.watched = {os.path.dirname(os.path.abspath(self.file_path)): {os.path.basename(self.file_path)}}
+
+        for path in self._includes(main.get('include')):
+            included = self._load(path)
+            if 'include' in included:
+                self._fail("Nested include is not supported: " + path)
+            files[path] = included.get('programs', {})
+
+        programs = {}
+        origin = {}
+        for path, defined in files.items():
+            for name in defined:
+                if name in origin:
+                    self._fail(f"Program '{name}' is defined in both {origin[name]} and {path}")
+                origin[name] = path
+            programs.update(defined)
+
+        if _last is not None and _last[0] == self.file_path:
+            previous = _last[1]
+            self.changed = set()
+            for path in previous.keys() | files.keys():
+                if previous.get(path) is not files.get(path):
+                    self.changed.update(previous.get(path, {}), files.get(path, {}))
         else:
-            print("Invalid or missing .yaml or .yml file: " + self.file_path)
-            self.logger.error("Invalid or missing .yaml or .yml file: " + self.file_path)
-            exit(1)
+            self.changed = None
+
+        _last = (self.file_path, files)
+
+        config_data = dict(main)
+        config_data['programs'] = programs
+        return config_data
+
+    def _includes(self, include):
+        if include is None:
+            return []
+
+        paths = {}
+        for pattern in [include] if isinstance(include, str) else include:
+            pattern = os.path.join(os.path.dirname(self.file_path), pattern)
+            directory, name = os.path.split(os.path.abspath(pattern))
+            if not glob.has_magic(directory):
+                self.watched.setdefault(directory, set()).add(name)
+            for path in sorted(glob.glob(pattern)):
+                if os.path.isfile(path):
+                    paths[path] = None
+                    self.watched.setdefault(os.path.dirname(os.path.abspath(path)), set()).add(name)
+        return list(paths)
+
+    def _load(self, path):
+        """
+        Validated content of one file, parsed again only if it changed since it was last loaded
+        """
+        try:
+            stat = os.stat(path)
+            entry = _index.get(path)
+
+            if entry is not None and entry.mtime == stat.st_mtime_ns and entry.size == stat.st_size:
+                return entry.data
+
+            with open(path, 'rb') as stream:
+                content = stream.read()
+        except OSError as exc:
+            self._fail(f"Cannot read {path}: {exc.strerror}")
+
+        digest = hashlib.blake2b(content, digest_size=16).digest()
+
+        if entry is not None and entry.digest == digest:
+            entry.mtime, entry.size = stat.st_mtime_ns, stat.st_size
+            return entry.data
+
+        try:
+            config_data = yaml.load(content, Loader=SafeLoader)
+        except yaml.YAMLError as exc:
+            if hasattr(exc, 'problem_mark'):
+                mark = exc.problem_mark
+                error_location = f"Line {mark.line + 1}, Column {mark.column + 1}"
+                self._fail(f"YAML parsing error in {path} at {error_location}: {exc.problem}")
+            else:
+                self._fail("Error parsing YAML: " + str(exc))
+
+        if config_data is None or not isinstance(config_data, dict):
+            self._fail("File content is not a valid YAML dictionary: " + path)
+
+        validated = entry.data.get('programs') if entry is not None else None
+        try:
+            validation.validate_config(config_data, validated)
+        except validation.ValidationError as exc:
+            self._fail(f"Invalid configuration in {path}: {exc}")
+
+        _index[path] = _File(stat.st_mtime_ns, stat.st_size, digest, config_data)
+        return config_data
+
+    def _fail(self, message):
+        raise ConfigError(message)
 
 
 def create_parser(config_path, logger):
@@ -54,10 +163,8 @@ def create_parser(config_path, logger):
             if os.path.isfile(path):
                 config_path = path
                 break
-            else:
-                print("No configuration file provided and no default configuration file found.")
-                logger.error("No configuration file provided and no default configuration file found.")
-                exit(1)
+        else:
+            raise ConfigError("No configuration file provided and no default configuration file found.")
 
     config_parser = Parser_config(config_path, logger)
     return config_parser
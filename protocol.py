@@ -0,0 +1,137 @@
+import json
+import asyncio
+import socket
+import struct
+
+
+# Framed control protocol
+#
+# A client opts in by sending MAGIC right after connecting, otherwise the connection stays in
+# plain-text mode: one command per line, raw text back (handy for nc/socat).
+# In framed mode every message is a 4-byte big-endian length followed by a JSON object.
+#   request:  {"id": <int>, "command": <str>}
+#   response: {"id": <int>, "output": <str>, "error": <bool>, "done": <bool>}
+# Requests on one connection are handled concurrently and answered as they complete, so
+# responses may come back out of order. Streaming commands (attach) send several frames
+# for the same id, the last one has done set to true.
+
+MAGIC = b"TMF1\n"
+HEADER = struct.Struct(">I")
+MAX_FRAME = 64 * 1024 * 1024
+
+
+class ProtocolError(Exception):
+    pass
+
+
+def encode_frame(message: dict) -> bytes:
+    body = json.dumps(message, separators=(",", ":")).encode()
+
+    return HEADER.pack(len(body)) + body
+
+
+def decode_frame(body: bytes) -> dict:
+    try:
+        message = json.loads(body)
+    except ValueError as error:
+        raise ProtocolError(f"malformed frame: {error}")
+
+    if not isinstance(message, dict):
+        raise ProtocolError("frame must be a JSON object")
+
+    return message
+
+
+async def read_frame(reader) -> dict:
+    """
+    Reads one frame from an asyncio.StreamReader, returns None on a clean EOF
+    """
+    try:
+        header = await reader.readexactly(HEADER.size)
+    except asyncio.IncompleteReadError as error:
+        if len(error.partial) == 0:
+            return None
+        raise ProtocolError("connection closed in the middle of a frame")
+
+    length, = HEADER.unpack(header)
+
+    if length > MAX_FRAME:
+        raise ProtocolError(f"frame of {length} bytes exceeds the limit")
+
+    return decode_frame(await reader.readexactly(length))
+
+
+def recv_frame(sock: socket.socket) -> dict:
+    """
+    Blocking counterpart of read_frame for plain sockets
+    """
+    header = _recv_exactly(sock, HEADER.size)
+
+    if header is None:
+        return None
+
+    length, = HEADER.unpack(header)
+
+    if length > MAX_FRAME:
+        raise ProtocolError(f"frame of {length} bytes exceeds the limit")
+
+    body = _recv_exactly(sock, length)
+
+    if body is None:
+        raise ProtocolError("connection closed in the middle of a frame")
+
+    return decode_frame(body)
+
+
+def _recv_exactly(sock: socket.socket, size: int) -> bytes:
+    data = bytearray()
+
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+
+        if not chunk:
+            return None
+
+        data += chunk
+
+    return bytes(data)
+
+
+class FrameWriter:
+    """
+    Stands in for the StreamWriter while a framed request is handled, so command handlers
+        keep calling write/drain. drain flushes what was written so far as a partial frame
+    """
+    def __init__(self, writer, request_id):
+        self.writer = writer
+        self.request_id = request_id
+        self.buffer = bytearray()
+
+    def write(self, data: bytes):
+        self.buffer += data
+
+    async def drain(self):
+        if len(self.buffer) > 0:
+            self._send(done=False)
+
+        await self.writer.drain()
+
+    def is_closing(self) -> bool:
+        return self.writer.is_closing()
+
+    async def finish(self):
+        self._send(done=True)
+
+        await self.writer.drain()
+
+    def _send(self, done: bool):
+        output = self.buffer.decode(errors="replace")
+
+        self.buffer = bytearray()
+
+        self.writer.write(encode_frame({
+            "id": self.request_id,
+            "output": output,
+            "error": output.startswith("Error:"),
+            "done": done,
+        }))
@@ -0,0 +1,375 @@
+import os
+import time
+import fcntl
+import selectors
+import threading
+import logging
+
+from typing import List, Dict, Set, Callable
+
+from .logtail import Subscription
+
+
+class RingBuffer:
+    """
+    Keeps the last `capacity` bytes written into it
+    """
+    __slots__ = ("capacity", "_data")
+
+    capacity: int
+    _data: bytearray
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._data = bytearray()
+
+    def write(self, data: bytes):
+        self._data += data
+
+        if len(self._data) > self.capacity:
+            del self._data[:len(self._data) - self.capacity]
+
+    def read(self, size: int = None) -> bytes:
+        if size is None or size >= len(self._data):
+            return bytes(self._data)
+
+        return bytes(self._data[len(self._data) - size:])
+
+
+class RotatingLog:
+    """
+    Append-only log file rotated by size: path -> path.1 -> ... -> path.<backups>
+    Writes are buffered by the caller and handed over in batches
+    """
+    __slots__ = ("path", "maxbytes", "backups", "_fd", "_size")
+
+    path: str
+    maxbytes: int
+    backups: int
+    _fd: int
+    _size: int
+
+    def __init__(self, path: str, maxbytes: int, backups: int):
+        self.path = path
+        self.maxbytes = maxbytes
+        self.backups = backups
+        self._fd = -1
+        self._size = 0
+
+    def write(self, data: bytes):
+        if self._fd < 0:
+            self._open()
+
+        view = memoryview(data)
+
+        while len(view) > 0:
+            if self.maxbytes > 0 and self._size >= self.maxbytes:
+                self._rotate()
+
+            room = len(view) if self.maxbytes <= 0 else max(self.maxbytes - self._size, 1)
+            written = os.write(self._fd, view[:room])
+
+            self._size += written
+            view = view[written:]
+
+    def close(self):
+        os.close(self._fd) if self._fd >= 0 else None
+        self._fd = -1
+
+    def _open(self):
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND | os.O_CLOEXEC, 0o644)
+        self._size = os.fstat(self._fd).st_size
+
+    def _rotate(self):
+        self.close()
+
+        if self.backups > 0:
+            for i in range(self.backups - 1, 0, -1):
+                if os.path.exists(f"{self.path}.{i}"):
+                    os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.truncate(self.path, 0)
+
+        self._open()
+
+
+class Channel:
+    """
+    Captured stream (stdout or stderr) of one process, outlives the pipes of successive spawns
+    """
+    __slots__ = ("ring", "log", "pending", "pending_size", "subscribers", "flushed_at", "fd", "owner")
+
+    ring: RingBuffer
+    log: RotatingLog
+    pending: List[bytes]
+    pending_size: int
+    subscribers: Set[Subscription]
+    flushed_at: float
+    fd: int # read end of the pipe of the latest spawn, -1 once it hit EOF
+    owner: object # process of the latest spawn, a rebuilt group reuses the keys of the old one
+
+    def __init__(self, ring: RingBuffer, log: RotatingLog):
+        self.ring = ring
+        self.log = log
+        self.pending = list()
+        self.pending_size = 0
+        self.subscribers = set()
+        self.flushed_at = 0.0
+        self.fd = -1
+        self.owner = None
+
+
+class OutputCapture:
+    """
+    The supervisor owns the read end of the stdout/stderr pipes of captured processes
+    One thread reads every pipe as soon as data arrives, keeps the recent output in
+        a ring buffer per channel, fans it out to attached clients and writes
+        it to the log file in batches (FLUSH_BYTES or FLUSH_INTERVAL, whichever comes first)
+    """
+    _channels: Dict[str, Channel]
+    _selector: selectors.BaseSelector
+    _logger: logging.Logger
+    _lock: threading.Lock
+    _thread: threading.Thread
+    _wakeup_r: int
+    _wakeup_w: int
+    _running: bool
+
+    RING_SIZE = 64 * 1024
+    READ_SIZE = 64 * 1024
+    FLUSH_BYTES = 256 * 1024
+    FLUSH_INTERVAL = 0.2
+    LIMIT = 1024 * 1024 # max bytes queued per subscriber
+
+    def __init__(self, logger: logging.Logger):
+        self._channels = dict()
+        self._selector = selectors.DefaultSelector()
+        self._logger = logger
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._loop, name="taskmaster-capture", daemon=True)
+        self._wakeup_r, self._wakeup_w = os.pipe2(os.O_NONBLOCK | os.O_CLOEXEC)
+        self._running = False
+
+        self._selector.register(self._wakeup_r, selectors.EVENT_READ, None)
+
+    def start(self):
+        self._running = True
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._notify()
+
+    def open(self, key: str, logfile: str, maxbytes: int, backups: int, owner: object = None) -> int:
+        """
+        Creates a pipe for a new spawn of the channel `key` and returns its write end,
+            which the caller hands to the child and closes afterwards
+        """
+        read_fd, write_fd = os.pipe2(os.O_CLOEXEC)
+
+        self.adopt(key, read_fd, logfile, maxbytes, backups, owner)
+
+        return write_fd
+
+    def adopt(self, key: str, read_fd: int, logfile: str, maxbytes: int, backups: int, owner: object = None):
+        """
+        Starts reading the channel `key` from read_fd, also used for pipes inherited across a re-exec
+            An existing channel keeps its ring buffer and subscribers, its log file is replaced if logfile changed
+        """
+        os.set_inheritable(read_fd, False)
+
+        fcntl.fcntl(read_fd, fcntl.F_SETFL, fcntl.fcntl(read_fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+
+        with self._lock:
+            if key not in self._channels.keys():
+                self._channels[key] = Channel(RingBuffer(self.RING_SIZE), _log(logfile, maxbytes, backups))
+            elif (self._channels[key].log.path if self._channels[key].log is not None else os.devnull) != logfile:
+                channel = self._channels[key]
+
+                self._flush_channel(channel, time.monotonic()) # what was read so far goes to the old file
+
+                channel.log.close() if channel.log is not None else None
+                channel.log = _log(logfile, maxbytes, backups)
+
+            self._selector.register(read_fd, selectors.EVENT_READ, self._channels[key])
+
+            self._channels[key].fd = read_fd
+            self._channels[key].owner = owner
+
+        self._notify()
+
+    def release(self, key: str, owner: object = None):
+        """
+        Forgets the channel of a process removed from its group: writes out its buffered output,
+            closes its log file and the pipes the children didn't close yet
+        Left alone if another owner spawned on it since (the same process of the group replacing it)
+        """
+        with self._lock:
+            channel = self._channels.get(key)
+
+            if channel is None or channel.owner is not owner:
+                return
+
+            del self._channels[key]
+
+            self._flush_channel(channel, time.monotonic())
+
+            channel.log.close() if channel.log is not None else None
+
+            for fd in [key.fd for key in self._selector.get_map().values() if key.data is channel]: # pipes of earlier spawns too
+                self._selector.unregister(fd)
+
+                os.close(fd)
+
+            channel.fd = -1
+
+        self._notify()
+
+    def freeze(self):
+        """
+        Stops reading for good and writes out the buffered output, before the daemon re-executes:
+            what the children write from now on stays in the pipes for the next image
+        """
+        with self._lock:
+            self._running = False
+
+            self._flush(force=True)
+
+        self._notify()
+
+    def handover(self, key: str) -> int:
+        """
+        Keeps the current pipe of the channel open across exec, returns its fd (-1 - none)
+        """
+        with self._lock:
+            channel = self._channels.get(key)
+
+            if channel is None or channel.fd < 0:
+                return -1
+
+            os.set_inheritable(channel.fd, True)
+
+            return channel.fd
+
+    def configure(self, key: str, maxbytes: int, backups: int):
+        with self._lock:
+            if key in self._channels.keys() and self._channels[key].log is not None:
+                self._channels[key].log.maxbytes = maxbytes
+                self._channels[key].log.backups = backups
+
+    def tail(self, key: str, size: int = None) -> bytes:
+        with self._lock:
+            if key not in self._channels.keys():
+                return None
+
+            return self._channels[key].ring.read(size)
+
+    def subscribe(self, key: str, wakeup: Callable[[], None], limit: int = None) -> Subscription:
+        with self._lock:
+            if key not in self._channels.keys():
+                return None
+
+            channel = self._channels[key]
+            subscription = Subscription(key, wakeup, limit if limit is not None else self.LIMIT, self)
+
+            backlog = channel.ring.read()
+
+            subscription.push(backlog) if len(backlog) > 0 else None
+
+            channel.subscribers.add(subscription)
+
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            if subscription.path in self._channels.keys():
+                self._channels[subscription.path].subscribers.discard(subscription)
+
+    def _notify(self):
+        try:
+            os.write(self._wakeup_w, b"\0")
+        except (BlockingIOError, OSError):
+            pass
+
+    def _loop(self):
+        while self._running:
+            with self._lock:
+                buffered = any(len(channel.pending) > 0 for channel in self._channels.values())
+
+            events = self._selector.select(self.FLUSH_INTERVAL if buffered else None)
+
+            with self._lock:
+                if not self._running: # frozen while waiting, nothing more is read
+                    break
+
+                for key, _ in events:
+                    if key.data is None:
+                        self._drain_wakeup()
+                    else:
+                        self._read(key.fd, key.data)
+
+                self._flush(force=False)
+
+        with self._lock:
+            self._flush(force=True)
+
+    def _read(self, fd: int, channel: Channel):
+        try:
+            data = os.read(fd, self.READ_SIZE)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+
+        if len(data) == 0: # every writer is gone, the process died
+            self._selector.unregister(fd)
+
+            os.close(fd)
+
+            channel.fd = -1 if channel.fd == fd else channel.fd
+
+            return
+
+        channel.ring.write(data)
+        if channel.log is not None:
+            channel.pending.append(data)
+            channel.pending_size += len(data)
+
+        for subscription in channel.subscribers:
+            subscription.push(data)
+
+    def _flush(self, force: bool):
+        now = time.monotonic()
+
+        for channel in self._channels.values():
+            if len(channel.pending) == 0:
+                continue
+
+            if force or now - channel.flushed_at >= self.FLUSH_INTERVAL or channel.pending_size >= self.FLUSH_BYTES:
+                self._flush_channel(channel, now)
+
+    def _flush_channel(self, channel: Channel, now: float):
+        if len(channel.pending) == 0:
+            return
+
+        try:
+            channel.log.write(b"".join(channel.pending))
+        except OSError as error:
+            self._logger.error(f"capture: cannot write {channel.log.path}: {error}")
+
+        channel.pending.clear()
+        channel.pending_size = 0
+        channel.flushed_at = now
+
+    def _drain_wakeup(self):
+        try:
+            while os.read(self._wakeup_r, 4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
+
+def _log(logfile: str, maxbytes: int, backups: int) -> RotatingLog:
+    return RotatingLog(logfile, maxbytes, backups) if logfile != os.devnull else None
@@ -1,13 +1,131 @@
+import time
+import threading
+import logging
+
+from typing import List, Dict, Any, Callable, Tuple
+
+from .scheduler import Scheduler
+from .reaper import Reaper
+from .capture import OutputCapture
+from .launcher import Launcher
+from .statusmap import StatusMap
+from .metrics import Metrics
+from .trace import Tracer
+from .ratelimit import TokenBucket
+from .journal import Journal
+from .listeners import Listeners
+from .zygote import Zygotes
+
+
 class Context:
-    _pid_to_process: dict = dict()# pid(int) to process(Process)
+    """
+    Per-supervisor state shared by every group and process: the services they rely on
+        and the registry routing reaped pids to their processes
+    Registry entries are (process, generation, spawned_at), the generation is the spawn
+        counter of the process. An entry is removed as soon as its pid is reaped,
+        so the registry only ever holds live children
+    Process locks are striped: processes share LOCK_STRIPES locks picked by name hash,
+        none of them ever holds two of these locks at once
+    """
+    logger: logging.Logger
+    scheduler: Scheduler
+    reaper: Reaper
+    capture: OutputCapture
+    launcher: Launcher
+    status: StatusMap # None - status segment disabled
+    metrics: Metrics
+    tracer: Tracer
+    restarts: TokenBucket # shared by automatic restarts of every group
+    journal: Journal # None - journal disabled, children are not adopted by the next daemon
+    listeners: Listeners
+    zygotes: Zygotes
+
+    _pid_to_process: Dict[int, Tuple[Any, int, float]] # pid(int) to (process(Process), generation(int), spawned_at(float))
+    _lock: threading.Lock
+    _locks: List[threading.Lock]
+    _inserted: int
+    _removed: int
+    _stale: int
+
+    LOCK_STRIPES = 256
+
+    def __init__(self, logger: logging.Logger, startparallelism: int, on_child_exit: Callable[[int, int, float], bool],
+                 status_path: str = None, status_slots: int = 65536, trace_size: int = 65536,
+                 restart_rate: float = 0, restart_burst: float = 1, journal_path: str = None):
+        self.logger = logger
+        self.scheduler = Scheduler(logger)
+        self.reaper = Reaper(on_child_exit, logger)
+        self.capture = OutputCapture(logger)
+        self.launcher = Launcher(startparallelism, logger)
+        self.status = StatusMap(status_path, status_slots, logger) if status_path else None
+        self.metrics = Metrics()
+        self.tracer = Tracer(trace_size)
+        self.restarts = TokenBucket(restart_rate, restart_burst)
+        self.journal = Journal(journal_path, status_slots, logger) if journal_path else None
+        self.listeners = Listeners(logger)
+        self.zygotes = Zygotes(logger)
+
+        self._pid_to_process = dict()
+        self._lock = threading.Lock()
+        self._locks = [threading.Lock() for _ in range(self.LOCK_STRIPES)]
+        self._inserted = 0
+        self._removed = 0
+        self._stale = 0
+
+    def start(self):
+        self.scheduler.start()
+        self.reaper.start()
+        self.capture.start()
+
+    def lock(self, name: str) -> threading.Lock:
+        return self._locks[hash(name) % self.LOCK_STRIPES]
+
+    def insert_process(self, pid: int, process, generation: int, spawned_at: float):
+        with self._lock:
+            self._pid_to_process[pid] = (process, generation, spawned_at)
+            self._inserted += 1
+
+    def get_process(self, pid: int):
+        with self._lock:
+            entry = self._pid_to_process.get(pid)
+
+        return entry[0] if entry is not None else None
+
+    def remove_process(self, pid: int, reaped_at: float) -> Tuple[Any, int]:
+        """
+        Claims the entry of a reaped pid, returns (process, generation) or None if the pid is unknown (yet)
+        An entry registered after the pid was reaped belongs to a new child which reused
+            the pid, it is left in place and (None, 0) is returned: the exit is stale
+        """
+        with self._lock:
+            entry = self._pid_to_process.get(pid)
+
+            if entry is None:
+                return None
+
+            if entry[2] > reaped_at:
+                self._stale += 1
+
+                return None, 0
+
+            del self._pid_to_process[pid]
+
+            self._removed += 1
+
+        return entry[0], entry[1]
 
-    @classmethod
-    def insert_process(cls, pid, process):
-        cls._pid_to_process[pid] = process
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._pid_to_process),
+                "inserted": self._inserted,
+                "removed": self._removed,
+                "stale": self._stale,
+            }
 
-    @classmethod
-    def get_process(cls, pid):
-        if pid in cls._pid_to_process.keys():
-            return cls._pid_to_process[pid]
-        return None
 
+def now() -> float:
+    """
+    Clock of spawned_at/reaped_at stamps
+    """
+    return time.monotonic()
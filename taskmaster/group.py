@@ -8,23 +8,108 @@ from typing import Dict, Any, Callable
 
 from .program import Program
 from .process import Process, ProcessState
+from .context import Context
 
 class Group:
     processes: Dict[str, Process]
     program: Program
     name: str
+    retired: bool # removed by a reload, its queued starts are dropped (see Launcher.cancel)
 
     _logger: logging.Logger
+    _context: Context
 
-    def __init__(self, name: str, config: Dict[str, Any], logger: logging.Logger):
+    def __init__(self, name: str, config: Dict[str, Any], context: Context):
         self.processes = dict()
         self.name = name
+        self.retired = False
 
         self.program = Program(config)
-        self._logger = logger
+        self._logger = context.logger
+        self._context = context
 
         for i in range(self.program.numprocs):
-            self.processes[f"{self.name}{i}"] = Process(f"{self.name}{i}", self.program, logger)
+            self.processes[f"{self.name}{i}"] = self._create_process(i)
+
+    def update(self, config: Dict[str, Any]):
+        """
+        Applies a config which differs only by hot fields and numprocs (see program.restart_fields)
+            Extra instances are stopped and dropped once they exited (also those already stopping),
+            missing ones are created (and launched on autostart)
+        """
+        numprocs = self.program.numprocs
+
+        self.program.update(config)
+
+        for process in self.processes.values():
+            process.reconfigure()
+
+        if self.program.numprocs > numprocs:
+            processes = dict(self.processes) # copy on write, readers iterate the dict without locks
+
+            for i in range(numprocs, self.program.numprocs):
+                processes[f"{self.name}{i}"] = self._create_process(i)
+
+            self.processes = processes
+
+            for i in range(numprocs, self.program.numprocs):
+                self.launch(f"{self.name}{i}") if self.program.autostart else None
+        elif self.program.numprocs < numprocs:
+            for i in range(self.program.numprocs, numprocs):
+                name = f"{self.name}{i}"
+
+                self.processes[name].retire()
+
+                if not self.stop(name, lambda process_name, pid: self._drop(process_name)):
+                    self._drop(name)
+
+    def _create_process(self, index: int) -> Process:
+        """
+        A child the previous daemon left running (see journal) is adopted rather than spawned again
+        With reuseport every instance gets its own listening sockets, otherwise they share the group's
+            Sockets which cannot be bound yet are bound again on spawn
+        """
+        process = Process(f"{self.name}{index}", self.program, self._context, self.name, self.relaunch,
+                          index if self.program.reuseport else -1)
+
+        try:
+            process.listen() # now, so that a group rebuilt by a reload takes over the sockets of the old one
+        except OSError as error:
+            self._logger.error(f"{error}, spawns of {process.name} fail until it can")
+        entry = self._context.journal.claim(self.name, process.name) if self._context.journal is not None else None
+
+        process.adopt(entry) if entry is not None else None
+
+        return process
+
+    def _drop(self, name: str):
+        processes = dict(self.processes)
+        process = processes.pop(name, None)
+
+        self.processes = processes
+
+        process.release() if process is not None else None
+
+    def retire(self):
+        """
+        Called before the processes of a group removed by a reload are stopped:
+            no start queued on the launcher or pending autorestart spawns them again
+        """
+        self.retired = True
+
+        for process in self.processes.values():
+            process.retire()
+
+        self._context.launcher.cancel(self)
+
+    def release(self):
+        """
+        Frees what processes of a retired group hold outside of it (status slots) and its zygote
+        """
+        for process in self.processes.values():
+            process.release()
+
+        self._context.zygotes.release(self.program)
 
     def start(self, name: str, on_spawn: Callable[[str, int], None] = None, on_fail: Callable[[str, int], None] = None) -> bool:
         if name in self.processes.keys():
@@ -38,18 +123,38 @@ class Group:
 
         return False
 
+    def launch(self, name: str, on_spawn: Callable[[str, int], None] = None, on_fail: Callable[[str, int], None] = None):
+        """
+        Queues start of the process on the launcher, on_fail is called if it cannot be started
+        """
+        self._context.tracer.record(self.name, name, 0, "queued")
+        self._context.launcher.submit(self, name, on_spawn, on_fail)
+
+    def relaunch(self, name: str):
+        """
+        Queues an automatic restart of the process (see Process._restart), so that restarts
+            are spawned by the launcher workers within startparallelism, not on the scheduler thread
+        """
+        self._context.tracer.record(self.name, name, 0, "queued")
+        self._context.launcher.submit(self, name, start=self._respawn)
+
+    def _respawn(self, name: str, on_spawn: Callable[[str, int], None] = None, on_fail: Callable[[str, int], None] = None) -> bool:
+        process = self.processes.get(name)
+
+        return process.respawn() if process is not None else False
+
     def stop(self, name: str, on_kill: Callable[[str, int], None] = None) -> bool:
         if name in self.processes.keys():
             return self.processes[name].kill(on_kill)
 
         return False
 
-    def restart(self, name: str, on_spawn: Callable[[int], None] = None, on_fail: Callable[[str, int], None] = None) -> bool:
+    def restart(self, name: str, on_spawn: Callable[[str, int], None] = None, on_fail: Callable[[str, int], None] = None) -> bool:
         def _on_kill(process_name: str, pid: int):
-            self.start(name, on_spawn, on_fail)
+            self.launch(name, on_spawn, on_fail)
 
         if not self.stop(name, _on_kill):
-            return self.start(name, on_spawn, on_fail)
+            self.launch(name, on_spawn, on_fail)
 
         return True
 
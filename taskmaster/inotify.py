@@ -0,0 +1,105 @@
+import os
+import struct
+import ctypes
+import ctypes.util
+
+from typing import List, Tuple
+
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_IGNORED = 0x00008000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+
+_EVENT = struct.Struct("iIII") # wd, mask, cookie, len
+
+_libc = None
+
+
+def _load():
+    global _libc
+
+    if _libc is None:
+        name = ctypes.util.find_library("c")
+
+        if name is None:
+            raise OSError("inotify: libc not found")
+
+        _libc = ctypes.CDLL(name, use_errno=True)
+
+        if not hasattr(_libc, "inotify_init1"):
+            raise OSError("inotify: not supported by libc")
+
+    return _libc
+
+
+def available() -> bool:
+    try:
+        _load()
+    except OSError:
+        return False
+
+    return True
+
+
+class Inotify:
+    """
+    Minimal ctypes binding, the fd is non-blocking and meant to be polled by the caller
+    """
+    fd: int
+
+    def __init__(self):
+        libc = _load()
+
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+    def add_watch(self, path: str, mask: int) -> int:
+        wd = _libc.inotify_add_watch(self.fd, os.fsencode(path), ctypes.c_uint32(mask))
+
+        if wd < 0:
+            errno = ctypes.get_errno()
+
+            raise OSError(errno, os.strerror(errno), path)
+
+        return wd
+
+    def rm_watch(self, wd: int):
+        _libc.inotify_rm_watch(self.fd, wd)
+
+    def read_events(self) -> List[Tuple[int, int, int, str]]:
+        """
+        Drains the queue, returns list of (wd, mask, cookie, name)
+        """
+        events = list()
+
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+
+            offset = 0
+
+            while offset + _EVENT.size <= len(data):
+                wd, mask, cookie, length = _EVENT.unpack_from(data, offset)
+                name = data[offset + _EVENT.size:offset + _EVENT.size + length].rstrip(b"\0")
+
+                events.append((wd, mask, cookie, os.fsdecode(name)))
+
+                offset += _EVENT.size + length
+
+        return events
+
+    def close(self):
+        os.close(self.fd)
@@ -0,0 +1,280 @@
+import os
+import mmap
+import time
+import heapq
+import struct
+import threading
+import logging
+
+from typing import List, Dict, Tuple
+
+
+# Layout of the journal, a file mapped by the daemon: header (HEADER_SIZE bytes)
+#   followed by `capacity` slots of SLOT_SIZE bytes. Unlike the status segment it is
+#   never read while the daemon runs, only by the next daemon (re-exec'd or restarted)
+#   on the same boot, so there is no seqlock: slots are plain stores into the mapping.
+#   The page cache keeps the content across a crash of the daemon, nothing is synced.
+#   Spawn times are CLOCK_BOOTTIME seconds, the clock of the starttime in /proc/<pid>/stat,
+#   which tells a live child from an unrelated process which got its pid
+
+MAGIC = b"TMJN"
+VERSION = 1
+
+HEADER = struct.Struct("<4sIIi36s") # magic, version, capacity, handover pid (0 - none), boot id
+HEADER_SIZE = 64
+HEADER_HANDOVER = 12
+
+SLOT = struct.Struct("<B3xiIddii48s56s120s120s") # state, pid, generation, spawned (boottime), started_at (time.time),
+                                                 # stdout fd, stderr fd (capture pipes kept across exec, -1 - none),
+                                                 # group, name, stdout logfile, stderr logfile
+SLOT_SIZE = SLOT.size
+STATE = struct.Struct("<B3xi")
+SPAWN = struct.Struct("<iId") # pid, generation, spawned
+SPAWN_OFFSET = 4
+STARTED = struct.Struct("<d")
+STARTED_OFFSET = 20
+FDS = struct.Struct("<ii")
+FDS_OFFSET = 28
+LOGFILES = struct.Struct("<120s120s")
+LOGFILES_OFFSET = 140
+
+# State byte of a slot, 0 marks a free slot
+STATES = ("stopped", "starting", "running", "backoff", "stopping", "exited", "fatal", "unknown")
+# States in which the process has a child which may still be alive
+LIVE_STATES = ("starting", "running", "stopping")
+
+
+class JournalEntry:
+    """
+    A process which had a child when the previous daemon last wrote the journal
+    """
+    __slots__ = ("group", "name", "state", "pid", "generation", "spawned", "started_at",
+                 "stdout_fd", "stderr_fd", "stdout_logfile", "stderr_logfile")
+
+    group: str
+    name: str
+    state: str
+    pid: int
+    generation: int
+    spawned: float
+    started_at: float
+    stdout_fd: int # inherited capture pipes, only set after a handover to this very process
+    stderr_fd: int
+    stdout_logfile: str
+    stderr_logfile: str
+
+
+class Journal:
+    """
+    Persistent state of every process, written on each transition, so that a new daemon
+        adopts the children still running instead of starting the whole fleet again
+    entries holds what the previous daemon left, processes claim theirs when they are created
+    """
+    path: str
+    capacity: int
+    entries: Dict[Tuple[str, str], JournalEntry]
+
+    _mmap: mmap.mmap
+    _free: List[int]
+    _count: int
+    _lock: threading.Lock
+    _logger: logging.Logger
+    _codes: dict
+
+    def __init__(self, path: str, capacity: int, logger: logging.Logger):
+        self.path = path
+        self.capacity = capacity
+
+        self._free = list()
+        self._count = 0
+        self._lock = threading.Lock()
+        self._logger = logger
+        self._codes = {state: code + 1 for code, state in enumerate(STATES)}
+
+        self.entries = self._load()
+
+        temporary = f"{path}.{os.getpid()}.tmp"
+        fd = os.open(temporary, os.O_RDWR | os.O_CREAT | os.O_TRUNC | os.O_CLOEXEC, 0o600)
+
+        try:
+            os.ftruncate(fd, HEADER_SIZE + capacity * SLOT_SIZE)
+
+            self._mmap = mmap.mmap(fd, HEADER_SIZE + capacity * SLOT_SIZE)
+        finally:
+            os.close(fd)
+
+        HEADER.pack_into(self._mmap, 0, MAGIC, VERSION, capacity, 0, _boot_id())
+
+        os.replace(temporary, path)
+
+    def claim(self, group: str, name: str) -> JournalEntry:
+        with self._lock:
+            return self.entries.pop((group, name), None)
+
+    def settle(self):
+        """
+        Called once the configuration is applied: children of processes which are no longer
+            configured are left alone (and reported), their inherited pipes are closed
+        """
+        with self._lock:
+            entries = list(self.entries.values())
+
+            self.entries.clear()
+
+        for entry in entries:
+            self._logger.warning(f"journal: {entry.group}:{entry.name} pid {entry.pid} is not in the configuration, left running unmanaged")
+
+            for fd in (entry.stdout_fd, entry.stderr_fd):
+                try:
+                    os.close(fd) if fd >= 0 else None
+                except OSError:
+                    pass
+
+    def allocate(self, group: str, name: str) -> int:
+        """
+        Reserves a slot for a process, returns -1 when the journal is full (the process is then not journaled)
+        """
+        with self._lock:
+            if len(self._free) > 0:
+                slot = heapq.heappop(self._free)
+            elif self._count < self.capacity:
+                slot = self._count
+                self._count += 1
+            else:
+                self._logger.warning(f"journal: {self.path} is full, {group}:{name} is not journaled")
+
+                return -1
+
+            SLOT.pack_into(self._mmap, HEADER_SIZE + slot * SLOT_SIZE, self._codes["stopped"], 0, 0, 0.0, 0.0, -1, -1,
+                           group.encode()[:48], name.encode()[:56], b"", b"")
+
+        return slot
+
+    def release(self, slot: int):
+        if slot < 0:
+            return
+
+        with self._lock:
+            SLOT.pack_into(self._mmap, HEADER_SIZE + slot * SLOT_SIZE, 0, 0, 0, 0.0, 0.0, -1, -1, b"", b"", b"", b"")
+
+            heapq.heappush(self._free, slot)
+
+    def spawned(self, slot: int, pid: int, generation: int, spawned: float, stdout_logfile: str, stderr_logfile: str):
+        """
+        spawned: start time of the child in CLOCK_BOOTTIME seconds (see probe)
+        """
+        if slot < 0:
+            return
+
+        offset = HEADER_SIZE + slot * SLOT_SIZE
+
+        SPAWN.pack_into(self._mmap, offset + SPAWN_OFFSET, pid, generation, spawned)
+        LOGFILES.pack_into(self._mmap, offset + LOGFILES_OFFSET, _path(stdout_logfile), _path(stderr_logfile))
+
+    def update(self, slot: int, state: str, pid: int, started_at: float):
+        if slot < 0:
+            return
+
+        offset = HEADER_SIZE + slot * SLOT_SIZE
+
+        STATE.pack_into(self._mmap, offset, self._codes.get(state, 0), pid)
+        STARTED.pack_into(self._mmap, offset + STARTED_OFFSET, started_at)
+
+    def handover(self, slot: int, stdout_fd: int, stderr_fd: int):
+        """
+        Records the capture pipes the next image of this process inherits
+        """
+        if slot >= 0:
+            FDS.pack_into(self._mmap, HEADER_SIZE + slot * SLOT_SIZE + FDS_OFFSET, stdout_fd, stderr_fd)
+
+    def seal(self):
+        """
+        Last write before exec: marks the recorded pipes as inherited by this pid
+        """
+        struct.pack_into("<i", self._mmap, HEADER_HANDOVER, os.getpid())
+
+    def close(self):
+        """
+        The file stays: children outlive the daemon and the next one adopts them
+        """
+        self._mmap.close()
+
+    def _load(self) -> Dict[Tuple[str, str], JournalEntry]:
+        entries = dict()
+
+        try:
+            with open(self.path, "rb") as file:
+                data = file.read()
+        except OSError:
+            return entries
+
+        if len(data) < HEADER_SIZE:
+            return entries
+
+        magic, version, capacity, handover, boot_id = HEADER.unpack_from(data, 0)
+
+        if magic != MAGIC or version != VERSION or boot_id != _boot_id():
+            self._logger.info(f"journal: {self.path} is from another boot or version, nothing to adopt")
+
+            return entries
+
+        inherited = handover == os.getpid() # re-exec keeps the pid, pipes recorded for it are still open
+
+        for slot in range(min(capacity, (len(data) - HEADER_SIZE) // SLOT_SIZE)):
+            state, pid, generation, spawned, started_at, stdout_fd, stderr_fd, group, name, stdout_logfile, stderr_logfile = \
+                SLOT.unpack_from(data, HEADER_SIZE + slot * SLOT_SIZE)
+
+            if state == 0:
+                continue
+
+            entry = JournalEntry()
+
+            entry.group = group.rstrip(b"\0").decode(errors="replace")
+            entry.name = name.rstrip(b"\0").decode(errors="replace")
+            entry.state = STATES[state - 1] if state <= len(STATES) else "unknown"
+            entry.pid = pid
+            entry.generation = generation
+            entry.spawned = spawned
+            entry.started_at = started_at
+            entry.stdout_fd = stdout_fd if inherited else -1
+            entry.stderr_fd = stderr_fd if inherited else -1
+            entry.stdout_logfile = stdout_logfile.rstrip(b"\0").decode(errors="replace") or None
+            entry.stderr_logfile = stderr_logfile.rstrip(b"\0").decode(errors="replace") or None
+
+            if entry.state in LIVE_STATES and pid > 0:
+                entries[(entry.group, entry.name)] = entry
+
+        return entries
+
+
+def boottime() -> float:
+    return time.clock_gettime(time.CLOCK_BOOTTIME)
+
+
+def probe(pid: int) -> Tuple[int, float]:
+    """
+    (parent pid, start time in CLOCK_BOOTTIME seconds) of a process, None if there is no such process
+    """
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as file:
+            data = file.read()
+    except OSError:
+        return None
+
+    fields = data[data.rfind(b")") + 2:].split() # comm may contain spaces and parentheses
+
+    return int(fields[1]), int(fields[19]) / os.sysconf("SC_CLK_TCK")
+
+
+def _path(path: str) -> bytes:
+    encoded = os.fsencode(path) if path is not None else b""
+
+    return encoded if len(encoded) <= 120 else b"" # too long to journal, the next daemon picks a new file
+
+
+def _boot_id() -> bytes:
+    try:
+        with open("/proc/sys/kernel/random/boot_id", "rb") as file:
+            return file.read().strip()[:36]
+    except OSError:
+        return b""
@@ -0,0 +1,192 @@
+import time
+import threading
+import logging
+import collections
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Deque, Any, Callable
+
+
+class LaunchProgress:
+    __slots__ = ("total", "spawned", "failed", "started_at")
+
+    total: int
+    spawned: int
+    failed: int
+    started_at: float
+
+    def __init__(self):
+        self.total = 0
+        self.spawned = 0
+        self.failed = 0
+        self.started_at = time.monotonic()
+
+
+class Launcher:
+    """
+    Start scheduler: spawn requests are queued per group and run by a pool of at most
+        `parallelism` workers, each group being also capped by its own startparallelism.
+        Groups with pending starts are served round-robin, so one huge group cannot starve others
+    Progress is tracked per launch wave (from the first queued start to the group going idle)
+    """
+    _parallelism: int
+    _executor: ThreadPoolExecutor
+    _queues: Dict[str, Deque[tuple]]
+    _ready: Deque[str]
+    _inflight: Dict[str, int]
+    _progress: Dict[str, LaunchProgress]
+    _running: int
+    _lock: threading.Lock
+    _logger: logging.Logger
+
+    def __init__(self, parallelism: int, logger: logging.Logger):
+        self._parallelism = max(parallelism, 1)
+        self._executor = ThreadPoolExecutor(max_workers=self._parallelism, thread_name_prefix="taskmaster-launcher")
+        self._queues = dict()
+        self._ready = collections.deque()
+        self._inflight = dict()
+        self._progress = dict()
+        self._running = 0
+        self._lock = threading.Lock()
+        self._logger = logger
+
+    def submit(self, group, name: str, on_spawn: Callable[[str, int], None] = None, on_fail: Callable[[str, int], None] = None,
+               start: Callable[[str, Callable, Callable], bool] = None):
+        """
+        start: run by a worker instead of group.start (automatic restarts, see Group.relaunch)
+        """
+        with self._lock:
+            if group.name not in self._queues.keys():
+                self._queues[group.name] = collections.deque()
+                self._inflight[group.name] = 0
+
+            if len(self._queues[group.name]) == 0:
+                self._ready.append(group.name)
+
+            if group.name not in self._progress.keys():
+                self._progress[group.name] = LaunchProgress()
+
+            self._queues[group.name].append((group, name, on_spawn, on_fail, start if start is not None else group.start))
+            self._progress[group.name].total += 1
+
+            self._dispatch()
+
+    def cancel(self, group):
+        """
+        Drops the starts of a retired group still queued, their on_fail is called
+            Starts already running are refused by the processes themselves (see Process.retire)
+        """
+        with self._lock:
+            queue = self._queues.get(group.name)
+
+            if queue is None:
+                return
+
+            cancelled = [job for job in queue if job[0] is group]
+
+            if len(cancelled) == 0:
+                return
+
+            queue = self._queues[group.name] = collections.deque(job for job in queue if job[0] is not group)
+
+            if len(queue) == 0:
+                self._ready.remove(group.name)
+
+            self._progress[group.name].failed += len(cancelled)
+
+            self._logger.info(f"launcher: group {group.name} retired, {len(cancelled)} queued starts dropped")
+
+            self._settle(group.name)
+
+        for _, name, _, on_fail, _ in cancelled:
+            on_fail(name, 0) if on_fail is not None else None
+
+    def progress(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {
+                group: {
+                    "total": progress.total,
+                    "spawned": progress.spawned,
+                    "failed": progress.failed,
+                    "queued": len(self._queues[group]),
+                    "inflight": self._inflight[group],
+                    "elapsed": time.monotonic() - progress.started_at,
+                } for group, progress in self._progress.items()
+            }
+
+    def _dispatch(self):
+        while self._running < self._parallelism:
+            job = self._next_job()
+
+            if job is None:
+                return
+
+            self._running += 1
+            self._inflight[job[0].name] += 1
+
+            self._executor.submit(self._run, *job)
+
+    def _next_job(self) -> tuple:
+        for _ in range(len(self._ready)):
+            name = self._ready[0]
+            queue = self._queues[name]
+            group = queue[0][0]
+            limit = group.program.startparallelism
+
+            if limit is not None and self._inflight[name] >= limit:
+                self._ready.rotate(-1)
+
+                continue
+
+            job = queue.popleft()
+
+            if len(queue) == 0:
+                self._ready.popleft()
+            else:
+                self._ready.rotate(-1)
+
+            return job
+
+        return None
+
+    def _run(self, group, name: str, on_spawn: Callable[[str, int], None], on_fail: Callable[[str, int], None],
+             start: Callable[[str, Callable, Callable], bool]):
+        try:
+            spawned = start(name, on_spawn, on_fail) if not group.retired else False
+        except Exception as error:
+            self._logger.critical(f"launcher: start of {group.name}:{name} failed: {error}")
+
+            spawned = False
+
+        if not spawned and on_fail is not None:
+            on_fail(name, 0)
+
+        with self._lock:
+            self._running -= 1
+            self._inflight[group.name] -= 1
+
+            progress = self._progress[group.name]
+
+            if spawned:
+                progress.spawned += 1
+            else:
+                progress.failed += 1
+
+            self._settle(group.name)
+
+            self._dispatch()
+
+    def _settle(self, name: str):
+        """
+        Ends the launch wave of a group gone idle and forgets it, so retired group names don't pile up
+        """
+        if len(self._queues[name]) > 0 or self._inflight[name] > 0:
+            return
+
+        progress = self._progress.pop(name)
+
+        self._logger.info(f"launched: group {name}, {progress.spawned}/{progress.total} spawned, "
+                          f"{progress.failed} not started, in {time.monotonic() - progress.started_at:.3f}s")
+
+        del self._queues[name]
+        del self._inflight[name]
@@ -0,0 +1,213 @@
+import os
+import json
+import stat
+import fcntl
+import socket
+import threading
+import logging
+
+from typing import List, Dict, Tuple
+
+
+# Listening sockets are moved to fds >= FD_FLOOR: spawn backends place them at 3, 4, ...
+#   in the child one after the other, a source fd in that range would be overwritten
+#   before its own turn
+FD_FLOOR = 256
+MAX_SOCKETS = 64
+HANDOVER_ENV = "TASKMASTER_LISTENERS"
+
+
+def parse_address(address: str) -> Tuple[int, object]:
+    """
+    (family, sockaddr) of "tcp://host:port" ("tcp://[::1]:port" for IPv6) or "unix:///absolute/path",
+        raises ValueError on anything else
+    """
+    if not isinstance(address, str):
+        raise ValueError(f"{address!r} is not a string")
+
+    if address.startswith("unix://"):
+        path = address[len("unix://"):]
+
+        if not path.startswith("/") or len(os.fsencode(path)) >= 108:
+            raise ValueError(f"{address}: unix socket path must be absolute and shorter than 108 bytes")
+
+        return socket.AF_UNIX, path
+
+    if address.startswith("tcp://"):
+        host, _, port = address[len("tcp://"):].rpartition(":")
+
+        if not port.isdigit() or not 0 < int(port) < 65536 or host == "":
+            raise ValueError(f"{address}: expected tcp://host:port")
+
+        if host.startswith("[") and host.endswith("]"):
+            return socket.AF_INET6, (host[1:-1], int(port))
+
+        return socket.AF_INET, (host, int(port))
+
+    raise ValueError(f"{address}: expected tcp://host:port or unix:///path")
+
+
+class Listeners:
+    """
+    Listening sockets bound by the daemon and inherited by the processes of a group
+        (see spawn, LISTEN_FDS), so a restarted instance picks up the connections queued
+        in the backlog meanwhile instead of them being refused
+    Sockets are keyed by (address, slot): slot is -1 for a socket shared by every instance,
+        the instance index with reuseport, where each instance gets its own socket bound
+        with SO_REUSEPORT and the kernel spreads connections across them
+    They are reference counted by the processes holding them, so a group rebuilt by a reload
+        gets the very same sockets back as long as the new one is created before the old
+        one is released
+    """
+    _sockets: Dict[Tuple[str, int], socket.socket]
+    _refs: Dict[Tuple[str, int], int]
+    _keys: Dict[int, Tuple[str, int]] # fd -> key
+    _lock: threading.Lock
+    _logger: logging.Logger
+
+    def __init__(self, logger: logging.Logger):
+        self._sockets = dict()
+        self._refs = dict()
+        self._keys = dict()
+        self._lock = threading.Lock()
+        self._logger = logger
+
+        self._inherit()
+
+    def acquire(self, addresses: List[str], slot: int, reuseport: bool) -> List[int]:
+        """
+        fds of the sockets for addresses, in order, binding the missing ones
+        Raises OSError if an address cannot be bound, the references taken so far are given back:
+            a partial list would shift the remaining sockets to the fds of others in the child
+        """
+        fds = list()
+
+        with self._lock:
+            for address in addresses:
+                key = (address, slot)
+
+                if key not in self._sockets:
+                    try:
+                        self._sockets[key] = self._bind(address, reuseport)
+                    except (OSError, ValueError) as error:
+                        self._release(fds)
+
+                        raise OSError(f"listeners: cannot listen on {address}: {error}") from error
+
+                    self._keys[self._sockets[key].fileno()] = key
+
+                self._refs[key] = self._refs.get(key, 0) + 1
+
+                fds.append(self._sockets[key].fileno())
+
+        return fds
+
+    def release(self, fds: List[int]):
+        with self._lock:
+            self._release(fds)
+
+    def settle(self):
+        """
+        Closes the inherited sockets (see handover) no configured program took back
+        """
+        with self._lock:
+            for key in [key for key, refs in self._refs.items() if refs <= 0]:
+                self._close(key)
+
+    def handover(self):
+        """
+        Keeps the sockets open across an exec of the daemon, the next image finds them in its environment
+        """
+        with self._lock:
+            for sock in self._sockets.values():
+                os.set_inheritable(sock.fileno(), True)
+
+            os.environ[HANDOVER_ENV] = json.dumps([[address, slot, sock.fileno()] for (address, slot), sock in self._sockets.items()])
+
+    def close(self):
+        with self._lock:
+            for key in list(self._sockets.keys()):
+                self._close(key)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "sockets": len(self._sockets),
+                "references": sum(self._refs.values()),
+            }
+
+    def _bind(self, address: str, reuseport: bool) -> socket.socket:
+        family, sockaddr = parse_address(address)
+        sock = socket.socket(family, socket.SOCK_STREAM)
+
+        try:
+            if family == socket.AF_UNIX:
+                _unlink_socket(sockaddr)
+            else:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+
+            if reuseport and family != socket.AF_UNIX: # EOPNOTSUPP, a unix path has one listener anyway
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+
+            sock.bind(sockaddr)
+            sock.listen(socket.SOMAXCONN)
+
+            fd = fcntl.fcntl(sock.fileno(), fcntl.F_DUPFD_CLOEXEC, FD_FLOOR)
+        finally:
+            sock.close()
+
+        return socket.socket(fileno=fd)
+
+    def _release(self, fds: List[int]):
+        for fd in fds:
+            key = self._keys.get(fd)
+
+            if key is None:
+                continue
+
+            self._refs[key] -= 1
+
+            if self._refs[key] <= 0:
+                self._close(key)
+
+    def _close(self, key: Tuple[str, int]):
+        sock = self._sockets.pop(key)
+
+        self._refs.pop(key, None)
+        self._keys.pop(sock.fileno(), None)
+
+        if sock.family == socket.AF_UNIX and key[0] not in {address for address, _ in self._sockets.keys()}:
+            _unlink_socket(sock.getsockname())
+
+        sock.close()
+
+    def _inherit(self):
+        inherited = os.environ.pop(HANDOVER_ENV, None)
+
+        if inherited is None:
+            return
+
+        for address, slot, fd in json.loads(inherited):
+            try:
+                sock = socket.socket(fileno=fd)
+            except OSError as error:
+                self._logger.warning(f"listeners: inherited socket {address} is gone: {error}")
+
+                continue
+
+            os.set_inheritable(fd, False)
+
+            self._sockets[(address, slot)] = sock
+            self._refs[(address, slot)] = 0
+            self._keys[fd] = (address, slot)
+
+
+def _unlink_socket(path: str):
+    """
+    Removes a stale socket file left by a previous daemon, never a regular file
+    """
+    try:
+        if stat.S_ISSOCK(os.lstat(path).st_mode):
+            os.unlink(path)
+    except OSError:
+        pass
@@ -0,0 +1,342 @@
+import os
+import select
+import threading
+import logging
+import collections
+
+from typing import Dict, Set, Deque, Callable, Tuple
+
+from . import inotify
+
+
+class Subscription:
+    """
+    Bounded mailbox of one attached client
+    The hub pushes bytes from its thread, the client takes them whenever it is ready.
+        When the client is too slow and more than `limit` bytes are queued,
+        the oldest chunks are dropped and accounted in `dropped`
+    """
+    __slots__ = ("path", "limit", "source", "_chunks", "_size", "_dropped", "_wakeup", "_lock")
+
+    path: str
+    limit: int
+    source: object # hub owning the subscription, used to release it
+    _chunks: Deque[bytes]
+    _size: int
+    _dropped: int
+    _wakeup: Callable[[], None]
+    _lock: threading.Lock
+
+    def __init__(self, path: str, wakeup: Callable[[], None], limit: int, source: object):
+        self.path = path
+        self.limit = limit
+        self.source = source
+        self._chunks = collections.deque()
+        self._size = 0
+        self._dropped = 0
+        self._wakeup = wakeup
+        self._lock = threading.Lock()
+
+    def push(self, data: bytes):
+        with self._lock:
+            self._chunks.append(data)
+            self._size += len(data)
+
+            while self._size > self.limit and len(self._chunks) > 1:
+                dropped = self._chunks.popleft()
+
+                self._size -= len(dropped)
+                self._dropped += len(dropped)
+
+        self._wakeup()
+
+    def take(self) -> Tuple[bytes, int]:
+        """
+        Returns everything queued so far and the number of bytes dropped since the last take
+        """
+        with self._lock:
+            data = b"".join(self._chunks)
+            dropped = self._dropped
+
+            self._chunks.clear()
+            self._size = 0
+            self._dropped = 0
+
+        return data, dropped
+
+
+class LogFollower:
+    """
+    Keeps one log file open and reads whatever was appended since the last read
+    Handles truncation (copytruncate) and replacement of the file (rename + create)
+    """
+    path: str
+    subscribers: Set[Subscription]
+    wd: int
+
+    _file: object
+    _inode: int
+
+    CHUNK = 64 * 1024
+
+    def __init__(self, path: str):
+        self.path = path
+        self.subscribers = set()
+        self.wd = -1
+
+        self._file = None
+        self._inode = 0
+
+    def open(self, backlog: int) -> bytes:
+        """
+        (Re)opens the file and returns up to `backlog` trailing bytes of it
+        """
+        self.close()
+
+        try:
+            self._file = open(self.path, "rb", buffering=0)
+        except OSError:
+            return b""
+
+        stat = os.fstat(self._file.fileno())
+
+        self._inode = stat.st_ino
+        self._file.seek(max(stat.st_size - backlog, 0))
+
+        return self.read()
+
+    def read(self) -> bytes:
+        if self._file is None:
+            return b""
+
+        if os.fstat(self._file.fileno()).st_size < self._file.tell():
+            self._file.seek(0) # truncated
+
+        chunks = list()
+
+        while True:
+            chunk = self._file.read(self.CHUNK)
+
+            if not chunk:
+                break
+
+            chunks.append(chunk)
+
+        return b"".join(chunks)
+
+    def replaced(self) -> bool:
+        try:
+            return os.stat(self.path).st_ino != self._inode
+        except OSError:
+            return False
+
+    @property
+    def opened(self) -> bool:
+        return self._file is not None
+
+    def close(self):
+        self._file.close() if self._file is not None else None
+        self._file = None
+
+
+class LogHub:
+    """
+    Fans out appended log bytes to every attached client
+    One follower (and one open file) per log path, shared by all its subscribers.
+        A single thread waits on inotify, files which cannot be watched
+        (no inotify, missing file...) are polled every POLL_INTERVAL seconds instead
+    """
+    _followers: Dict[str, LogFollower]
+    _watches: Dict[int, LogFollower]
+    _inotify: inotify.Inotify
+    _logger: logging.Logger
+    _lock: threading.Lock
+    _thread: threading.Thread
+    _wakeup_r: int
+    _wakeup_w: int
+    _running: bool
+
+    POLL_INTERVAL = 0.25
+    BACKLOG = 64 * 1024 # bytes of existing log sent to a new subscriber
+    LIMIT = 1024 * 1024 # max bytes queued per subscriber
+
+    WATCH_MASK = inotify.IN_MODIFY | inotify.IN_ATTRIB | inotify.IN_MOVE_SELF | inotify.IN_DELETE_SELF
+
+    def __init__(self, logger: logging.Logger):
+        self._followers = dict()
+        self._watches = dict()
+        self._logger = logger
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._loop, name="taskmaster-logtail", daemon=True)
+        self._wakeup_r, self._wakeup_w = os.pipe2(os.O_NONBLOCK | os.O_CLOEXEC)
+        self._running = False
+
+        try:
+            self._inotify = inotify.Inotify()
+        except OSError as error:
+            self._logger.warning(f"logtail: inotify unavailable ({error}), falling back to polling")
+
+            self._inotify = None
+
+    def start(self):
+        self._running = True
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._notify()
+
+    def subscribe(self, path: str, wakeup: Callable[[], None], limit: int = None) -> Subscription:
+        subscription = Subscription(path, wakeup, limit if limit is not None else self.LIMIT, self)
+
+        with self._lock:
+            follower = self._followers.get(path)
+
+            if follower is None:
+                follower = LogFollower(path)
+
+                self._followers[path] = follower
+
+                self._open(follower, backlog=self.BACKLOG, initial=subscription)
+            else:
+                self._fan_out(follower, follower.read()) # existing subscribers get pending bytes before the newcomer joins
+
+                backlog = self._tail(path)
+
+                subscription.push(backlog) if len(backlog) > 0 else None
+
+            follower.subscribers.add(subscription)
+
+        self._notify()
+
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            follower = self._followers.get(subscription.path)
+
+            if follower is None:
+                return
+
+            follower.subscribers.discard(subscription)
+
+            if len(follower.subscribers) == 0:
+                self._unwatch(follower)
+                follower.close()
+
+                del self._followers[follower.path]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "files": len(self._followers),
+                "watched": len(self._watches),
+                "subscribers": sum(len(follower.subscribers) for follower in self._followers.values()),
+            }
+
+    def _open(self, follower: LogFollower, backlog: int, initial: Subscription = None):
+        self._unwatch(follower)
+
+        data = follower.open(backlog)
+
+        if follower.opened and self._inotify is not None:
+            try:
+                follower.wd = self._inotify.add_watch(follower.path, self.WATCH_MASK)
+
+                self._watches[follower.wd] = follower
+            except OSError:
+                follower.wd = -1
+
+        if len(data) > 0:
+            for subscription in ([initial] if initial is not None else follower.subscribers):
+                subscription.push(data)
+
+    def _unwatch(self, follower: LogFollower):
+        if follower.wd >= 0:
+            self._watches.pop(follower.wd, None)
+            self._inotify.rm_watch(follower.wd)
+
+            follower.wd = -1
+
+    def _tail(self, path: str) -> bytes:
+        try:
+            with open(path, "rb") as file:
+                file.seek(max(os.fstat(file.fileno()).st_size - self.BACKLOG, 0))
+
+                return file.read()
+        except OSError:
+            return b""
+
+    def _notify(self):
+        try:
+            os.write(self._wakeup_w, b"\0")
+        except (BlockingIOError, OSError):
+            pass
+
+    def _loop(self):
+        poller = select.poll()
+
+        poller.register(self._wakeup_r, select.POLLIN)
+        poller.register(self._inotify.fd, select.POLLIN) if self._inotify is not None else None
+
+        while self._running:
+            with self._lock:
+                polled = any(follower.wd < 0 for follower in self._followers.values())
+
+            try:
+                events = poller.poll(self.POLL_INTERVAL * 1000 if polled else None)
+            except InterruptedError:
+                continue
+
+            changed = set()
+
+            for fd, _ in events:
+                if fd == self._wakeup_r:
+                    try:
+                        while os.read(self._wakeup_r, 4096):
+                            pass
+                    except (BlockingIOError, OSError):
+                        pass
+                else:
+                    for wd, mask, _, _ in self._inotify.read_events():
+                        changed.add((wd, mask))
+
+            with self._lock:
+                self._dispatch(changed, polled)
+
+    def _dispatch(self, changed, polled: bool):
+        reopen = set()
+        modified = set()
+
+        for wd, mask in changed:
+            follower = self._watches.get(wd)
+
+            if follower is None:
+                continue
+
+            modified.add(follower)
+
+            if mask & (inotify.IN_MOVE_SELF | inotify.IN_DELETE_SELF | inotify.IN_IGNORED):
+                reopen.add(follower)
+
+        if polled:
+            for follower in self._followers.values():
+                if follower.wd < 0:
+                    modified.add(follower)
+
+                    if not follower.opened or follower.replaced():
+                        reopen.add(follower)
+
+        for follower in modified:
+            self._fan_out(follower, follower.read())
+
+        for follower in reopen:
+            if follower.path in self._followers.keys():
+                self._open(follower, backlog=self.LIMIT) # a replacing file is followed from its beginning
+
+    def _fan_out(self, follower: LogFollower, data: bytes):
+        if len(data) == 0:
+            return
+
+        for subscription in follower.subscribers:
+            subscription.push(data)
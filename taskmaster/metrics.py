@@ -0,0 +1,229 @@
+import bisect
+import threading
+
+from typing import List, Dict, Tuple, Callable
+
+
+# Lock-free metrics: every thread updates its own cell (created once per thread and metric),
+# cells are only summed when the metrics are rendered. Updates are a thread-local lookup
+# and an addition, no lock is taken on the spawn/reap paths.
+
+START_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 2, 5, 10, 30, 60)
+STOP_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 2, 5, 10, 30, 60)
+COMMAND_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30)
+
+
+class _Cells:
+    """
+    Per-thread storage of one metric (or one label set of it)
+    """
+    __slots__ = ("_local", "_cells", "_size")
+
+    def __init__(self, size: int):
+        self._local = threading.local()
+        self._cells = list()
+        self._size = size
+
+    def cell(self) -> List[float]:
+        try:
+            return self._local.cell
+        except AttributeError:
+            cell = [0] * self._size
+
+            self._local.cell = cell
+            self._cells.append(cell) # atomic, a scrape sees the cell or not yet
+
+            return cell
+
+    def total(self) -> List[float]:
+        total = [0] * self._size
+
+        for cell in list(self._cells):
+            for i in range(self._size):
+                total[i] += cell[i]
+
+        return total
+
+
+class Counter:
+    __slots__ = ("_cells",)
+
+    def __init__(self):
+        self._cells = _Cells(1)
+
+    def inc(self, amount: float = 1):
+        self._cells.cell()[0] += amount
+
+    def value(self) -> float:
+        return self._cells.total()[0]
+
+
+class Histogram:
+    """
+    Pre-bucketed: an observation is one bisect over the bounds and three additions
+    """
+    __slots__ = ("bounds", "_cells")
+
+    bounds: Tuple[float, ...]
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self._cells = _Cells(len(bounds) + 3) # bucket counts (last one is +Inf), sum, count
+
+    def observe(self, value: float):
+        cell = self._cells.cell()
+
+        cell[bisect.bisect_left(self.bounds, value)] += 1
+        cell[-2] += value
+        cell[-1] += 1
+
+    def value(self) -> List[float]:
+        return self._cells.total()
+
+
+class Family:
+    """
+    Metric with labels, children are created on first use of a label set
+    """
+    name: str
+    help: str
+    kind: str
+    labelnames: Tuple[str, ...]
+
+    _factory: Callable
+    _children: Dict[tuple, object]
+    _lock: threading.Lock
+
+    def __init__(self, name: str, help: str, kind: str, labelnames: Tuple[str, ...], factory: Callable):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.labelnames = labelnames
+
+        self._factory = factory
+        self._children = dict()
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        child = self._children.get(values)
+
+        if child is None:
+            with self._lock: # only taken the first time a label set is seen
+                child = self._children.setdefault(values, self._factory())
+
+        return child
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+        for values, child in list(self._children.items()):
+            labels = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, values))
+
+            if self.kind == "counter":
+                lines.append(f"{self.name}{{{labels}}} {_number(child.value())}")
+
+                continue
+
+            total = child.value()
+            cumulative = 0
+            separator = "," if len(labels) > 0 else ""
+
+            for bound, count in zip(child.bounds + (float("inf"),), total):
+                cumulative += count
+
+                lines.append(f'{self.name}_bucket{{{labels}{separator}le="{_number(bound)}"}} {_number(cumulative)}')
+
+            lines.append(f"{self.name}_sum{{{labels}}} {_number(total[-2])}")
+            lines.append(f"{self.name}_count{{{labels}}} {_number(total[-1])}")
+
+        return lines
+
+
+class Gauge:
+    """
+    Sampled when rendered, callback returns the value
+    """
+    name: str
+    help: str
+
+    _callback: Callable[[], float]
+
+    def __init__(self, name: str, help: str, callback: Callable[[], float]):
+        self.name = name
+        self.help = help
+
+        self._callback = callback
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {_number(self._callback())}"]
+
+
+class Metrics:
+    """
+    Supervisor metrics, rendered in the Prometheus text format (version 0.0.4)
+    """
+    spawns: Family
+    spawn_failures: Family
+    exits: Family
+    backoffs: Family
+    fatals: Family
+    restarts: Family
+    restarts_deferred: Family
+    start_seconds: Family
+    stop_seconds: Family
+    stop_kills: Family
+    command_seconds: Family
+
+    _gauges: List[Gauge]
+
+    def __init__(self):
+        self.spawns = _counter("taskmaster_spawns_total", "Processes spawned", ("group",))
+        self.spawn_failures = _counter("taskmaster_spawn_failures_total", "Spawns which failed before the program ran", ("group",))
+        self.exits = _counter("taskmaster_exits_total", "Process exits by exit code", ("group", "code"))
+        self.backoffs = _counter("taskmaster_backoff_total", "Processes which died before startsecs", ("group",))
+        self.fatals = _counter("taskmaster_fatal_total", "Processes given up after startretries", ("group",))
+        self.restarts = _counter("taskmaster_restarts_total", "Automatic restarts (backoff retries and autorestart)", ("group",))
+        self.restarts_deferred = _counter("taskmaster_restarts_deferred_total", "Automatic restarts delayed by the global restart rate limit", ("group",))
+        self.start_seconds = _histogram("taskmaster_start_seconds", "Time from spawn to RUNNING", ("group",), START_BUCKETS)
+        self.stop_seconds = _histogram("taskmaster_stop_seconds", "Time from stop request to exit", ("group",), STOP_BUCKETS)
+        self.stop_kills = _counter("taskmaster_stop_sigkill_total", "Stops escalated to SIGKILL after stopwaitsecs", ("group",))
+        self.command_seconds = _histogram("taskmaster_command_seconds", "Control command latency", ("command",), COMMAND_BUCKETS)
+
+        self._gauges = list()
+
+    def gauge(self, name: str, help: str, callback: Callable[[], float]):
+        self._gauges.append(Gauge(name, help, callback))
+
+    def render(self) -> str:
+        lines = list()
+
+        for family in (self.spawns, self.spawn_failures, self.exits, self.backoffs, self.fatals, self.restarts, self.restarts_deferred,
+                       self.start_seconds, self.stop_seconds, self.stop_kills, self.command_seconds):
+            lines.extend(family.render())
+
+        for gauge in self._gauges:
+            lines.extend(gauge.render())
+
+        return "\n".join(lines) + "\n"
+
+
+def _counter(name: str, help: str, labelnames: Tuple[str, ...]) -> Family:
+    return Family(name, help, "counter", labelnames, Counter)
+
+
+def _histogram(name: str, help: str, labelnames: Tuple[str, ...], bounds: Tuple[float, ...]) -> Family:
+    return Family(name, help, "histogram", labelnames, lambda: Histogram(bounds))
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+
+    return str(value)
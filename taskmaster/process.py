@@ -10,7 +10,10 @@ import time
 from typing import List, Dict, Any, Callable
 
 from .program import Program, Autorestart
-from .context import Context
+from .context import Context, now
+from .scheduler import TimerHandle
+from .spawn import BACKENDS
+from .journal import JournalEntry, boottime, probe
 
 
 class ProcessState(enum.Enum):
@@ -27,21 +30,49 @@ class ProcessState(enum.Enum):
 class Process:
     """
     Represents actual process and provides interface to spawn/kill the process
+    Slotted: tens of thousands of instances are kept alive for the whole daemon lifetime
     """
-    _start_timer: threading.Timer
-    _stop_timer: threading.Timer
+    __slots__ = ("_start_timer", "_stop_timer", "_timestamp", "_on_spawn", "_restarts", "_on_fail", "_on_kill",
+                 "_program", "_logger", "_state", "_context", "_generation",
+                 "_stdout_logfile", "_stderr_logfile", "_lock", "_name", "_pid", "_slot",
+                 "_group", "_spawned_at", "_stopping_at", "_crashes", "_record", "_fds", "_sockets_slot", "_retired",
+                 "_relaunch", "_queued", "_spawning", "_kill_pending")
+
+    _start_timer: TimerHandle
+    _stop_timer: TimerHandle
     _timestamp: int
     _on_spawn: Callable
     _restarts: int
+    _on_fail: Callable
     _on_kill: Callable
     _program: Program
     _logger: logging.Logger
     _state: ProcessState
+    _context: Context
+    _generation: int
+    _stdout_logfile: str
+    _stderr_logfile: str
     _lock: threading.Lock
     _name: str
     _pid: int
-
-    def __init__(self, name: str, program: Program, logger: logging.Logger):
+    _slot: int # of the status segment, -1 - not published
+    _group: str
+    _spawned_at: float # monotonic, for metrics
+    _stopping_at: float
+    _crashes: int # consecutive autorestarts of a process which didn't stay up backoffmaxsecs
+    _record: int # slot of the journal, -1 - not journaled
+    _fds: List[int] # listening sockets passed to the child (see listeners), held until release, None - not bound yet
+    _sockets_slot: int # of the listening sockets: -1 - shared by the group, the instance index with reuseport
+    _retired: bool # removed from its group, never spawned again
+    _relaunch: Callable[[str], None] # queues an automatic restart on the launcher (see Group.relaunch)
+    _queued: bool # an automatic restart is queued on the launcher
+    _spawning: bool # the backend is running without the lock (see _spawn)
+    _kill_pending: bool # a kill came while spawning, the child is stopped once its pid is known
+
+    ADOPT_TOLERANCE = 1.0 # seconds between the journaled spawn and the start time of the pid in /proc
+
+    def __init__(self, name: str, program: Program, context: Context, group: str, relaunch: Callable[[str], None],
+                 sockets_slot: int = -1):
         self._name = name
 
         self._start_timer = None
@@ -52,10 +83,27 @@ class Process:
         self._on_fail = None
         self._on_kill = None
         self._program = program
-        self._logger = logger
+        self._logger = context.logger
         self._state = ProcessState.stopped
-        self._lock = threading.Lock()
+        self._context = context
+        self._generation = 0
+        self._stdout_logfile = None
+        self._stderr_logfile = None
+        self._lock = context.lock(name)
         self._pid = 0
+        self._slot = context.status.allocate(group, name) if context.status is not None else -1
+        self._group = group
+        self._spawned_at = 0.0
+        self._stopping_at = 0.0
+        self._crashes = 0
+        self._record = context.journal.allocate(group, name) if context.journal is not None else -1
+        self._fds = None if len(program.sockets) > 0 else []
+        self._sockets_slot = sockets_slot
+        self._retired = False
+        self._relaunch = relaunch
+        self._queued = False
+        self._spawning = False
+        self._kill_pending = False
 
     def spawn(self, on_spawn: Callable[[str, int], None] = None, on_fail: Callable[[str, int], None] = None) -> bool:
         """
@@ -63,125 +111,371 @@ class Process:
             so be careful with it and make sure to check the state before spawning
         You MUST check for process state before spawning, make sure that the process is in
             stopped, exited or fatal state, otherwise you're violating the design
+        The state and the pid of the new child are published together under the process lock,
+            the backend itself runs without it (see _spawn)
+        A retired process is not spawned, see retire
+        """
+        with self._lock:
+            if self._retired:
+                self._trace("spawn_refused", "retired")
+
+                return False
+
+            return self._spawn(on_spawn, on_fail)
+
+    def retire(self):
+        """
+        The process is leaving its group (reload): a start still queued on the launcher
+            or a pending autorestart must not spawn a child nobody would stop
+        Set under the lock, so a spawn either completes before (and the stop which follows
+            sees its pid) or is refused
+        """
+        with self._lock:
+            self._retired = True
+
+    def _spawn(self, on_spawn: Callable[[str, int], None] = None, on_fail: Callable[[str, int], None] = None) -> bool:
+        """
+        Called with the lock held, which is released around the backend call: a zygote may have
+            to start and preload (seconds) or serve other spawns first, and the lock is shared
+            by every process of the stripe, the reaper and timers included
+        Meanwhile other spawns are refused and kills are deferred until the pid is known
         """
-        self._start_timer = threading.Timer(self._program.startsecs, self._start_handler)
+        if self._spawning:
+            return False
+
+        self._trace("spawn")
+
+        self._start_timer.cancel() if self._start_timer is not None else None # a pending restart, if started by hand
+
+        self._start_timer = None
+        self._queued = False # a queued restart, if started by hand
         self._on_spawn = on_spawn if on_spawn is not None else self._on_spawn
         self._on_fail = on_fail if on_fail is not None else self._on_fail
-        self._state = ProcessState.starting if self._program.startsecs > 0 else ProcessState.running
+
+        self._stdout_logfile = self._resolve_logfile(self._program.stdout_logfile, ".stdout") if self._stdout_logfile is None else self._stdout_logfile
+        self._stderr_logfile = self._resolve_logfile(self._program.stderr_logfile, ".stderr") if self._stderr_logfile is None else self._stderr_logfile
+
+        stdout_pipe, stderr_pipe = self._open_capture() if self._program.capture else (-1, -1)
+
+        self._trace("logfiles")
+
+        self._generation += 1
+
+        spawned_at = now() # taken before the child exists, so its exit can never look older than the spawn
+
+        spawn = self._context.zygotes.spawn if self._program.spawn == "zygote" else BACKENDS[self._program.spawn]
+        error = None
+
+        self._spawning = True
+        self._lock.release()
 
         try:
-            self._pid = os.fork()
-        except Exception as error:
-            self._logger.critical(f"process {self._name} cannot be spawned due to an error: ", error)
+            pid = spawn(self._program,
+                        stdout_pipe if self._program.capture else self._stdout_logfile,
+                        stderr_pipe if self._program.capture else self._stderr_logfile,
+                        self.listen())
+        except Exception as exception:
+            error = exception
+        finally:
+            self._lock.acquire()
+
+            self._spawning = False
+
+        if error is not None:
+            self._logger.critical(f"fatal: process {self._name} cannot be spawned due to an error: {error}")
+
+            self._trace("spawn_failed", str(error))
+
+            self._close_capture(stdout_pipe, stderr_pipe)
+
+            self._state = ProcessState.fatal
+            self._pid = 0
+
+            self._context.metrics.spawn_failures.labels(self._group).inc()
+
+            self._publish()
+            self._notify(self._on_fail, 0)
+
+            if self._kill_pending:
+                self._kill_pending = False
+
+                self._notify(self._on_kill, 0)
 
             return False
 
-        if self._pid == 0:
-            self._redirect_fd_into_logfile(sys.stdout.fileno(), self._program.stdout_logfile, ".stdout")
-            self._redirect_fd_into_logfile(sys.stderr.fileno(), self._program.stderr_logfile, ".stderr")
+        self._close_capture(stdout_pipe, stderr_pipe)
 
-            try:
-                os.chdir(self._program.directory)
-            except Exception:
-                pass
+        self._pid = pid
+        self._state = ProcessState.starting if self._program.startsecs > 0 else ProcessState.running
+
+        self._trace("exec")
+
+        self._logger.info(f"spawned: {self._name} with pid {self._pid}")
 
-            try:
-                os.umask(self._program.umask)
-            except Exception:
-                pass
+        self._spawned_at = spawned_at
 
-            signal.signal(self._program.stopsignal, lambda s, f: sys.exit(process.normal_exit_codes[0]))
+        probed = probe(self._pid) # the real start time: a zygote may take seconds to start and answer
 
-            os.execvpe(self._program.command[0], self._program.command, self._program.environment)
+        self._context.journal.spawned(self._record, self._pid, self._generation, probed[1] if probed is not None else boottime(),
+                                      self._stdout_logfile, self._stderr_logfile) if self._record >= 0 else None
+
+        self._context.metrics.spawns.labels(self._group).inc()
+
+        if self._program.startsecs > 0:
+            self._start_timer = self._context.scheduler.call_later(self._program.startsecs, self._start_handler)
         else:
-            self._logger.info(f"spawned: {self._name} with pid {self._pid}")
+            self._timestamp = time.time()
+
+            self._context.metrics.start_seconds.labels(self._group).observe(now() - spawned_at)
+
+            self._trace("running")
+            self._notify(self._on_spawn, self._pid)
+
+        self._publish()
+
+        self._context.insert_process(self._pid, self, self._generation, spawned_at)
+
+        self._context.reaper.watch(self._pid)
+
+        self._trace("registered")
 
-            self._start_timer.start() if self._program.startsecs > 0 else None
+        if self._kill_pending:
+            self._kill_pending = False
 
-            Context.insert_process(self._pid, self)
+            self._stop()
 
         return True
 
+    def listen(self) -> List[int]:
+        """
+        fds of the listening sockets of the process, bound on first use: raises OSError (see Listeners.acquire)
+            while an address cannot be bound, the spawn then fails instead of shifting the other sockets
+        """
+        if self._fds is None:
+            self._fds = self._context.listeners.acquire(self._program.sockets, self._sockets_slot, self._program.reuseport)
+
+        return self._fds
+
+    def adopt(self, entry: JournalEntry) -> bool:
+        """
+        Takes over the child a previous daemon left running instead of spawning a new one
+            A re-exec'd daemon is still its parent and reaps it, otherwise its exit is followed
+            through a pidfd (see Reaper.follow). Returns False if the child is gone
+            or its pid now belongs to another process
+        A live child of this daemon is taken over even if its start time doesn't match:
+            only the previous image could have spawned it, starting another copy would run it twice
+        """
+        probed = probe(entry.pid)
+        ours = probed is not None and probed[0] == os.getpid()
+
+        if probed is None or (not ours and (abs(probed[1] - entry.spawned) > self.ADOPT_TOLERANCE or
+                                            not self._context.reaper.follow(entry.pid))):
+            self._logger.info(f"adopt: process {self._name} pid {entry.pid} is gone, not adopted")
+
+            self._close_capture(entry.stdout_fd, entry.stderr_fd)
+
+            return False
+
+        if ours and abs(probed[1] - entry.spawned) > self.ADOPT_TOLERANCE:
+            self._logger.warning(f"adopt: process {self._name} pid {entry.pid} started {probed[1] - entry.spawned:.3f}s "
+                                 f"after its journaled spawn, still a child of this daemon, adopted")
+
+        with self._lock:
+            self._state = ProcessState[entry.state]
+            self._pid = entry.pid
+            self._generation = entry.generation
+            self._timestamp = entry.started_at
+            self._stdout_logfile = entry.stdout_logfile
+            self._stderr_logfile = entry.stderr_logfile
+            self._spawned_at = now() - max(boottime() - entry.spawned, 0)
+
+            if self._state == ProcessState.starting:
+                self._start_timer = self._context.scheduler.call_later(max(self._program.startsecs - (now() - self._spawned_at), 0), self._start_handler)
+            elif self._state == ProcessState.stopping:
+                self._stopping_at = now()
+                self._stop_timer = self._context.scheduler.call_later(self._program.stopwaitsecs, self._stop_handler)
+
+            if self._program.capture and entry.stdout_fd >= 0 and entry.stderr_fd >= 0:
+                self._context.capture.adopt(self.capture_key("stdout"), entry.stdout_fd, self._stdout_logfile, self._program.maxbytes, self._program.backups, self)
+                self._context.capture.adopt(self.capture_key("stderr"), entry.stderr_fd, self._stderr_logfile, self._program.maxbytes, self._program.backups, self)
+            else:
+                self._close_capture(entry.stdout_fd, entry.stderr_fd)
+
+            self._context.journal.spawned(self._record, self._pid, self._generation, entry.spawned,
+                                          self._stdout_logfile, self._stderr_logfile) if self._record >= 0 else None
+
+            self._context.insert_process(self._pid, self, self._generation, self._spawned_at)
+
+            self._context.reaper.watch(self._pid) if probed[0] == os.getpid() else None
+
+            self._logger.info(f"adopted: {self._name} with pid {self._pid} ({self._state.name})")
+
+            self._trace("adopted", "child" if probed[0] == os.getpid() else "pidfd")
+            self._publish()
+
+        return True
+
+    def handover(self):
+        """
+        Before the daemon re-executes: records the capture pipes of a live child, which the next image adopts
+        """
+        with self._lock:
+            if self._record >= 0 and self._program.capture and self._pid > 0 and \
+                    self._state in (ProcessState.starting, ProcessState.running, ProcessState.stopping):
+                self._context.journal.handover(self._record, self._context.capture.handover(self.capture_key("stdout")),
+                                               self._context.capture.handover(self.capture_key("stderr")))
+
     def on_sigchld(self, exit_code: int):
         """
         Designed for external call from supervisor.
+        Called from the reaper thread, exits of all processes are delivered one by one in reap order
         """
         with self._lock:
+            self._context.metrics.exits.labels(self._group, exit_code).inc()
+
+            self._trace("exit", exit_code)
+
             if self._state == ProcessState.starting:
                 self._logger.warning(f"backoff: process {self._name} died before (startsecs) with exit_code: {exit_code}")
 
                 self._state = ProcessState.backoff
 
+                self._context.metrics.backoffs.labels(self._group).inc()
+
+                self._trace("backoff")
+
+                self._publish()
+
                 self._start_timer.cancel() if self._start_timer is not None else None
 
                 if self._restarts < self._program.startretries:
                     self._restarts += 1
 
-                    threading.Timer(self._restarts, self.spawn).start()
+                    self._start_timer = self._context.scheduler.call_later(self._program.backoff(self._restarts), self._restart)
                 else:
                     self._logger.error(f"fatal: process {self._name} failed to start, last exit_code: {exit_code}")
 
                     self._state = ProcessState.fatal
                     self._restarts = 0
 
-                    threading.Thread(target=self._on_fail, args=[self._name, self._pid]).start() if self._on_fail is not None else None
+                    self._context.metrics.fatals.labels(self._group).inc()
+
+                    self._trace("fatal")
+
+                    self._publish()
+                    self._notify(self._on_fail, self._pid)
 
             elif self._state == ProcessState.running:
                 self._logger.info(f"stopped: process {self._name} pid {self._pid} exited with exit_code {exit_code}, expected: {exit_code in self._program.exitcodes}")
 
                 self._state = ProcessState.exited
 
+                self._trace("exited")
+                self._publish()
+
                 if self._program.autorestart == Autorestart.true:
                     self._logger.info(f"restarting: process {self._name} configured to be always restarted, restarting...")
 
-                    self.spawn()
+                    self._autorestart()
                 elif self._program.autorestart == Autorestart.unexpected:
                     if exit_code not in self._program.exitcodes:
                         self._logger.warning(f"restarting: process {self._name} exited with unexpected exit code, restaring...")
 
-                        self.spawn()
+                        self._autorestart()
             elif self._state == ProcessState.stopping:
                 self._logger.info(f"stopped: process {self._name} successfully stopped")
 
                 self._state = ProcessState.stopped
 
-                self._stop_timer.cancel() if self._stop_handler is not None else None
+                self._stop_timer.cancel() if self._stop_timer is not None else None
+
+                self._context.metrics.stop_seconds.labels(self._group).observe(now() - self._stopping_at)
+
+                self._trace("stopped")
 
                 pid = self._pid
 
                 self._pid = 0
 
-                threading.Thread(target=self._on_kill, args=[self._name, pid]).start() if self._on_kill is not None else None
+                self._publish()
+                self._notify(self._on_kill, pid)
             else:
                 self._logger.critical(f"process {self._name} end up in unknown state")
 
                 self._state = ProcessState.unknown
 
+                self._trace("unknown")
+                self._publish()
+                self._notify(self._on_fail, self._pid)
+
     def kill(self, on_kill: Callable[[str, int], int] = None) -> bool:
         """
         This method is protected with lock because of sigchld signal 
             which could be running at the same time, graceful shutdown first,
             then sigkill after stopwaitsecs
-        Could be executed only if the process is in starting or running states
+        Could be executed only if the process is in starting or running states,
+            a process waiting in backoff just has its pending respawn cancelled,
+            one being spawned is stopped as soon as its pid is known
+            and one already stopping is not signalled again, on_kill is called on its exit too
         """
         with self._lock:
-            if self._state != ProcessState.starting and self._state != ProcessState.running:
+            if self._spawning:
+                if self._kill_pending: # a second stop while spawning waits for the same exit
+                    self._on_kill = _chain(self._on_kill, on_kill)
+                else:
+                    self._on_kill = on_kill if on_kill is not None else self._on_kill
+
+                self._kill_pending = True
+
+                self._trace("stop", "deferred until spawned")
+
+                return True
+
+            if self._state == ProcessState.stopping:
+                self._on_kill = _chain(self._on_kill, on_kill)
+
+                return True
+
+            if self._state == ProcessState.backoff or (self._state == ProcessState.exited and (self._start_timer is not None or self._queued)):
+                self._start_timer.cancel() if self._start_timer is not None else None
+                self._start_timer = None
+                self._queued = False
+
+                self._state = ProcessState.stopped
+
+                self._trace("stopped", "restart cancelled")
+                self._publish()
+
                 return False
 
-            self._start_timer.cancel() if self._start_timer is not None else None
+            if self._state != ProcessState.starting and self._state != ProcessState.running:
+                return False
 
-            self._stop_timer = threading.Timer(self._program.stopwaitsecs, self._stop_handler)
             self._on_kill = on_kill if on_kill is not None else self._on_kill
-            self._state = ProcessState.stopping
 
-            self._stop_timer.start()
+            return self._stop()
 
-            try:
-                os.kill(self._pid, self._program.stopsignal)
-            except Exception:
-                return False
+    def _stop(self) -> bool:
+        if self._pid <= 0: # os.kill(0) would signal the whole process group of the daemon
+            self._logger.warning(f"stop: process {self._name} is {self._state.name} without a pid, not signalled")
+
+            return False
+
+        self._start_timer.cancel() if self._start_timer is not None else None
+
+        self._stop_timer = self._context.scheduler.call_later(self._program.stopwaitsecs, self._stop_handler)
+        self._state = ProcessState.stopping
+        self._stopping_at = now()
+
+        self._trace("stop", signal.Signals(self._program.stopsignal).name)
+        self._publish()
+
+        try:
+            os.kill(self._pid, self._program.stopsignal)
+        except Exception:
+            return False
 
-            return True
+        return True
 
     @property
     def state(self):
@@ -195,27 +489,115 @@ class Process:
     def pid(self):
         return self._pid
 
-    def _redirect_fd_into_logfile(self, fd: int, logfile: str, suffix=""):
-        file = None
+    @property
+    def generation(self):
+        return self._generation
+
+    @property
+    def stdout_logfile(self):
+        return self._stdout_logfile
+
+    @property
+    def stderr_logfile(self):
+        return self._stderr_logfile
 
+    def _resolve_logfile(self, logfile: str, suffix: str) -> str:
+        """
+        Runs in the supervisor so that it knows where the output goes,
+            AUTO files are created once and kept across restarts of the process
+        """
         if logfile == "AUTO":
-            file = tempfile.NamedTemporaryFile(mode="w", delete=False, prefix=f"{self._name}.", suffix=suffix)
+            fd, path = tempfile.mkstemp(prefix=f"{self._name}.", suffix=suffix)
+
+            os.close(fd)
+
+            return path
         elif logfile == "NONE":
-            file = open("/dev/null", "w")
-        else:
-            try:
-                file = open(logfile, "a")
-            except Exception:
-                file = open("/dev/null", "w")
+            return os.devnull
+
+        return logfile
+
+    def reconfigure(self):
+        """
+        Applies hot-reloaded settings of the program which are not read at spawn time
+        """
+        if self._program.capture:
+            for stream in ("stdout", "stderr"):
+                self._context.capture.configure(self.capture_key(stream), self._program.maxbytes, self._program.backups)
+
+    @property
+    def captured(self):
+        return self._program.capture
+
+    def capture_key(self, stream: str = "stdout") -> str:
+        return f"{self._name}.{stream}"
+
+    def _open_capture(self):
+        stdout_pipe = self._context.capture.open(self.capture_key("stdout"), self._stdout_logfile, self._program.maxbytes, self._program.backups, self)
+        stderr_pipe = self._context.capture.open(self.capture_key("stderr"), self._stderr_logfile, self._program.maxbytes, self._program.backups, self)
+
+        return stdout_pipe, stderr_pipe
+
+    def _close_capture(self, stdout_pipe: int, stderr_pipe: int):
+        """
+        Write ends belong to the child only, the capture thread sees EOF once it exits
+        """
+        os.close(stdout_pipe) if stdout_pipe >= 0 else None
+        os.close(stderr_pipe) if stderr_pipe >= 0 else None
+
+    def _autorestart(self):
+        """
+        Restarts an exited process: right away if it stayed up at least backoffmaxsecs,
+            with a growing backoff delay if it keeps exiting sooner
+        """
+        self._crashes = 0 if time.time() - self._timestamp >= self._program.backoffmaxsecs else self._crashes + 1
+
+        self._start_timer = self._context.scheduler.call_later(self._program.backoff(self._crashes) if self._crashes > 0 else 0, self._restart)
+
+    def _restart(self, reserved: bool = False):
+        """
+        Backoff delay is over: takes a token from the global restart limiter and queues
+            the spawn on the launcher (see respawn), or waits for the token if restarts
+            across all groups go over the rate
+        """
+        with self._lock:
+            if self._retired or self._spawning or (self._state != ProcessState.backoff and self._state != ProcessState.exited):
+                return
+
+            if not reserved:
+                wait = self._context.restarts.reserve()
+
+                if wait > 0:
+                    self._context.metrics.restarts_deferred.labels(self._group).inc()
 
-        self._logger.debug(f"Setting up log file for program({fd}) {self._name} on {file.name}")
+                    self._trace("deferred", f"{wait:.3f}s")
 
-        self._program.stdout_logfile = file.name
+                    self._start_timer = self._context.scheduler.call_later(wait, self._restart, True)
 
-        os.dup2(file.fileno(), fd)
+                    return
+
+            self._start_timer = None
+            self._queued = True
+
+        self._relaunch(self._name)
+
+    def respawn(self) -> bool:
+        """
+        Runs a queued automatic restart on a launcher worker, unless the process was stopped,
+            started by hand or retired meanwhile
+        """
+        with self._lock:
+            if not self._queued or self._retired or (self._state != ProcessState.backoff and self._state != ProcessState.exited):
+                return False
+
+            self._context.metrics.restarts.labels(self._group).inc()
+
+            return self._spawn()
 
     def _start_handler(self):
         with self._lock:
+            self._start_timer = None
+
             if self._state == ProcessState.starting:
                 self._logger.info(f"success: {self._name} entered RUNNING state, process has stayed up for > than {self._program.startsecs} seconds (startsecs)")
 
@@ -223,17 +605,76 @@ class Process:
                 self._restarts = 0
                 self._timestamp = time.time()
 
-                threading.Thread(target=self._on_spawn, args=[self._name, self._pid]).start() if self._on_spawn is not None else None
+                self._context.metrics.start_seconds.labels(self._group).observe(now() - self._spawned_at)
+
+                self._trace("running")
+                self._publish()
+                self._notify(self._on_spawn, self._pid)
+
+    def _notify(self, callback: Callable[[str, int], None], pid: int):
+        """
+        Callbacks are run on the scheduler thread, outside of the process lock
+        """
+        self._context.scheduler.call_soon(callback, self._name, pid) if callback is not None else None
+
+    def _publish(self):
+        """
+        Mirrors the state into the status segment, restarts are the spawns after the first one
+        """
+        if self._slot >= 0:
+            self._context.status.update(self._slot, self._state.name, self._pid, max(self._generation - 1, 0), self._timestamp)
+
+        if self._record >= 0:
+            self._context.journal.update(self._record, self._state.name, self._pid, self._timestamp)
+
+    def _trace(self, phase: str, detail=None):
+        self._context.tracer.record(self._group, self._name, self._pid, phase, detail)
+
+    def release(self):
+        """
+        Frees the status and journal slots, the listening sockets and the capture channels,
+            called once the process is removed from its group
+        """
+        self._context.status.release(self._slot) if self._slot >= 0 else None
+        self._slot = -1
+
+        self._context.journal.release(self._record) if self._record >= 0 else None
+        self._record = -1
+
+        self._context.listeners.release(self._fds) if self._fds is not None else None
+        self._fds = []
+
+        if self._program.capture:
+            for stream in ("stdout", "stderr"):
+                self._context.capture.release(self.capture_key(stream), self)
 
     def _stop_handler(self):
         with self._lock:
             if self._state == ProcessState.stopping:
                 self._logger.warning(f"stopped: process {self._name} didn't stopped in time, sending sigkill")
 
+                self._context.metrics.stop_kills.labels(self._group).inc()
+
+                self._trace("sigkill")
+
                 try:
-                    os.kill(self._pid, signal.Signals.SIGKILL)
+                    os.kill(self._pid, signal.Signals.SIGKILL) if self._pid > 0 else None
                 except:
                     pass
 
     def __str__(self):
         return f"{self._state.name} {self._name} pid {self._pid} uptime {time.time() - self._timestamp}s"
+
+
+def _chain(first: Callable[[str, int], None], second: Callable[[str, int], None]) -> Callable[[str, int], None]:
+    """
+    Both callbacks of two stops waiting for the same exit
+    """
+    if first is None or second is None:
+        return first if second is None else second
+
+    def chained(name: str, pid: int):
+        first(name, pid)
+        second(name, pid)
+
+    return chained
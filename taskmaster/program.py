@@ -1,5 +1,7 @@
+import os
 import enum
 import signal
+import random
 
 from typing import List, Dict, Any
 
@@ -10,6 +12,27 @@ class Autorestart(enum.Enum):
     false = 2, # Never reload
 
 
+AUTORESTART = {"always": Autorestart.true, "on_failure": Autorestart.unexpected, "never": Autorestart.false}
+
+
+# Settings which can be changed on a live program, they are read on each spawn/exit/kill
+HOT_FIELDS = {
+    "startretries", "stopwaitsecs", "autorestart", "stopsignal", "exitcodes",
+    "autostart", "startsecs", "startparallelism", "maxbytes", "backups",
+    "backoffsecs", "backoffmaxsecs", "backoffjitter",
+}
+# Handled by adding or removing instances of the group
+RESIZE_FIELDS = {"numprocs"}
+
+
+def restart_fields(old: Dict[str, Any], new: Dict[str, Any]) -> List[str]:
+    """
+    Changed settings of a program config which require restarting its processes
+    """
+    return sorted(key for key in set(old.keys()) | set(new.keys())
+                  if key not in HOT_FIELDS and key not in RESIZE_FIELDS and old.get(key) != new.get(key))
+
+
 class Program:
     stdout_logfile: str
     stderr_logfile: str
@@ -25,6 +48,17 @@ class Program:
     numprocs: int
     command: List[str]
     umask: int
+    capture: bool
+    maxbytes: int
+    backups: int
+    spawn: str
+    startparallelism: int
+    backoffsecs: float
+    backoffmaxsecs: float
+    backoffjitter: float
+    sockets: List[str]
+    reuseport: bool
+    preload: List[str]
 
     def __init__(self, config: Dict[str, Any]):
         self.stdout_logfile = config.get("stdout", "AUTO") # Either AUTO, NONE or str
@@ -32,7 +66,7 @@ class Program:
         self.startretries = config.get("startretries", 3)
         self.stopwaitsecs = config.get("stopwaitsecs", 10)
         self.environment = config.get("environment", dict())
-        self.autorestart = config.get("autorestart", Autorestart.unexpected)
+        self.autorestart = AUTORESTART.get(config.get("autorestart"), Autorestart.unexpected)
         self.stopsignal = signal.Signals[config.get("stopsignal", "SIGTERM")].value
         self.exitcodes = config.get("exitcodes", [0])
         self.autostart = config.get("autostart", True)
@@ -40,4 +74,56 @@ class Program:
         self.startsecs = config.get("startsecs", 1)
         self.numprocs = config.get("numprocs", 1)
         self.command = config.get("command", None).split() # Must be filled - error will be thrown otherwise
-        self.umask = config.get("umask", None) # None - do not set umask
+        self.umask = _umask(config.get("umask", None)) # None - do not set umask
+        self.capture = config.get("capture", False) # True - output goes through pipes read by taskmaster
+        self.maxbytes = config.get("maxbytes", 50 * 1024 * 1024) # Rotate captured logs past that size, 0 - never
+        self.backups = config.get("backups", 10) # Rotated captured logs to keep
+        self.startparallelism = config.get("startparallelism", None) # Max concurrent spawns of this group, None - only the global limit
+        self.spawn = config.get("spawn", "posix_spawn" if hasattr(os, "posix_spawnp") else "fork") # Either posix_spawn, fork or zygote (python programs)
+        self.backoffsecs = config.get("backoffsecs", 1) # First restart delay, doubled on each consecutive failure, 0 - no delay
+        self.backoffmaxsecs = config.get("backoffmaxsecs", 60) # Cap of the restart delay, also the uptime which resets it
+        self.backoffjitter = config.get("backoffjitter", 0.2) # Delays are shortened by up to this fraction, at random
+        self.sockets = config.get("sockets", []) # Listening sockets bound by taskmaster and passed to every instance (see listeners)
+        self.reuseport = config.get("reuseport", False) # True - one SO_REUSEPORT socket per instance instead of a shared one
+        self.preload = config.get("preload", []) # Modules the zygote imports once for every instance (spawn: zygote)
+
+    def update(self, config: Dict[str, Any]):
+        """
+        Applies hot fields and numprocs of config in place, processes share this object
+        """
+        fresh = Program(config)
+
+        self.startretries = fresh.startretries
+        self.stopwaitsecs = fresh.stopwaitsecs
+        self.autorestart = fresh.autorestart
+        self.stopsignal = fresh.stopsignal
+        self.exitcodes = fresh.exitcodes
+        self.autostart = fresh.autostart
+        self.startsecs = fresh.startsecs
+        self.startparallelism = fresh.startparallelism
+        self.maxbytes = fresh.maxbytes
+        self.backups = fresh.backups
+        self.backoffsecs = fresh.backoffsecs
+        self.backoffmaxsecs = fresh.backoffmaxsecs
+        self.backoffjitter = fresh.backoffjitter
+        self.numprocs = fresh.numprocs
+
+    def backoff(self, attempt: int) -> float:
+        """
+        Delay before the `attempt`-th consecutive restart (1 based): exponential, capped, jittered
+            so that processes failing together don't come back together
+        """
+        delay = min(self.backoffsecs * 2 ** min(attempt - 1, 32), self.backoffmaxsecs)
+
+        return delay * (1 - random.uniform(0, self.backoffjitter))
+
+
+def _umask(value) -> int:
+    """
+    Config accepts octal strings ("022") and integers, 777 is taken as octal as well
+    """
+    if isinstance(value, str):
+        return int(value, 8)
+    if value == 777:
+        return 0o777
+    return value
@@ -0,0 +1,65 @@
+import time
+import threading
+
+from typing import Dict, Any
+
+
+class TokenBucket:
+    """
+    Caps automatic restarts across all groups to `rate` per second with bursts of `burst`
+    A reservation always succeeds: when the bucket is empty the token is taken on credit
+        and the caller is told how long to wait for it, so deferred restarts are spaced
+        by 1/rate instead of all retrying at once. rate <= 0 disables the limit
+    """
+    rate: float
+    burst: float
+
+    _tokens: float
+    _updated: float
+    _lock: threading.Lock
+
+    _granted: int
+    _deferred: int
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = max(burst, 1)
+
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+        self._granted = 0
+        self._deferred = 0
+
+    def reserve(self) -> float:
+        """
+        Takes a token, returns 0 if it is available now or the seconds to wait for it
+        """
+        if self.rate <= 0:
+            return 0.0
+
+        with self._lock:
+            now = time.monotonic()
+
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+
+            if self._tokens >= 0:
+                self._granted += 1
+
+                return 0.0
+
+            self._deferred += 1
+
+            return -self._tokens / self.rate
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "rate": self.rate,
+            "burst": self.burst,
+            "tokens": self._tokens,
+            "granted": self._granted,
+            "deferred": self._deferred,
+        }
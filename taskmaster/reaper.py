@@ -0,0 +1,227 @@
+import os
+import select
+import threading
+import logging
+import time
+
+from typing import Dict, Any, Callable, Tuple
+
+
+class Reaper:
+    """
+    Single thread that collects every exited child and forwards exits to the supervisor in order.
+    Wakes up either on a pidfd becoming readable (linux >= 5.3) or on a byte written into
+        the self-pipe by the SIGCHLD handler, then drains all zombies with waitpid in one batch
+    """
+    _dispatch: Callable[[int, int, float], bool] # (pid, exit_code, reaped_at)
+    _logger: logging.Logger
+    _poller: select.poll
+    _pidfds: Dict[int, int] # pidfd(int) to pid(int)
+    _foreign: Dict[int, int] # pidfd(int) to pid(int) of adopted processes which are not our children
+    _unclaimed: Dict[int, Tuple[int, float]] # pid(int) to (exit_code, reaped_at) of children reaped before being registered
+    _wakeup_r: int
+    _wakeup_w: int
+    _thread: threading.Thread
+    _lock: threading.Lock
+    _running: bool
+
+    _reaped: int
+    _batches: int
+    _max_batch: int
+    _last_latency: float
+    _max_latency: float
+
+    UNCLAIMED_LIMIT = 1024
+    UNCLAIMED_RETRY = 50 # ms between retries while some exits are still unclaimed
+    UNCLAIMED_TTL = 5 # seconds, exits of children which never got registered are dropped after that
+    UNKNOWN_EXIT = -1 # exit code reported for foreign processes, only a parent can collect the real one
+
+    def __init__(self, dispatch: Callable[[int, int, float], bool], logger: logging.Logger):
+        self._dispatch = dispatch
+        self._logger = logger
+        self._poller = select.poll()
+        self._pidfds = dict()
+        self._foreign = dict()
+        self._unclaimed = dict()
+        self._wakeup_r, self._wakeup_w = os.pipe2(os.O_NONBLOCK | os.O_CLOEXEC)
+        self._thread = threading.Thread(target=self._loop, name="taskmaster-reaper", daemon=True)
+        self._lock = threading.Lock()
+        self._running = False
+
+        self._reaped = 0
+        self._batches = 0
+        self._max_batch = 0
+        self._last_latency = 0.0
+        self._max_latency = 0.0
+
+        self._poller.register(self._wakeup_r, select.POLLIN)
+
+    def start(self):
+        self._running = True
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self.notify()
+
+    def notify(self):
+        """
+        Async-signal-safe wakeup, designed to be called from the SIGCHLD handler
+        """
+        try:
+            os.write(self._wakeup_w, b"\0")
+        except (BlockingIOError, OSError):
+            pass # pipe is full, the reaper is going to wake up anyway
+
+    def watch(self, pid: int):
+        """
+        Registers freshly spawned child, must be called after the pid is known to the supervisor
+        """
+        if hasattr(os, "pidfd_open"):
+            try:
+                pidfd = os.pidfd_open(pid)
+            except OSError:
+                pidfd = -1
+
+            if pidfd >= 0:
+                with self._lock:
+                    self._pidfds[pidfd] = pid
+                    self._poller.register(pidfd, select.POLLIN)
+
+        self.notify() # lets the loop retry exits which were reaped before registration
+
+    def follow(self, pid: int) -> bool:
+        """
+        Watches a process adopted from a previous daemon which is not our child (it was
+            reparented when that daemon died): its exit is seen through a pidfd and reported
+            with UNKNOWN_EXIT. Returns False without pidfd support or if the process is gone
+        """
+        if not hasattr(os, "pidfd_open"):
+            return False
+
+        try:
+            pidfd = os.pidfd_open(pid)
+        except OSError:
+            return False
+
+        with self._lock:
+            self._foreign[pidfd] = pid
+            self._poller.register(pidfd, select.POLLIN)
+
+        self.notify()
+
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "reaped": self._reaped,
+            "batches": self._batches,
+            "max_batch": self._max_batch,
+            "last_latency": self._last_latency,
+            "max_latency": self._max_latency,
+            "unclaimed": len(self._unclaimed),
+            "watched": len(self._pidfds),
+            "foreign": len(self._foreign),
+            "threads": threading.active_count(),
+        }
+
+    def _loop(self):
+        while self._running:
+            try:
+                events = self._poller.poll(self.UNCLAIMED_RETRY if len(self._unclaimed) > 0 else None)
+            except InterruptedError:
+                continue
+
+            woken_at = time.monotonic()
+
+            batch = list()
+
+            for fd, _ in events:
+                if fd == self._wakeup_r:
+                    self._drain_wakeup()
+                elif fd in self._foreign.keys():
+                    batch.append((self._forget_foreign(fd), self.UNKNOWN_EXIT, time.monotonic()))
+                else:
+                    self._forget_pidfd(fd)
+
+            batch += self._reap()
+
+            for pid, exit_code, reaped_at in batch:
+                if not self._deliver(pid, exit_code, reaped_at):
+                    self._keep_unclaimed(pid, exit_code, reaped_at)
+
+            for pid, (exit_code, reaped_at) in list(self._unclaimed.items()):
+                if self._deliver(pid, exit_code, reaped_at) or woken_at - reaped_at > self.UNCLAIMED_TTL:
+                    del self._unclaimed[pid]
+
+            if len(batch) > 0:
+                latency = time.monotonic() - woken_at
+
+                self._reaped += len(batch)
+                self._batches += 1
+                self._max_batch = max(self._max_batch, len(batch))
+                self._last_latency = latency
+                self._max_latency = max(self._max_latency, latency)
+
+    def _reap(self):
+        """
+        Exits are stamped once waited for: a stamp taken before (at wake up) could predate
+            the spawn of a child started meanwhile by another thread, its exit would look stale
+        """
+        batch = list()
+
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+
+            while pid > 0:
+                batch.append((pid, os.waitstatus_to_exitcode(status), time.monotonic()))
+
+                pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            pass
+
+        return batch
+
+    def _deliver(self, pid: int, exit_code: int, reaped_at: float) -> bool:
+        """
+        Returns False only if nobody claimed the pid yet, delivery errors are logged and swallowed
+        reaped_at (time.monotonic) lets the receiver tell this exit from one of a later child reusing the pid
+        """
+        try:
+            return self._dispatch(pid, exit_code, reaped_at)
+        except Exception as error:
+            self._logger.critical(f"reaper: failed to deliver exit of pid {pid}: {error}")
+
+        return True
+
+    def _keep_unclaimed(self, pid: int, exit_code: int, reaped_at: float):
+        if len(self._unclaimed) >= self.UNCLAIMED_LIMIT:
+            self._unclaimed.pop(next(iter(self._unclaimed)))
+
+        self._unclaimed[pid] = (exit_code, reaped_at)
+
+    def _drain_wakeup(self):
+        try:
+            while os.read(self._wakeup_r, 4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
+    def _forget_foreign(self, pidfd: int) -> int:
+        with self._lock:
+            pid = self._foreign.pop(pidfd)
+
+            self._poller.unregister(pidfd)
+
+            os.close(pidfd)
+
+        return pid
+
+    def _forget_pidfd(self, pidfd: int):
+        with self._lock:
+            if pidfd in self._pidfds.keys():
+                del self._pidfds[pidfd]
+
+                self._poller.unregister(pidfd)
+
+                os.close(pidfd)
@@ -0,0 +1,205 @@
+import os
+import time
+import threading
+import logging
+
+from typing import List, Dict, Any, Callable, Tuple
+
+
+class Sample:
+    """
+    Last known resource usage of one process, rates are computed between two sweeps
+    """
+    __slots__ = ("pid", "starttime", "cpu_ticks", "read_bytes", "write_bytes", "sampled_at",
+                 "cpu", "rss", "threads", "read_rate", "write_rate")
+
+    pid: int
+    starttime: int # jiffies after boot, tells a reused pid apart
+    cpu_ticks: int
+    read_bytes: int
+    write_bytes: int
+    sampled_at: float
+    cpu: float # percent of one core
+    rss: int # bytes
+    threads: int
+    read_rate: float # bytes per second
+    write_rate: float
+
+    def __init__(self, pid: int, starttime: int):
+        self.pid = pid
+        self.starttime = starttime
+        self.cpu_ticks = -1
+        self.read_bytes = -1
+        self.write_bytes = -1
+        self.sampled_at = 0.0
+        self.cpu = 0.0
+        self.rss = 0
+        self.threads = 0
+        self.read_rate = 0.0
+        self.write_rate = 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "pid": self.pid,
+            "cpu": self.cpu,
+            "rss": self.rss,
+            "threads": self.threads,
+            "read_rate": self.read_rate,
+            "write_rate": self.write_rate,
+            "sampled_at": self.sampled_at,
+        }
+
+
+class Sampler:
+    """
+    Background thread sweeping /proc/<pid>/{stat,statm,io} of every managed process
+        once per `interval` and keeping the derived CPU%, RSS and IO rates in memory,
+        so that queries never touch /proc
+    Files are read with raw os.open/os.read (no buffered file objects), one sweep is
+        a few syscalls and a couple of splits per process
+    """
+    _targets: Callable[[], List[Tuple[Any, int]]]
+    _samples: Dict[Any, Sample]
+    _interval: float
+    _logger: logging.Logger
+    _thread: threading.Thread
+    _stop: threading.Event
+    _ticks: int
+    _page_size: int
+
+    _sweeps: int
+    _last_sweep: float
+    _max_sweep: float
+
+    def __init__(self, targets: Callable[[], List[Tuple[Any, int]]], interval: float, logger: logging.Logger):
+        """
+        targets returns the (key, pid) of every process to sample, it is called once per sweep
+        """
+        self._targets = targets
+        self._samples = dict()
+        self._interval = interval
+        self._logger = logger
+        self._thread = threading.Thread(target=self._loop, name="taskmaster-sampler", daemon=True)
+        self._stop = threading.Event()
+        self._ticks = os.sysconf("SC_CLK_TCK")
+        self._page_size = os.sysconf("SC_PAGE_SIZE")
+
+        self._sweeps = 0
+        self._last_sweep = 0.0
+        self._max_sweep = 0.0
+
+    def start(self):
+        self._thread.start() if self._interval > 0 else None
+
+    def stop(self):
+        self._stop.set()
+
+    def get(self, key) -> Sample:
+        return self._samples.get(key)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sweeps": self._sweeps,
+            "processes": len(self._samples),
+            "last_sweep": self._last_sweep,
+            "max_sweep": self._max_sweep,
+        }
+
+    def sweep(self):
+        started = time.monotonic()
+        samples = dict()
+
+        for key, pid in self._targets():
+            sample = self._sample(pid, self._samples.get(key), started)
+
+            if sample is not None:
+                samples[key] = sample
+
+        self._samples = samples # swapped whole and samples are never reused: readers never see a half done sweep
+
+        duration = time.monotonic() - started
+
+        self._sweeps += 1
+        self._last_sweep = duration
+        self._max_sweep = max(self._max_sweep, duration)
+
+    def _loop(self):
+        while not self._stop.wait(self._interval):
+            try:
+                self.sweep()
+            except Exception as error:
+                self._logger.error(f"sampler: sweep failed: {error}")
+
+    def _sample(self, pid: int, previous: Sample, now: float) -> Sample:
+        stat = _read(f"/proc/{pid}/stat")
+
+        if stat is None:
+            return None
+
+        fields = stat[stat.rfind(b")") + 2:].split() # comm may contain spaces and parentheses
+        starttime = int(fields[19])
+
+        if previous is None or previous.pid != pid or previous.starttime != starttime:
+            previous = Sample(pid, starttime)
+
+        # a new sample each sweep, the one a reader holds is never written to
+        sample = Sample(pid, starttime)
+        elapsed = now - previous.sampled_at if previous.sampled_at > 0 else 0.0
+        cpu_ticks = int(fields[11]) + int(fields[12])
+
+        if elapsed > 0 and previous.cpu_ticks >= 0:
+            sample.cpu = (cpu_ticks - previous.cpu_ticks) / self._ticks / elapsed * 100
+        else:
+            sample.cpu = previous.cpu
+
+        sample.cpu_ticks = cpu_ticks
+        sample.threads = int(fields[17])
+
+        statm = _read(f"/proc/{pid}/statm")
+        sample.rss = int(statm.split()[1]) * self._page_size if statm is not None else previous.rss
+
+        io = _read(f"/proc/{pid}/io")
+        read_bytes, write_bytes = _io_bytes(io) if io is not None else (previous.read_bytes, previous.write_bytes)
+
+        if io is not None and elapsed > 0 and previous.read_bytes >= 0:
+            sample.read_rate = (read_bytes - previous.read_bytes) / elapsed
+            sample.write_rate = (write_bytes - previous.write_bytes) / elapsed
+        else:
+            sample.read_rate = previous.read_rate
+            sample.write_rate = previous.write_rate
+
+        sample.read_bytes = read_bytes
+        sample.write_bytes = write_bytes
+        sample.sampled_at = now
+
+        return sample
+
+
+def _read(path: str) -> bytes:
+    try:
+        fd = os.open(path, os.O_RDONLY | os.O_CLOEXEC)
+    except OSError: # process is gone (or io is not readable)
+        return None
+
+    try:
+        return os.read(fd, 4096)
+    except OSError:
+        return None
+    finally:
+        os.close(fd)
+
+
+def _io_bytes(io: bytes) -> Tuple[int, int]:
+    """
+    rchar/wchar count every read/write syscall, read_bytes/write_bytes only what hit the storage:
+        the former is what matters for pipes and sockets
+    """
+    read_bytes = write_bytes = 0
+
+    for line in io.splitlines():
+        if line.startswith(b"rchar:"):
+            read_bytes = int(line[6:])
+        elif line.startswith(b"wchar:"):
+            write_bytes = int(line[6:])
+
+    return read_bytes, write_bytes
@@ -0,0 +1,115 @@
+import heapq
+import itertools
+import threading
+import logging
+import time
+
+from typing import List, Dict, Any, Callable
+
+
+class TimerHandle:
+    """
+    Cancellable reference to a callback scheduled on the Scheduler
+    """
+    __slots__ = ("deadline", "callback", "args", "cancelled")
+
+    deadline: float
+    callback: Callable
+    args: tuple
+    cancelled: bool
+
+    def __init__(self, deadline: float, callback: Callable, args: tuple):
+        self.deadline = deadline
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+        self.callback = None
+        self.args = None
+
+
+class Scheduler:
+    """
+    One thread serving every timer of the supervisor (startsecs, stopwaitsecs, backoff...)
+    Timers live in a binary heap ordered by monotonic deadline, a pending timer costs
+        only its heap entry, cancelled timers are dropped lazily when they reach the top
+    Callbacks run on the scheduler thread one after another, so they must not block
+    """
+    _heap: List[tuple]
+    _sequence: itertools.count
+    _condition: threading.Condition
+    _thread: threading.Thread
+    _logger: logging.Logger
+    _running: bool
+
+    _fired: int
+    _max_lateness: float
+
+    def __init__(self, logger: logging.Logger):
+        self._heap = list()
+        self._sequence = itertools.count()
+        self._condition = threading.Condition(threading.Lock())
+        self._thread = threading.Thread(target=self._loop, name="taskmaster-scheduler", daemon=True)
+        self._logger = logger
+        self._running = False
+
+        self._fired = 0
+        self._max_lateness = 0.0
+
+    def start(self):
+        self._running = True
+        self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+
+    def call_later(self, delay: float, callback: Callable, *args) -> TimerHandle:
+        handle = TimerHandle(time.monotonic() + max(delay, 0), callback, args)
+
+        with self._condition:
+            heapq.heappush(self._heap, (handle.deadline, next(self._sequence), handle))
+
+            if self._heap[0][2] is handle:
+                self._condition.notify()
+
+        return handle
+
+    def call_soon(self, callback: Callable, *args) -> TimerHandle:
+        return self.call_later(0, callback, *args)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": len(self._heap),
+            "fired": self._fired,
+            "max_lateness": self._max_lateness,
+        }
+
+    def _loop(self):
+        while True:
+            with self._condition:
+                while self._running and (len(self._heap) == 0 or self._heap[0][0] > time.monotonic()):
+                    self._condition.wait(self._heap[0][0] - time.monotonic() if len(self._heap) > 0 else None)
+
+                if not self._running:
+                    return
+
+                _, _, handle = heapq.heappop(self._heap)
+
+            if handle.cancelled:
+                continue
+
+            callback, args = handle.callback, handle.args
+
+            handle.cancel() # fired handles are released right away
+
+            self._fired += 1
+            self._max_lateness = max(self._max_lateness, time.monotonic() - handle.deadline)
+
+            try:
+                callback(*args)
+            except Exception as error:
+                self._logger.critical(f"scheduler: timer callback {callback} failed: {error}")
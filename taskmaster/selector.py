@@ -0,0 +1,142 @@
+import re
+import fnmatch
+import functools
+
+from typing import List, Dict, Tuple, Pattern
+
+
+# Target selectors accepted by start/stop/restart/status/pid:
+#   all                 every process of every group
+#   <group>:* <group>:  every process of the group
+#   <group>:<name>      one process
+#   <name> or <group>   bare word: processes with that name in any group, or the whole group
+#   shell globs         in either part: web*:*, *:worker?, api-[0-9]*
+#   /<regex>/           searched in the full "<group>:<name>" of every process
+# Several selectors can be given at once, the selection is their union in index order.
+
+_GLOB = re.compile(r"[*?\[]")
+
+
+class GroupEntry:
+    """
+    Process names of one group, valid as long as the group keeps the same processes dict
+        (groups replace it on every resize, see Group.update)
+    """
+    __slots__ = ("group", "processes", "names", "targets")
+
+    group: object
+    processes: dict
+    names: List[str]
+    targets: List[str] # "<group>:<name>" of every process, for regex selectors
+
+    def __init__(self, group):
+        self.group = group
+        self.processes = group.processes
+        self.names = list(self.processes.keys())
+        self.targets = [f"{group.name}:{name}" for name in self.names]
+
+
+class NameIndex:
+    """
+    Group and process names known to the supervisor, kept up to date on reload
+    Selections are answered from the index: exact names are dict lookups, globs and
+        regexes scan the prebuilt name lists only
+    """
+    _groups: Dict[str, GroupEntry]
+
+    def __init__(self):
+        self._groups = dict()
+
+    def add(self, group):
+        self._groups[group.name] = GroupEntry(group)
+
+    def remove(self, name: str):
+        self._groups.pop(name, None)
+
+    def select(self, selectors: List[str]) -> List[Tuple[str, str]]:
+        """
+        Resolves selectors into (group, process) pairs, raises ValueError on an invalid selector
+        """
+        selected = dict() # ordered set
+
+        for selector in selectors:
+            for target in compile_selector(selector).select(self):
+                selected[target] = None
+
+        return list(selected.keys())
+
+    def entry(self, name: str) -> GroupEntry:
+        entry = self._groups.get(name)
+
+        if entry is not None and entry.processes is not entry.group.processes:
+            entry = GroupEntry(entry.group)
+
+            self._groups[name] = entry
+
+        return entry
+
+    def entries(self) -> List[GroupEntry]:
+        return [self.entry(name) for name in list(self._groups.keys())]
+
+
+class Selector:
+    group: str
+    name: str
+    pattern: Pattern
+
+    def __init__(self, group: str = None, name: str = None, pattern: Pattern = None):
+        self.group = group
+        self.name = name
+        self.pattern = pattern
+
+    def select(self, index: NameIndex) -> List[Tuple[str, str]]:
+        if self.pattern is not None:
+            return [(entry.group.name, name) for entry in index.entries()
+                    for name, target in zip(entry.names, entry.targets) if self.pattern.search(target)]
+
+        if self.group is not None and _GLOB.search(self.group) is None:
+            entry = index.entry(self.group)
+            entries = [entry] if entry is not None else []
+        else:
+            entries = [entry for entry in index.entries() if self.group is None or fnmatch.fnmatchcase(entry.group.name, self.group)]
+
+        if self.name is None:
+            return [(entry.group.name, name) for entry in entries for name in entry.names]
+
+        if _GLOB.search(self.name) is None:
+            return [(entry.group.name, self.name) for entry in entries if self.name in entry.processes]
+
+        return [(entry.group.name, name) for entry in entries for name in entry.names if fnmatch.fnmatchcase(name, self.name)]
+
+
+class WordSelector(Selector):
+    """
+    Bare word: the processes it names in any group, the whole group if it names a group
+    """
+    def select(self, index: NameIndex) -> List[Tuple[str, str]]:
+        selected = Selector(None, self.name).select(index)
+        selected.extend(Selector(self.name, None).select(index))
+
+        return selected
+
+
+@functools.lru_cache(maxsize=1024)
+def compile_selector(selector: str) -> Selector:
+    if selector == "all":
+        return Selector()
+
+    if len(selector) > 2 and selector.startswith("/") and selector.endswith("/"):
+        try:
+            return Selector(pattern=re.compile(selector[1:-1]))
+        except re.error as error:
+            raise ValueError(f"invalid regex {selector}: {error}")
+
+    if ":" not in selector:
+        return WordSelector(selector, selector)
+
+    group, name = selector.split(":", 1)
+
+    if len(group) == 0:
+        raise ValueError(f"group name is missing in {selector}")
+
+    return Selector(group, name if name not in ("", "*") else None)
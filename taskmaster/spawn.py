@@ -0,0 +1,143 @@
+import os
+import sys
+import signal
+
+from typing import List, Union
+
+from .program import Program
+
+
+# Spawn backends: both start `program` with stdout/stderr going either to an already
+# opened fd (capture pipe) or to a log file path (opened in append mode) and return the pid.
+# `fds` are listening sockets (see listeners) passed the systemd way: as fds 3, 4, ...
+# with LISTEN_FDS set to their count and LISTEN_PID to the pid of the program.
+
+LISTEN_FDS_START = 3
+
+_RESET_SIGNALS = {sig for sig in signal.valid_signals() if sig not in (signal.SIGKILL, signal.SIGSTOP)}
+
+
+def fork_exec(program: Program, stdout: Union[int, str], stderr: Union[int, str], fds: List[int] = ()) -> int:
+    """
+    Classic fork + exec, the child runs python code until execvpe
+    """
+    pid = os.fork()
+
+    if pid != 0:
+        return pid
+
+    try:
+        _redirect(stdout, sys.stdout.fileno())
+        _redirect(stderr, sys.stderr.fileno())
+
+        for target, fd in enumerate(fds, LISTEN_FDS_START):
+            os.dup2(fd, target)
+
+        try:
+            os.chdir(program.directory)
+        except Exception:
+            pass
+
+        try:
+            os.umask(program.umask)
+        except Exception:
+            pass
+
+        for sig in _RESET_SIGNALS:
+            try:
+                signal.signal(sig, signal.SIG_DFL)
+            except (OSError, ValueError):
+                pass
+
+        signal.pthread_sigmask(signal.SIG_SETMASK, [])
+
+        environment = dict(program.environment, LISTEN_FDS=str(len(fds)), LISTEN_PID=str(os.getpid())) if len(fds) > 0 else program.environment
+
+        os.execvpe(program.command[0], program.command, environment)
+    finally:
+        os._exit(127) # never return into the supervisor code from the child
+
+
+def posix_spawn(program: Program, stdout: Union[int, str], stderr: Union[int, str], fds: List[int] = ()) -> int:
+    """
+    posix_spawn (vfork + exec in glibc): no page table copy and no python code in the child
+    Redirections and the signal reset are done by the libc, working directory, umask and
+        LISTEN_PID (the pid is unknown before the spawn), which have no spawn attribute,
+        are applied by a tiny /bin/sh prologue that execs the program
+    Log files are opened here rather than by a POSIX_SPAWN_OPEN action, so that a path which
+        cannot be opened falls back to /dev/null like with fork instead of failing the spawn
+    """
+    stdio = [target if isinstance(target, int) else _open_log(target) for target in (stdout, stderr)]
+
+    file_actions = [(os.POSIX_SPAWN_DUP2, stdio[0], sys.stdout.fileno()), (os.POSIX_SPAWN_DUP2, stdio[1], sys.stderr.fileno())]
+    file_actions += [(os.POSIX_SPAWN_DUP2, fd, target) for target, fd in enumerate(fds, LISTEN_FDS_START)]
+
+    environment = dict(program.environment, LISTEN_FDS=str(len(fds))) if len(fds) > 0 else program.environment
+
+    try:
+        return os.posix_spawnp(program.command[0] if not _needs_prologue(program, fds) else "/bin/sh",
+                               _argv(program, fds), environment,
+                               file_actions=file_actions, setsigdef=_RESET_SIGNALS, setsigmask=[])
+    finally:
+        for fd, target in zip(stdio, (stdout, stderr)):
+            os.close(fd) if not isinstance(target, int) else None
+
+
+BACKENDS = {
+    "fork": fork_exec,
+    "posix_spawn": posix_spawn,
+}
+
+
+def _needs_prologue(program: Program, fds: List[int]) -> bool:
+    return program.directory is not None or program.umask is not None or len(fds) > 0
+
+
+def _argv(program: Program, fds: List[int]) -> List[str]:
+    if not _needs_prologue(program, fds):
+        return program.command
+
+    script = list()
+    argv = ["/bin/sh", "-c", "", "taskmaster"]
+
+    if len(fds) > 0:
+        script.append("LISTEN_PID=$$; export LISTEN_PID") # exec keeps the pid of the shell
+
+    if program.umask is not None:
+        script.append(f"umask {program.umask:03o}")
+
+    if program.directory is not None:
+        script.append('cd -- "$1" 2>/dev/null; shift') # like the fork backend, a missing directory is not fatal
+
+        argv.append(program.directory)
+
+    script.append('exec "$@"')
+
+    argv[2] = "; ".join(script)
+
+    return argv + program.command
+
+
+def _open_log(path: str) -> int:
+    """
+    Log file of a child opened by the supervisor (close-on-exec, the child gets a dup), /dev/null if it cannot be
+    """
+    try:
+        return os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND | os.O_CLOEXEC, 0o644)
+    except OSError:
+        return os.open(os.devnull, os.O_WRONLY | os.O_CLOEXEC)
+
+
+def _redirect(target: Union[int, str], fd: int):
+    if isinstance(target, int):
+        os.dup2(target, fd)
+
+        return
+
+    try:
+        file = os.open(target, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+    except OSError:
+        file = os.open(os.devnull, os.O_WRONLY)
+
+    os.dup2(file, fd)
+    os.close(file)
@@ -0,0 +1,162 @@
+import os
+import mmap
+import time
+import heapq
+import struct
+import threading
+import logging
+
+from typing import List
+
+
+# Layout of the status segment, a file (on tmpfs) mapped by the daemon and by readers:
+#   header (HEADER_SIZE bytes) followed by `capacity` slots of SLOT_SIZE bytes
+# Every slot is guarded by its own seqlock: the writer makes the sequence odd, writes the
+#   body, then makes it even again. A reader copying a slot retries while the sequence is odd
+#   or changed during the copy. The header sequence is bumped the same way when slots
+#   are allocated or released, count is the number of slots in use or freed (high watermark)
+
+MAGIC = b"TMST"
+VERSION = 1
+
+HEADER = struct.Struct("<4sIIIIIid") # magic, version, slot_size, capacity, count, seq, daemon pid, updated (time.time)
+HEADER_SIZE = 64
+HEADER_COUNT = 16 # offsets of the fields updated in place
+HEADER_SEQ = 20
+HEADER_UPDATED = 28
+
+SEQ = struct.Struct("<I")
+UPDATED = struct.Struct("<d")
+SLOT = struct.Struct("<IB3xiId48s56s") # seq, state, pid, restarts, started_at (time.time, 0 - never), group, name
+SLOT_BODY = struct.Struct("<B3xiId48s56s")
+SLOT_SIZE = SLOT.size
+
+# State byte of a slot, 0 marks a free slot
+STATES = ("stopped", "starting", "running", "backoff", "stopping", "exited", "fatal", "unknown")
+
+
+class StatusMap:
+    """
+    Writer side of the status segment, lives in the daemon
+    Updates are plain stores into the mapping: no syscall and no formatting, monitors
+        read the table without ever talking to the daemon (see statusreader)
+    """
+    path: str
+    capacity: int
+
+    _mmap: mmap.mmap
+    _seqs: List[int]
+    _free: List[int]
+    _count: int
+    _seq: int
+    _lock: threading.Lock
+    _logger: logging.Logger
+    _codes: dict
+
+    def __init__(self, path: str, capacity: int, logger: logging.Logger):
+        self.path = path
+        self.capacity = capacity
+
+        self._seqs = [0] * capacity
+        self._free = list()
+        self._count = 0
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._logger = logger
+        self._codes = {state: code + 1 for code, state in enumerate(STATES)}
+
+        temporary = f"{path}.{os.getpid()}.tmp"
+        fd = os.open(temporary, os.O_RDWR | os.O_CREAT | os.O_TRUNC | os.O_CLOEXEC, 0o644)
+
+        try:
+            os.ftruncate(fd, HEADER_SIZE + capacity * SLOT_SIZE)
+
+            self._mmap = mmap.mmap(fd, HEADER_SIZE + capacity * SLOT_SIZE)
+        finally:
+            os.close(fd)
+
+        HEADER.pack_into(self._mmap, 0, MAGIC, VERSION, SLOT_SIZE, capacity, 0, 0, os.getpid(), time.time())
+
+        os.replace(temporary, path) # readers never see a half initialized segment
+
+    def allocate(self, group: str, name: str) -> int:
+        """
+        Reserves a slot for a process, returns -1 when the segment is full (the process is then not published)
+        """
+        with self._lock:
+            if len(self._free) > 0:
+                slot = heapq.heappop(self._free)
+            elif self._count < self.capacity:
+                slot = self._count
+            else:
+                self._logger.warning(f"status: segment {self.path} is full, {group}:{name} is not published")
+
+                return -1
+
+            self._begin_table()
+            self._count = max(self._count, slot + 1)
+            self._write(slot, "stopped", 0, 0, 0.0, group, name)
+            self._end_table()
+
+        return slot
+
+    def release(self, slot: int):
+        if slot < 0:
+            return
+
+        with self._lock:
+            self._begin_table()
+            self._write(slot, None, 0, 0, 0.0, "", "")
+            self._end_table()
+
+            heapq.heappush(self._free, slot)
+
+    def update(self, slot: int, state: str, pid: int, restarts: int, started_at: float):
+        if slot < 0:
+            return
+
+        with self._lock:
+            offset = HEADER_SIZE + slot * SLOT_SIZE
+            group, name = SLOT.unpack_from(self._mmap, offset)[5:]
+
+            self._write(slot, state, pid, restarts, started_at, group, name)
+
+            UPDATED.pack_into(self._mmap, HEADER_UPDATED, time.time())
+
+    def close(self):
+        self._mmap.close()
+
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+    def _write(self, slot: int, state: str, pid: int, restarts: int, started_at: float, group, name):
+        offset = HEADER_SIZE + slot * SLOT_SIZE
+        seq = self._seqs[slot]
+
+        SEQ.pack_into(self._mmap, offset, (seq + 1) & 0xFFFFFFFF)
+        SLOT_BODY.pack_into(self._mmap, offset + SEQ.size,
+                            self._codes.get(state, 0), pid, restarts, started_at,
+                            _encode(group, 48), _encode(name, 56))
+        SEQ.pack_into(self._mmap, offset, (seq + 2) & 0xFFFFFFFF)
+
+        self._seqs[slot] = (seq + 2) & 0xFFFFFFFF
+
+    def _begin_table(self):
+        self._seq = (self._seq + 1) & 0xFFFFFFFF
+
+        SEQ.pack_into(self._mmap, HEADER_SEQ, self._seq)
+
+    def _end_table(self):
+        self._seq = (self._seq + 1) & 0xFFFFFFFF
+
+        SEQ.pack_into(self._mmap, HEADER_COUNT, self._count)
+        SEQ.pack_into(self._mmap, HEADER_SEQ, self._seq)
+
+
+def _encode(value, size: int) -> bytes:
+    if isinstance(value, bytes):
+        return value
+
+    return value.encode()[:size]
@@ -0,0 +1,129 @@
+import os
+import sys
+import mmap
+import time
+
+from typing import List, NamedTuple
+
+from .statusmap import MAGIC, VERSION, HEADER, HEADER_SIZE, HEADER_SEQ, SEQ, SLOT, SLOT_SIZE, STATES
+
+
+class ProcessStatus(NamedTuple):
+    group: str
+    name: str
+    state: str
+    pid: int
+    restarts: int # spawns after the first one
+    started_at: float # time.time() the process entered RUNNING, 0 - never
+
+
+class StatusReader:
+    """
+    Reads the status segment published by the daemon (see statusmap) without the control socket
+    Every slot of a snapshot is consistent on its own, and the set of slots is the one
+        of a single point in time (no process added or removed during the copy)
+    The segment is mapped again when the daemon replaced it (restart)
+    """
+    path: str
+
+    _mmap: mmap.mmap
+    _inode: int
+
+    RETRIES = 1000
+
+    def __init__(self, path: str):
+        self.path = path
+        self._mmap = None
+        self._inode = -1
+
+        self._open()
+
+    def snapshot(self) -> List[ProcessStatus]:
+        if os.stat(self.path).st_ino != self._inode:
+            self.close()
+            self._open()
+
+        for _ in range(self.RETRIES):
+            seq = SEQ.unpack_from(self._mmap, HEADER_SEQ)[0]
+
+            if seq & 1:
+                continue
+
+            count = HEADER.unpack_from(self._mmap, 0)[4]
+            statuses = list()
+
+            for slot in range(count):
+                status = self._read_slot(slot)
+
+                if status is not None:
+                    statuses.append(status)
+
+            if SEQ.unpack_from(self._mmap, HEADER_SEQ)[0] == seq:
+                return statuses
+
+        raise TimeoutError(f"status: segment {self.path} is changing too fast")
+
+    def daemon_pid(self) -> int:
+        return HEADER.unpack_from(self._mmap, 0)[6]
+
+    def updated(self) -> float:
+        return HEADER.unpack_from(self._mmap, 0)[7]
+
+    def close(self):
+        self._mmap.close() if self._mmap is not None else None
+        self._mmap = None
+
+    def _open(self):
+        with open(self.path, "rb") as file:
+            self._inode = os.fstat(file.fileno()).st_ino
+            self._mmap = mmap.mmap(file.fileno(), 0, prot=mmap.PROT_READ)
+
+        magic, version, slot_size = HEADER.unpack_from(self._mmap, 0)[:3]
+
+        if magic != MAGIC or version != VERSION or slot_size != SLOT_SIZE:
+            self.close()
+
+            raise ValueError(f"status: {self.path} is not a status segment of this version")
+
+    def _read_slot(self, slot: int) -> ProcessStatus:
+        offset = HEADER_SIZE + slot * SLOT_SIZE
+
+        for _ in range(self.RETRIES):
+            data = self._mmap[offset:offset + SLOT_SIZE]
+            seq, state, pid, restarts, started_at, group, name = SLOT.unpack(data)
+
+            if seq & 1 or SEQ.unpack_from(self._mmap, offset)[0] != seq:
+                continue
+
+            if state == 0:
+                return None
+
+            return ProcessStatus(_decode(group), _decode(name), STATES[state - 1], pid, restarts, started_at)
+
+        raise TimeoutError(f"status: slot {slot} of {self.path} is changing too fast")
+
+
+def read_status(path: str) -> List[ProcessStatus]:
+    reader = StatusReader(path)
+
+    try:
+        return reader.snapshot()
+    finally:
+        reader.close()
+
+
+def _decode(value: bytes) -> str:
+    return value.rstrip(b"\0").decode(errors="replace")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print(f"usage: python -m taskmaster.statusreader <status file>")
+        sys.exit(2)
+
+    now = time.time()
+
+    for status in read_status(sys.argv[1]):
+        uptime = now - status.started_at if status.state == "running" and status.started_at > 0 else 0
+
+        print(f"{status.group}:{status.name} {status.state} pid {status.pid} uptime {uptime:.0f}s restarts {status.restarts}")
@@ -7,170 +7,221 @@ import threading
 import logging
 import time
 
-from typing import List, Dict, Any, Callable, Union, Tuple
+from concurrent.futures import Future, InvalidStateError, wait
+from typing import List, Dict, Any, Callable, Union, Tuple, Set
 
 from .group import Group
+from .program import restart_fields
 from .context import Context
 from .process import Process, ProcessState
+from .logtail import LogHub, Subscription
+from .selector import NameIndex
+from .sampler import Sampler, Sample
+from .metrics import Metrics
 
 class Taskmaster:
     _groups: Dict[str, Group]
     _config: Dict[str, Any]
     _logger: logging.Logger
-
-    def __init__(self, logger: logging.Logger):
+    _context: Context
+    _logtail: LogHub
+    _index: NameIndex
+    _sampler: Sampler
+
+    def __init__(self, logger: logging.Logger, startparallelism: int = 64, status_path: str = None, status_slots: int = 65536,
+                 sample_interval: float = 5.0, trace_size: int = 65536, restart_rate: float = 0, restart_burst: int = 1,
+                 journal_path: str = None):
         self._groups = dict()
         self._config = dict()
         self._logger = logger
+        self._context = Context(logger, startparallelism, self._on_child_exit, status_path, status_slots, trace_size,
+                                restart_rate, restart_burst, journal_path)
+        self._logtail = LogHub(logger)
+        self._index = NameIndex()
+        self._sampler = Sampler(self._sample_targets, sample_interval, logger)
+
+        self._context.metrics.gauge("taskmaster_threads", "Threads of the daemon", threading.active_count)
+        self._context.metrics.gauge("taskmaster_children", "Live children known to the pid registry", lambda: self._context.stats()["size"])
+        self._context.metrics.gauge("taskmaster_listen_sockets", "Listening sockets held for the programs", lambda: self._context.listeners.stats()["sockets"])
+        self._context.metrics.gauge("taskmaster_zygotes", "Zygotes forking the instances of python programs", lambda: self._context.zygotes.stats()["running"])
+        self._context.metrics.gauge("taskmaster_unclaimed_exits", "Reaped exits not matched to a process yet", lambda: self._context.reaper.stats()["unclaimed"])
+
+        self._context.start()
+        self._logtail.start()
+        self._sampler.start()
+
+        signal.signal(signal.SIGCHLD, lambda s, f: self._context.reaper.notify())
+
+    def reload(self, config: Dict[str, Any], changed: Set[str] = None):
+        """
+        Diffs config against the running one field by field: groups with only hot changes
+            (see program.HOT_FIELDS) and numprocs changes are updated in place,
+            groups with other changes are stopped and rebuilt
+        changed: when the caller knows which groups can differ (see parser_config includes),
+            only those are diffed
+        """
+        if changed is None:
+            removed = set(self._config.keys()) - set(config.keys())
+            added = set(config.keys()) - set(self._config.keys())
+            same = set(self._config.keys()) & set(config.keys())
+        else:
+            removed = {group for group in changed if group in self._config and group not in config}
+            added = {group for group in changed if group in config and group not in self._config}
+            same = {group for group in changed if group in config and group in self._config}
 
-        signal.signal(signal.SIGCHLD, lambda s, f: self._sigchld_handler())
+        for group in removed:
+            self._retire(group, None)
 
-    def reload(self, config: Dict[str, Any]):
-        removed = set(self._config.keys()) - set(config.keys())
-        added = set(config.keys()) - set(self._config.keys())
-        same = set(self._config.keys()) & set(config.keys())
+        for group in added:
+            self._create(group, config[group])
 
-        for group in removed:
-            def on_stop(process_name: str, pid: int, group=group):
-                process = Context.get_process(pid)
+        for group in same:
+            if self._config[group] == config[group]:
+                continue
 
-                if all(process.state in [ProcessState.stopped, ProcessState.exited, ProcessState.fatal] for process in self._groups[group].processes.values()): 
-                    del self._groups[group]
+            fields = restart_fields(self._config[group], config[group])
 
-            for process in self._groups[group].processes.values():
-                self._groups[group].stop(process.name, on_stop)
+            if len(fields) > 0:
+                self._logger.info(f"reload: group {group} changed {fields}, restarting it")
 
-        for group in added:
-            self._groups[group] = Group(group, config[group], self._logger)
+                self._retire(group, config[group])
+            else:
+                self._logger.info(f"reload: group {group} updated in place")
 
-            for process in self._groups[group].processes.values():
-                if self._groups[group].program.autostart:
-                    self._groups[group].start(process.name)
+                self._groups[group].update(config[group])
+                self._index.add(self._groups[group])
 
-        for group in same:
-            if self._config[group] != config[group]:
-                def on_stop(process_name: str, pid: int, group=group):
-                    process = Context.get_process(pid)
+        self._config = config
 
-                    if all(process.state in [ProcessState.stopped, ProcessState.exited, ProcessState.fatal] for process in self._groups[group].processes.values()): 
-                        del self._groups[group]
+        self._context.journal.settle() if self._context.journal is not None else None
+        self._context.listeners.settle()
 
-                        self._groups[group] = Group(group, config[group], self._logger)
+    def _create(self, name: str, config: Dict[str, Any]):
+        group = Group(name, config, self._context)
 
-                        for process in self._groups[group].processes.values():
-                            self._groups[group].start(process.name)
+        self._groups[name] = group
 
-                for process in self._groups[group].processes.values():
-                    self._groups[group].stop(process.name, on_stop)
+        self._index.add(group)
 
-        self._config = config
+        if group.program.autostart:
+            for process in group.processes.values():
+                group.launch(process.name) if process.state == ProcessState.stopped else None # not adopted
 
-    def start(self, group_name: str, process_name: str = None) -> Dict[str, Tuple[int, bool]]:
-        if group_name in self._groups.keys():
-            process_count = 0
-            result = dict()
-            lock = threading.Lock()
+    def _retire(self, name: str, replacement: Dict[str, Any]):
+        """
+        Stops every process of the group, then drops it or, when replacement is given,
+            rebuilds it from that config once the last process is gone
+        """
+        group = self._groups[name]
+        pending = set(group.processes.keys())
+        lock = threading.Lock()
 
-            def on_spawn(name: str, pid: int):
-                nonlocal process_count
+        group.retire()
 
-                with lock:
-                    result[name] = (pid, True)
-                    process_count -= 1
+        def on_stop(process_name: str, pid: int):
+            with lock:
+                if process_name not in pending:
+                    return
 
-            def on_fail(name: str, pid: int):
-                nonlocal process_count
+                pending.discard(process_name)
 
-                with lock:
-                    result[name] = (pid, False)
-                    process_count -= 1
+                if len(pending) > 0:
+                    return
 
-            if process_name is not None:
-                result[process_name] = (0, False)
+            if self._groups.get(name) is group:
+                del self._groups[name]
 
-                if self._groups[group_name].start(process_name, on_spawn, on_fail):
-                    process_count += 1
-            else:
-                for process in self._groups[group_name].processes.values():
-                    result[process.name] = (0, False)
+                self._index.remove(name)
 
-                    if self._groups[group_name].start(process.name, on_spawn, on_fail):
-                        process_count += 1
+                self._create(name, replacement) if replacement is not None else None
 
-            while process_count != 0:
-                time.sleep(0.1)
+                group.release() # after the replacement took over the listening sockets they have in common
 
-            return result
-        return None
+        for process in list(group.processes.values()):
+            if not group.stop(process.name, on_stop):
+                on_stop(process.name, 0)
 
-    def stop(self, group_name: str, process_name: str = None) -> Dict[str, Tuple[int, bool]]:
-        if group_name in self._groups.keys():
-            process_count = 0
-            result = dict()
-            lock = threading.Lock()
+    def start(self, group_name: str, process_name: str = None, timeout: float = None) -> Dict[str, Tuple[int, bool]]:
+        return self._collect(self.start_async(group_name, process_name), timeout)
 
-            def on_kill(name: str, pid: int):
-                nonlocal process_count
+    def stop(self, group_name: str, process_name: str = None, timeout: float = None) -> Dict[str, Tuple[int, bool]]:
+        return self._collect(self.stop_async(group_name, process_name), timeout)
 
-                with lock:
-                    result[name] = (pid, True)
-                    process_count -= 1
+    def restart(self, group_name: str, process_name: str = None, timeout: float = None) -> Dict[str, Tuple[int, bool]]:
+        return self._collect(self.restart_async(group_name, process_name), timeout)
 
-            if process_name is not None:
-                result[process_name] = (0, False)
+    def start_async(self, group_name: str, process_name: str = None) -> Dict[str, Future]:
+        """
+        Returns a future per process resolved with (pid, success) as soon as
+            the process enters RUNNING or fails to start
+        """
+        return self._submit(group_name, process_name, self._launch)
 
-                if self._groups[group_name].stop(process_name, on_kill):
-                    process_count += 1
-            else:
-                for process in self._groups[group_name].processes.values():
-                    result[process.name] = (0, False)
+    def stop_async(self, group_name: str, process_name: str = None) -> Dict[str, Future]:
+        return self._submit(group_name, process_name, lambda group, name, on_done, on_fail: group.stop(name, on_done))
 
-                    if self._groups[group_name].stop(process.name, on_kill):
-                        process_count += 1
+    def restart_async(self, group_name: str, process_name: str = None) -> Dict[str, Future]:
+        return self._submit(group_name, process_name, lambda group, name, on_done, on_fail: group.restart(name, on_done, on_fail))
 
-            while process_count != 0:
-                time.sleep(0.1)
+    def select(self, selectors: List[str]) -> List[Tuple[str, str]]:
+        """
+        Resolves target selectors (see selector.py) into (group, process) pairs,
+            raises ValueError on an invalid selector
+        """
+        return self._index.select(selectors)
 
-            return result
-        return None
+    def start_targets_async(self, targets: List[Tuple[str, str]]) -> Dict[str, Future]:
+        """
+        Same as start_async for any set of processes (see select), futures are keyed by "<group>:<name>"
+        """
+        return self._fan_out(targets, self._launch, True)
 
-    def restart(self, group_name: str, process_name: str = None) -> Dict[str, Tuple[int, bool]]:
-        if group_name in self._groups.keys():
-            process_count = 0
-            result = dict()
-            lock = threading.Lock()
+    def stop_targets_async(self, targets: List[Tuple[str, str]]) -> Dict[str, Future]:
+        return self._fan_out(targets, lambda group, name, on_done, on_fail: group.stop(name, on_done), True)
 
-            def on_spawn(name: str, pid: int):
-                nonlocal process_count
+    def restart_targets_async(self, targets: List[Tuple[str, str]]) -> Dict[str, Future]:
+        return self._fan_out(targets, lambda group, name, on_done, on_fail: group.restart(name, on_done, on_fail), True)
 
-                with lock:
-                    result[name] = (pid, True)
-                    process_count -= 1
+    def status_targets(self, targets: List[Tuple[str, str]]) -> List[Tuple[str, Process]]:
+        """
+        (group, process) of the targets still present
+        """
+        status = list()
 
-            def on_fail(name: str, pid: int):
-                nonlocal process_count
+        for group_name, process_name in targets:
+            group = self._groups.get(group_name)
+            process = group.status(process_name) if group is not None else None
 
-                with lock:
-                    result[name] = (pid, False)
-                    process_count -= 1
+            status.append((group_name, process)) if process is not None else None
 
-            if process_name is not None:
-                result[process_name] = (0, False)
+        return status
 
-                if self._groups[group_name].restart(process_name, on_spawn, on_fail):
-                    process_count += 1
-            else:
-                for process in self._groups[group_name].processes.values():
-                    result[process.name] = (0, False)
+    def stats(self, targets: List[Tuple[str, str]]) -> List[Tuple[str, str, Sample]]:
+        """
+        Resource usage of the targets from the last sampler sweep, sample is None for processes
+            not running or not sampled yet
+        """
+        stats = list()
 
-                    if self._groups[group_name].restart(process.name, on_spawn, on_fail):
-                        process_count += 1
+        for group_name, process_name in targets:
+            sample = self._sampler.get((group_name, process_name))
 
-            while process_count != 0:
-                time.sleep(0.1)
+            if sample is not None and sample.pid != self.pid(group_name, process_name):
+                sample = None
 
-            return result
-        return None
+            stats.append((group_name, process_name, sample))
+
+        return stats
+
+    def trace(self, targets: List[Tuple[str, str]], limit: int = None) -> Dict[Tuple[str, str], List[tuple]]:
+        """
+        Recent lifecycle events of the targets, see trace.Tracer for the phases
+        """
+        return self._context.tracer.events(set(targets), limit)
+
+    def _sample_targets(self) -> List[Tuple[Tuple[str, str], int]]:
+        return [((group.name, process.name), process.pid) for group in list(self._groups.values())
+                for process in group.processes.values() if process.pid > 0]
 
     def status(self, group_name: str, process_name: str = None) -> Union[Process, List[Process], None]:
         if group_name in self._groups.keys():
@@ -192,43 +243,185 @@ class Taskmaster:
                 return self._groups[group_name].processes[process_name].pid
         return -1
 
-    def attach(self, group_name: str, process_name: str) -> None:
+    def attach(self, group_name: str, process_name: str, wakeup: Callable[[], None]) -> Subscription:
+        """
+        Subscribes to the stdout log of the process, wakeup is called from the log thread
+            every time new bytes are queued. Subscription must be released with detach
+        """
         if group_name not in self._groups.keys():
             return None
 
         if process_name not in self._groups[group_name].processes.keys():
             return None
 
-        current_position = 0
-        filename = self._groups[group_name].program.stdout_logfile
+        process = self._groups[group_name].processes[process_name]
 
-        while True:
-            if os.path.getsize(filename) > current_position:
-                try:
-                    with open(filename, 'r') as file:
-                        file.seek(current_position)
-                        
-                        new_logs = file.read()
+        if process.captured:
+            return self._context.capture.subscribe(process.capture_key(), wakeup)
 
-                        current_position = file.tell()
+        if process.stdout_logfile is None:
+            return None
 
-                        yield new_logs
-                except Exception:
-                    yield None
-            else:
-                yield ""
+        return self._logtail.subscribe(process.stdout_logfile, wakeup)
+
+    def detach(self, subscription: Subscription):
+        subscription.source.unsubscribe(subscription)
+
+    def tail(self, group_name: str, process_name: str, size: int) -> bytes:
+        """
+        Last `size` bytes of the stdout of the process, served from memory for captured processes
+        """
+        if group_name not in self._groups.keys():
+            return None
+
+        if process_name not in self._groups[group_name].processes.keys():
+            return None
+
+        process = self._groups[group_name].processes[process_name]
+
+        if process.captured:
+            return self._context.capture.tail(process.capture_key(), size)
+
+        if process.stdout_logfile is None:
+            return None
 
-    def _sigchld_handler(self):
         try:
-            pid, exit_code = os.waitpid(-1, os.WNOHANG)
+            with open(process.stdout_logfile, "rb") as file:
+                file.seek(max(os.fstat(file.fileno()).st_size - size, 0))
+
+                return file.read()
+        except OSError:
+            return None
+
+    def _submit(self, group_name: str, process_name: str, action: Callable[[Group, str, Callable, Callable], bool]) -> Dict[str, Future]:
+        if group_name not in self._groups.keys():
+            return None
+
+        names = [process_name] if process_name is not None else list(self._groups[group_name].processes.keys())
+
+        return self._fan_out([(group_name, name) for name in names], action, False)
+
+    def _fan_out(self, targets: List[Tuple[str, str]], action: Callable[[Group, str, Callable, Callable], bool], qualified: bool) -> Dict[str, Future]:
+        futures = dict()
+
+        for group_name, name in targets:
+            future = Future()
+            group = self._groups.get(group_name)
+
+            def on_done(name: str, pid: int, future=future):
+                _resolve(future, (pid, True))
+
+            def on_fail(name: str, pid: int, future=future):
+                _resolve(future, (pid, False))
+
+            if group is None or not action(group, name, on_done, on_fail):
+                _resolve(future, (0, False))
+
+            futures[f"{group_name}:{name}" if qualified else name] = future
+
+        return futures
+
+    def _launch(self, group: Group, name: str, on_done: Callable, on_fail: Callable) -> bool:
+        group.launch(name, on_done, on_fail)
+
+        return True # queued, the launcher reports the outcome through the callbacks
+
+    def _collect(self, futures: Dict[str, Future], timeout: float = None) -> Dict[str, Tuple[int, bool]]:
+        """
+        Waits for the futures without polling, those not done within timeout are reported as failed
+        """
+        if futures is None:
+            return None
+
+        wait(futures.values(), timeout)
+
+        result = dict()
+
+        for name, future in futures.items():
+            result[name] = future.result() if future.done() else (0, False)
+
+        return result
+
+    def progress(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Launch progress of groups which have starts queued or in flight
+        """
+        return self._context.launcher.progress()
+
+    def reaper_stats(self) -> Dict[str, Any]:
+        return self._context.reaper.stats()
+
+    def scheduler_stats(self) -> Dict[str, Any]:
+        return self._context.scheduler.stats()
+
+    def registry_stats(self) -> Dict[str, int]:
+        return self._context.stats()
+
+    def sampler_stats(self) -> Dict[str, Any]:
+        return self._sampler.stats()
+
+    def restart_stats(self) -> Dict[str, Any]:
+        return self._context.restarts.stats()
+
+    @property
+    def metrics(self) -> Metrics:
+        return self._context.metrics
+
+    @property
+    def journaled(self) -> bool:
+        return self._context.journal is not None
+
+    def handover(self):
+        """
+        Prepares an exec of the daemon (see journal): captured output is written out and the
+            capture pipes of live children and the listening sockets are kept open for the next image
+        """
+        self._context.capture.freeze()
+        self._context.listeners.handover()
+
+        for group in self._groups.values():
+            for process in group.processes.values():
+                process.handover()
+
+        self._context.journal.seal()
+
+    def close(self):
+        """
+        Removes the status segment, closes the listening sockets and stops the zygotes, called once the daemon is done serving
+        """
+        self._context.status.close() if self._context.status is not None else None
+        self._context.journal.close() if self._context.journal is not None else None
+        self._context.listeners.close()
+        self._context.zygotes.close()
+
+    def _on_child_exit(self, pid: int, exit_code: int, reaped_at: float) -> bool:
+        """
+        Runs on the reaper thread, returns False if the pid doesn't belong to any process (yet)
+        Exits which don't match the current spawn of the process (pid reused, process respawned)
+            are dropped instead of being applied to the wrong instance
+        """
+        entry = self._context.remove_process(pid, reaped_at)
+
+        if entry is None:
+            return False
+
+        process, generation = entry
+
+        if process is None or process.generation != generation or process.pid != pid:
+            self._logger.warning(f"reaper: dropped stale exit of pid {pid} with exit_code {exit_code}")
+
+            return True
+
+        process.on_sigchld(exit_code)
 
-            while pid > 0:
-                process: Process = Context.get_process(pid)
-        
-                if process is not None:
-                    threading.Thread(target=process.on_sigchld, args=[exit_code]).start()
+        return True
 
-                pid, exit_code = os.waitpid(-1, os.WNOHANG)
-        except ChildProcessError:
-            pass
 
+def _resolve(future: Future, value: Tuple[int, bool]):
+    """
+    Process callbacks outlive a single request (they are kept for autorestarts), so late calls are ignored
+    """
+    try:
+        future.set_result(value)
+    except InvalidStateError:
+        pass
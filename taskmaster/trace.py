@@ -0,0 +1,56 @@
+import time
+import itertools
+
+from typing import List, Dict, Tuple, Set
+
+
+class Tracer:
+    """
+    Ring buffer of process lifecycle events: (monotonic time, group, name, pid, phase, detail)
+    Recording takes a ticket from an itertools counter (atomic under the GIL) and stores one
+        tuple in the matching slot, no lock, so it stays enabled in production.
+        The oldest events are overwritten once `capacity` is reached
+    Phases:
+        queued          start request queued on the launcher
+        spawn           spawn begins (launcher worker or restart timer)
+        deferred        restart held back by the global restart rate limit, detail is the wait
+        logfiles        log files resolved and capture pipes opened
+        exec            spawn backend returned, the program is executing
+        registered      pid known to the registry and the reaper
+        adopted         child of the previous daemon taken over, detail is child or pidfd
+        spawn_failed    spawn backend raised, detail is the error
+        running         startsecs elapsed (or startsecs is 0)
+        stop            stop signal sent, detail is the signal
+        sigkill         stopwaitsecs elapsed, SIGKILL sent
+        exit            child reaped, detail is the exit code
+        backoff/fatal/exited/stopped/unknown    state the exit led to
+    """
+    capacity: int
+
+    _events: List[tuple]
+    _tickets: itertools.count
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+
+        self._events = [None] * max(capacity, 0)
+        self._tickets = itertools.count()
+
+    def record(self, group: str, name: str, pid: int, phase: str, detail=None):
+        if self.capacity > 0:
+            self._events[next(self._tickets) % self.capacity] = (time.monotonic(), group, name, pid, phase, detail)
+
+    def events(self, targets: Set[Tuple[str, str]], limit: int = None) -> Dict[Tuple[str, str], List[tuple]]:
+        """
+        Recorded events of the targets in time order, at most `limit` most recent per target
+        """
+        events = dict()
+
+        for event in sorted((event for event in list(self._events) if event is not None and (event[1], event[2]) in targets),
+                            key=lambda event: event[0]):
+            events.setdefault((event[1], event[2]), list()).append(event)
+
+        if limit is not None:
+            events = {target: recorded[-limit:] for target, recorded in events.items()}
+
+        return events
@@ -0,0 +1,143 @@
+import os
+import time
+import select
+import fnmatch
+import logging
+import threading
+
+from typing import Dict, Set, Callable
+
+from . import inotify
+
+
+class ConfigWatcher:
+    """
+    Calls on_change (from its own thread) once the watched files stop changing for
+        `debounce` seconds, or MAX_DELAY seconds after the first event of a burst
+        which doesn't stop, so that a deploy writing many files triggers one reload
+    Directories are watched rather than files: editors and deploy tools replace files
+        by rename, which a watch on the file itself would lose. Events are filtered
+        by the file name patterns given for each directory
+    """
+    _on_change: Callable[[], None]
+    _debounce: float
+    _logger: logging.Logger
+    _inotify: inotify.Inotify
+    _directories: Dict[str, int] # real path -> wd
+    _patterns: Dict[int, Set[str]] # wd -> file name patterns
+    _lock: threading.Lock
+    _thread: threading.Thread
+    _wakeup_r: int
+    _wakeup_w: int
+    _running: bool
+
+    _changes: int
+
+    MAX_DELAY = 2.0
+    WATCH_MASK = inotify.IN_CLOSE_WRITE | inotify.IN_CREATE | inotify.IN_DELETE | inotify.IN_MOVED_FROM | inotify.IN_MOVED_TO
+
+    def __init__(self, on_change: Callable[[], None], debounce: float, logger: logging.Logger):
+        self._on_change = on_change
+        self._debounce = debounce
+        self._logger = logger
+        self._inotify = inotify.Inotify() # raises OSError without inotify, the caller decides what to do
+        self._directories = dict()
+        self._patterns = dict()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._loop, name="taskmaster-watcher", daemon=True)
+        self._wakeup_r, self._wakeup_w = os.pipe2(os.O_NONBLOCK | os.O_CLOEXEC)
+        self._running = False
+
+        self._changes = 0
+
+    def start(self):
+        self._running = True
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+
+        try:
+            os.write(self._wakeup_w, b"\0")
+        except OSError:
+            pass
+
+    def watch(self, targets: Dict[str, Set[str]]):
+        """
+        Replaces the watched set: directory -> file name patterns (fnmatch) in it
+        """
+        wanted = dict()
+
+        for directory, patterns in targets.items():
+            wanted.setdefault(os.path.realpath(directory), set()).update(patterns)
+
+        with self._lock:
+            for directory in set(self._directories) - set(wanted):
+                wd = self._directories.pop(directory)
+
+                self._inotify.rm_watch(wd) if wd not in self._directories.values() else None
+
+            patterns = dict()
+
+            for directory, names in wanted.items():
+                if directory not in self._directories:
+                    try:
+                        self._directories[directory] = self._inotify.add_watch(directory, self.WATCH_MASK)
+                    except OSError as error:
+                        self._logger.warning(f"watcher: cannot watch {directory}: {error}")
+
+                        continue
+
+                patterns.setdefault(self._directories[directory], set()).update(names)
+
+            self._patterns = patterns
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "directories": len(self._directories),
+            "changes": self._changes,
+        }
+
+    def _relevant(self, events) -> bool:
+        with self._lock:
+            for wd, _, _, name in events:
+                if any(fnmatch.fnmatchcase(name, pattern) for pattern in self._patterns.get(wd, ())):
+                    return True
+
+        return False
+
+    def _loop(self):
+        poller = select.poll()
+
+        poller.register(self._wakeup_r, select.POLLIN)
+        poller.register(self._inotify.fd, select.POLLIN)
+
+        first = deadline = None
+
+        while self._running:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0) * 1000
+
+            try:
+                poller.poll(timeout)
+            except InterruptedError:
+                continue
+
+            if self._relevant(self._inotify.read_events()):
+                now = time.monotonic()
+                first = now if first is None else first
+                deadline = min(now + self._debounce, first + self.MAX_DELAY)
+
+            if deadline is not None and time.monotonic() >= deadline:
+                first = deadline = None
+
+                self._changes += 1
+
+                try:
+                    self._on_change()
+                except Exception as error:
+                    self._logger.error(f"watcher: reload failed to start: {error}")
+
+        self._inotify.close()
+
+        os.close(self._wakeup_r)
+        os.close(self._wakeup_w)
@@ -0,0 +1,219 @@
+import os
+import json
+import ctypes
+import signal
+import socket
+import threading
+import logging
+
+from typing import List, Dict, Tuple, Union
+
+from .program import Program
+from .spawn import _RESET_SIGNALS, _open_log
+
+
+SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "zygote_server.py")
+PR_SET_CHILD_SUBREAPER = 36
+
+
+def entry_point(command: List[str]) -> Tuple[List[str], List[str]]:
+    """
+    Splits a python command into the interpreter with its options and the argv of the program
+        (["script.py", args...] or ["-m", "module", args...]), raises ValueError when it is not one
+    """
+    if len(command) == 0 or not os.path.basename(command[0]).startswith("python"):
+        raise ValueError("the command must start with a python interpreter")
+
+    index = 1
+
+    while index < len(command) and command[index].startswith("-") and command[index] != "-m":
+        if command[index] == "-c" or command[index] == "-":
+            raise ValueError(f"{command[index]} has no entry point to fork")
+
+        index += 2 if command[index] in ("-W", "-X", "--check-hash-based-pycs") else 1
+
+    if index >= len(command) or (command[index] == "-m" and index + 1 >= len(command)):
+        raise ValueError("expected <python> [options] script.py [args] or <python> [options] -m module [args]")
+
+    return command[:index], command[index:]
+
+
+class Zygote:
+    """
+    Warm interpreter of one program (see zygote_server): instances are forked from it with
+        the preloaded modules already imported instead of paying interpreter startup and
+        imports on every spawn. Started on the first spawn, restarted if it died
+    Requests are serialized, a spawn is a round trip and two forks of the zygote
+    """
+    _program: Program
+    _logger: logging.Logger
+    _lock: threading.Lock
+    _control: socket.socket
+    _pid: int
+
+    TIMEOUT = 60 # seconds to answer a request, the first one includes the preload
+
+    def __init__(self, program: Program, logger: logging.Logger):
+        self._program = program
+        self._logger = logger
+        self._lock = threading.Lock()
+        self._control = None
+        self._pid = 0
+
+    def spawn(self, stdout: Union[int, str], stderr: Union[int, str], fds: List[int] = ()) -> int:
+        stdio = [target if isinstance(target, int) else _open_log(target) for target in (stdout, stderr)]
+        opened = [fd for fd, target in zip(stdio, (stdout, stderr)) if not isinstance(target, int)]
+
+        try:
+            with self._lock:
+                if self._control is None:
+                    self._start()
+
+                try:
+                    reply = self._request(stdio + list(fds))
+                except ConnectionError as error:
+                    self._logger.warning(f"zygote: {' '.join(self._program.command)} (pid {self._pid}) is gone: {error}, starting it again")
+
+                    self._stop()
+                    self._start()
+
+                    reply = self._request(stdio + list(fds))
+        finally:
+            for fd in opened:
+                os.close(fd)
+
+        if "error" in reply:
+            raise OSError(f"zygote: {reply['error']}")
+
+        return reply["pid"]
+
+    def stop(self):
+        with self._lock:
+            self._stop()
+
+    @property
+    def pid(self) -> int:
+        return self._pid
+
+    def _start(self):
+        interpreter, argv = entry_point(self._program.command)
+        parent, child = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+
+        config = json.dumps({"argv": argv, "preload": self._program.preload,
+                             "directory": self._program.directory, "umask": self._program.umask})
+
+        try:
+            self._pid = os.posix_spawnp(interpreter[0], interpreter + [SERVER, config], self._program.environment,
+                                        file_actions=[(os.POSIX_SPAWN_DUP2, child.fileno(), 3)],
+                                        setsigdef=_RESET_SIGNALS, setsigmask=[])
+        except Exception:
+            parent.close()
+
+            raise
+        finally:
+            child.close()
+
+        parent.settimeout(self.TIMEOUT)
+
+        self._control = parent
+
+        self._logger.info(f"zygote: started {' '.join(interpreter)} {argv[0] if argv[0] != '-m' else argv[1]} with pid {self._pid}")
+
+    def _request(self, fds: List[int]) -> Dict:
+        try:
+            socket.send_fds(self._control, [b"spawn"], fds)
+
+            reply = self._control.recv(4096)
+        except socket.timeout:
+            self._stop()
+
+            raise TimeoutError(f"zygote: no answer in {self.TIMEOUT}s, killed")
+
+        if len(reply) == 0:
+            raise ConnectionResetError("zygote closed the control socket")
+
+        return json.loads(reply)
+
+    def _stop(self):
+        """
+        The zygote exits on EOF, its exit is collected by the reaper like any unknown child
+        """
+        if self._control is None:
+            return
+
+        pid = self._pid
+
+        self._control.close()
+        self._control = None
+        self._pid = 0
+
+        try:
+            os.kill(pid, signal.SIGKILL) # in case it is stuck in the preload
+        except OSError:
+            pass
+
+
+class Zygotes:
+    """
+    Zygotes of the programs spawned with `spawn: zygote`, keyed by the Program object:
+        a group rebuilt by a reload has a new one and so gets a new zygote
+    spawn has the signature of the spawn backends
+    The daemon becomes a child subreaper with the first zygote, so that instances
+        (grandchildren) are reparented to it and reaped with their exit code
+    """
+    _zygotes: Dict[Program, Zygote]
+    _lock: threading.Lock
+    _logger: logging.Logger
+    _subreaper: bool
+
+    def __init__(self, logger: logging.Logger):
+        self._zygotes = dict()
+        self._lock = threading.Lock()
+        self._logger = logger
+        self._subreaper = False
+
+    def spawn(self, program: Program, stdout: Union[int, str], stderr: Union[int, str], fds: List[int] = ()) -> int:
+        with self._lock:
+            if not self._subreaper:
+                _set_subreaper() # raises, the spawn fails: exits of instances reparented to init would never be seen
+
+                self._subreaper = True
+
+            zygote = self._zygotes.get(program)
+
+            if zygote is None:
+                zygote = self._zygotes[program] = Zygote(program, self._logger)
+
+        return zygote.spawn(stdout, stderr, fds)
+
+    def release(self, program: Program):
+        with self._lock:
+            zygote = self._zygotes.pop(program, None)
+
+        zygote.stop() if zygote is not None else None
+
+    def close(self):
+        with self._lock:
+            zygotes = list(self._zygotes.values())
+
+            self._zygotes.clear()
+
+        for zygote in zygotes:
+            zygote.stop()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "zygotes": len(self._zygotes),
+                "running": sum(1 for zygote in self._zygotes.values() if zygote.pid > 0),
+            }
+
+
+def _set_subreaper():
+    try:
+        prctl = ctypes.CDLL(None, use_errno=True).prctl
+    except AttributeError:
+        raise OSError("zygote: prctl is not available, cannot become a child subreaper")
+
+    if prctl(PR_SET_CHILD_SUBREAPER, 1, 0, 0, 0) != 0:
+        raise OSError(ctypes.get_errno(), f"zygote: cannot become a child subreaper: {os.strerror(ctypes.get_errno())}")
@@ -0,0 +1,153 @@
+import os
+import io
+import gc
+import sys
+import json
+import fcntl
+import runpy
+import socket
+import importlib
+
+# Zygote of a python program (see zygote.py): started by the daemon with the interpreter
+# and options of the program, it imports the preloaded modules once, then forks a new
+# instance for every request read from the control socket (fd 3) instead of starting a
+# fresh interpreter. Only the standard library is used: this file is run as a script and
+# everything it imports is shared by the instances.
+#
+# A request carries the stdout, stderr and listening socket fds of the instance as
+# SCM_RIGHTS, the reply is {"pid": pid} or {"error": message}. Instances are forked
+# through a short lived intermediate process, so they are reparented to the daemon
+# (a child subreaper) which reaps them and gets their real exit code.
+
+CONTROL_FD = 3
+FD_FLOOR = 256
+MAX_FDS = 2 + 64 # stdout, stderr, listening sockets
+
+
+def main():
+    config = json.loads(sys.argv[1])
+    argv = config["argv"]
+
+    control = socket.socket(fileno=CONTROL_FD)
+    control.set_inheritable(False)
+
+    os.umask(config["umask"]) if config["umask"] is not None else None
+
+    try:
+        os.chdir(config["directory"]) if config["directory"] is not None else None
+    except OSError:
+        pass # like the other spawn backends, a missing directory is not fatal
+
+    # what `python script.py` or `python -m module` would put first, not the directory of this file
+    sys.path[0] = os.getcwd() if argv[0] == "-m" else os.path.dirname(os.path.realpath(argv[0]))
+
+    for module in config["preload"]:
+        try:
+            importlib.import_module(module)
+        except Exception as error:
+            print(f"zygote: cannot preload {module}: {error!r}", file=sys.stderr, flush=True)
+
+    gc.freeze() # preloaded objects are never scanned by the collector of an instance, their pages stay shared
+
+    fds = serve(control)
+
+    run(argv, fds)
+
+
+def serve(control: socket.socket) -> list:
+    """
+    Answers requests until the daemon goes away, returns only in a forked instance (with its fds)
+    """
+    while True:
+        try:
+            message, fds, _, _ = socket.recv_fds(control, 4096, MAX_FDS)
+        except InterruptedError:
+            continue
+
+        if len(message) == 0:
+            os._exit(0) # the daemon closed its end
+
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+        read_fd, write_fd = os.pipe()
+
+        try:
+            intermediate = os.fork()
+        except OSError as error:
+            intermediate = -1
+
+            reply = {"error": f"fork failed: {error}"}
+
+        if intermediate == 0:
+            try:
+                worker = os.fork()
+            except OSError:
+                os._exit(1) # nothing written, the zygote reports the failure
+
+            if worker == 0:
+                os.close(read_fd)
+                os.close(write_fd)
+
+                control.close()
+
+                return fds
+
+            os.write(write_fd, str(worker).encode())
+            os._exit(0) # only the instance leaves serve, never the intermediate
+
+        os.close(write_fd)
+
+        for fd in fds:
+            os.close(fd)
+
+        if intermediate > 0:
+            pid = os.read(read_fd, 32)
+
+            os.waitpid(intermediate, 0)
+
+            reply = {"pid": int(pid)} if len(pid) > 0 else {"error": "fork of the instance failed"}
+
+        os.close(read_fd)
+
+        control.send(json.dumps(reply).encode())
+
+
+def run(argv: list, fds: list):
+    """
+    Turns the forked zygote into the program: stdio, listening sockets (fds 3, ...
+        with LISTEN_FDS/LISTEN_PID, see spawn), argv, then the entry point as __main__
+    """
+    moved = [fcntl.fcntl(fd, fcntl.F_DUPFD_CLOEXEC, FD_FLOOR) for fd in fds]
+
+    for fd in fds:
+        os.close(fd)
+
+    for target, fd in enumerate(moved):
+        os.dup2(fd, target + 1) # stdout, stderr, then the sockets from 3 on
+        os.close(fd)
+
+    if len(moved) > 2:
+        os.environ["LISTEN_FDS"] = str(len(moved) - 2)
+        os.environ["LISTEN_PID"] = str(os.getpid())
+
+    for name, fd in (("stdout", 1), ("stderr", 2)):
+        stream = getattr(sys, name)
+        stream = io.TextIOWrapper(io.open(fd, "wb", closefd=False), encoding=stream.encoding, errors=stream.errors,
+                                  line_buffering=stream.line_buffering or os.isatty(fd), write_through=stream.write_through)
+
+        setattr(sys, name, stream)
+        setattr(sys, f"__{name}__", stream)
+
+    if argv[0] == "-m":
+        sys.argv = argv[1:]
+
+        runpy.run_module(argv[1], run_name="__main__", alter_sys=True)
+    else:
+        sys.argv = list(argv)
+
+        runpy.run_path(argv[0], run_name="__main__")
+
+
+if __name__ == "__main__":
+    main()
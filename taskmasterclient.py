@@ -4,43 +4,75 @@ import argparse
 import sys
 import readline
 import yaml
+import itertools
+import protocol
 
 
 class TaskMasterCtlClient:
     def __init__(self, socket_path):
         self.socket_path = socket_path
         self.client_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.request_ids = itertools.count(1)
 
     def connect(self):
         try:
             self.client_socket.connect(self.socket_path)
+            self.client_socket.sendall(protocol.MAGIC)
             return True
         except Exception as e:
             return False
 
     def send_command(self, command):
         try:
-            self.client_socket.send(command.encode())
-            response = self.client_socket.recv(1024).decode()
-            if response.startswith("Error:"):
-                print(f"Server returned an error: {response}")
-            else:
-                print(response)
-        except BrokenPipeError:
+            request_id = next(self.request_ids)
+            self.client_socket.sendall(protocol.encode_frame({"id": request_id, "command": command}))
+            while True:
+                response = self.receive()
+                self.print_response(response["output"], response["error"])
+                if response["done"]:
+                    break
+        except (BrokenPipeError, ConnectionError):
             print("Server connection closed...")
             sys.exit(0)
 
+    def pipeline(self, commands):
+        """
+        Sends all commands at once over this connection and collects the outputs,
+            which the server may answer in any order. Returns outputs in command order
+        """
+        outputs = {}
+        request_ids = {}
+        frames = bytearray()
+        for command in commands:
+            request_id = next(self.request_ids)
+            request_ids[request_id] = len(request_ids)
+            outputs[request_id] = ""
+            frames += protocol.encode_frame({"id": request_id, "command": command})
+        self.client_socket.sendall(frames)
+        pending = set(request_ids.keys())
+        while len(pending) > 0:
+            response = self.receive()
+            if response.get("id") not in pending:
+                continue
+            outputs[response["id"]] += response["output"]
+            if response["done"]:
+                pending.discard(response["id"])
+        return [outputs[request_id] for request_id in request_ids.keys()]
+
+    def receive(self):
+        response = protocol.recv_frame(self.client_socket)
+        if response is None:
+            raise ConnectionError("Server connection closed")
+        return response
+
+    def print_response(self, output, error):
+        if error:
+            print(f"Server returned an error: {output}")
+        elif output:
+            print(output, end="" if output.endswith("\n") else "\n", flush=True)
+
     def send_config(self, config_data):
-        try:
-            self.client_socket.send(f"config {config_data}".encode())
-            response = self.client_socket.recv(1024).decode()
-            if response.startswith("Error:"):
-                print(f"Server returned an error: {response}")
-            else:
-                print(response)
-        except BrokenPipeError:
-            print("Server connection closed...")
-            sys.exit(0)
+        self.send_command(f"config {config_data}")
 
     def close(self):
         self.client_socket.close()
@@ -52,6 +84,7 @@ def main():
     parser.add_argument("socket", type=str, help="Path to the UNIX domain socket")
     parser.add_argument("command", nargs="*", help="Command to send")
     parser.add_argument("-c", "--config", type=str, help="Path to the configuration file")
+    parser.add_argument("-f", "--file", type=str, help="Pipeline commands from file (one per line, - for stdin)")
 
     args = parser.parse_args()
     socket_path = args.socket
@@ -68,8 +101,18 @@ def main():
         print(f"Error: The specified configuration file '{config_path}' does not exist.")
         exit(1)
 
+    # Pipeline every command of the file over this single connection
+    if args.file:
+        with (sys.stdin if args.file == "-" else open(args.file)) as file:
+            commands = [line.strip() for line in file if line.strip()]
+        try:
+            for output in client.pipeline(commands):
+                client.print_response(output, output.startswith("Error:"))
+        except (BrokenPipeError, ConnectionError):
+            print("Server connection closed...")
+            sys.exit(0)
     # Send a command if command-line arguments are provided
-    if args.command:
+    elif args.command:
         command = " ".join(args.command)
         client.send_command(command)
     else:
@@ -1,182 +1,277 @@
 import argparse
-import select
+import asyncio
 import socket
 import os
-import time
 import yaml
 from command_handler import CommandHandler
+import protocol
 import logging
 import parser_config as config_parser
 from taskmaster import Taskmaster
+from taskmaster.watcher import ConfigWatcher
 import signal
+import time
+import sys
 
 
 class TaskMasterCtlServer:
-    def __init__(self, socket_path, taskmaster, config, logger):
+    def __init__(self, socket_path, taskmaster, config, logger, backlog=socket.SOMAXCONN, metrics_address=None,
+                 watch_debounce=None):
         self.socket_path = socket_path
-        self.server_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server = None
         self.should_exit = False
         self.taskmaster = taskmaster
-        self.client_sockets = []
+        self.client_writers = set()
         self.config = config
         self.config_path = None
         self.logger = logger
+        self.backlog = backlog
+        self.metrics_address = metrics_address
+        self.metrics_server = None
+        self.loop = None
+        self.watch_debounce = watch_debounce
+        self.watcher = None
+        self.reload_lock = asyncio.Lock()
 
-    def start(self):
-        signal.signal(signal.SIGTERM, self.handle_signal)
-        signal.signal(signal.SIGINT, self.handle_signal)
-        signal.signal(signal.SIGQUIT, self.handle_signal)
-        signal.signal(signal.SIGHUP, self.handle_signal)
-        # signal.signal(signal.SIGUSR2, self.handle_signal)
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGQUIT, signal.SIGHUP, signal.SIGUSR2):
+            self.loop.add_signal_handler(signum, self.handle_signal, signum, None)
         if os.path.exists(self.socket_path):
             os.unlink(self.socket_path)
-        self.server_socket.bind(self.socket_path)
-        self.server_socket.listen(1)
+        self.server = await asyncio.start_unix_server(self.handle_client, path=self.socket_path, backlog=self.backlog)
+        if self.metrics_address:
+            await self.start_metrics()
+        if self.watch_debounce is not None:
+            self.start_watcher()
+        if self.watcher is not None:
+            await self.reload_configuration() # unchanged files are not parsed again, this only fills the watched set
+
+    def start_watcher(self):
+        try:
+            self.watcher = ConfigWatcher(lambda: self.loop.call_soon_threadsafe(self.schedule_reload),
+                                         self.watch_debounce, self.logger)
+        except OSError as e:
+            self.logger.warning(f"Config watcher disabled, inotify unavailable: {e}")
+            return
+        self.watcher.start()
+        self.logger.info(f"Watching the configuration, debounce {self.watch_debounce}s")
 
-    def handle_client(self, client_socket):
+    async def start_metrics(self):
+        """
+        Prometheus endpoint, metrics_address is either a UNIX socket path or host:port (loopback HTTP)
+        """
+        if "/" in self.metrics_address:
+            if os.path.exists(self.metrics_address):
+                os.unlink(self.metrics_address)
+            self.metrics_server = await asyncio.start_unix_server(self.handle_metrics, path=self.metrics_address)
+        else:
+            host, port = self.metrics_address.rsplit(":", 1)
+            self.metrics_server = await asyncio.start_server(self.handle_metrics, host=host, port=int(port))
+        self.logger.info(f"Metrics served on {self.metrics_address}")
+
+    async def handle_metrics(self, reader, writer):
+        try:
+            request = await reader.readline()
+            while (await reader.readline()).strip():
+                pass # headers
+            parts = request.split()
+            if len(parts) >= 2 and parts[0] == b"GET" and parts[1] in (b"/metrics", b"/"):
+                body = self.taskmaster.metrics.render().encode()
+                writer.write(b"HTTP/1.0 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                             b"Content-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body)
+            else:
+                writer.write(b"HTTP/1.0 404 Not Found\r\nContent-Length: 0\r\n\r\n")
+            await writer.drain()
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            writer.close()
+
+    async def handle_client(self, reader, writer):
+        """
+        One coroutine per connection, commands waiting on processes only suspend their own client
+        """
         command_handler = CommandHandler(self.taskmaster, self.logger)
-        while not self.should_exit:
-            command = client_socket.recv(1024).decode()
-            if not command:
+        self.client_writers.add(writer)
+        try:
+            line = await reader.readline()
+            if line == protocol.MAGIC:
+                await self.serve_framed(command_handler, reader, writer)
+            else:
+                await self.serve_plain(command_handler, reader, writer, line)
+        except (ConnectionError, OSError, protocol.ProtocolError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.client_writers.discard(writer)
+            writer.close()
+
+    async def serve_plain(self, command_handler, reader, writer, line):
+        while line and not self.should_exit:
+            started = time.monotonic()
+            keep_open = await self.handle_command(command_handler, writer, line.decode(), reader)
+            self.observe_command(command_handler, line.decode(), started)
+            if not keep_open:
                 break
-            parts = command.split()
-            if len(parts) == 0:
-                continue
-            action = parts[0]
-            args = parts[1:]
-            if action == "start":
-                if args:
-                    task_name = " ".join(args)
-                    if ":" in task_name:
-                        group_name, process_name = task_name.split(":")
-                        if group_name is not None:
-                            command_handler.start_task(client_socket, group_name, process_name)
-                        else:
-                            response = "Error: Group name is missing.\n"
-                            client_socket.send(response.encode())
-                    else:
-                        response = "Error: Command should be in the format 'start group_name:process_name'\n"
-                        client_socket.send(response.encode())
-                else:
-                    command_handler.send_command_help(client_socket, "start")
-            elif action == "stop":
-                if args:
-                    task_name = " ".join(args)
-                    if ":" in task_name:
-                        group_name, process_name = task_name.split(":")
-                        if group_name is not None:
-                            command_handler.stop_task(client_socket, group_name, process_name)
-                        else:
-                            response = "Error: Group name is missing.\n"
-                            client_socket.send(response.encode())
-                    else:
-                        response = "Error: Command should be in the format 'stop group_name:process_name'\n"
-                        client_socket.send(response.encode())
-                else:
-                    command_handler.send_command_help(client_socket, "stop")
-            elif action == "status":
-                if args:
-                    task_name = " ".join(args)
-                    if ":" in task_name:
-                        group_name, process_name = task_name.split(":")
-                        if group_name is not None:
-                            command_handler.get_status(client_socket, group_name, process_name)
+            await writer.drain()
+            line = await reader.readline()
+
+    async def serve_framed(self, command_handler, reader, writer):
+        """
+        Every request runs in its own task, responses are sent in completion order
+        """
+        pending = set()
+        try:
+            while not self.should_exit and not writer.is_closing():
+                request = await protocol.read_frame(reader)
+                if request is None:
+                    break
+                task = asyncio.create_task(self.handle_request(command_handler, writer, request))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+        finally:
+            # EOF means the client went away, unfinished requests (e.g. attach) are dropped
+            for task in pending:
+                task.cancel()
+
+    async def handle_request(self, command_handler, writer, request):
+        frame_writer = protocol.FrameWriter(writer, request.get("id"))
+        keep_open = True
+        started = time.monotonic()
+        try:
+            keep_open = await self.handle_command(command_handler, frame_writer, str(request.get("command", "")))
+            self.observe_command(command_handler, str(request.get("command", "")), started)
+        except Exception as e:
+            self.logger.error(f"Error handling command {request.get('command')}: {e}")
+            frame_writer.write(f"Error: {e}\n".encode())
+        try:
+            await frame_writer.finish()
+        except (ConnectionError, OSError):
+            return
+        if not keep_open:
+            writer.close()
+
+    def observe_command(self, command_handler, command, started):
+        parts = command.split()
+        if len(parts) == 0 or parts[0] == "attach": # attach lasts as long as the client follows the log
+            return
+        action = parts[0] if parts[0] in command_handler.available_commands else "unknown"
+        self.taskmaster.metrics.command_seconds.labels(action).observe(time.monotonic() - started)
+
+    async def handle_command(self, command_handler, writer, command, reader=None):
+        """
+        reader: of a plain text client, framed requests are cancelled when their client goes away
+        """
+        parts = command.split()
+        if len(parts) == 0:
+            return True
+        action = parts[0]
+        args = parts[1:]
+        if action == "start":
+            if args:
+                await command_handler.start_task(writer, args)
+            else:
+                command_handler.send_command_help(writer, "start")
+        elif action == "stop":
+            if args:
+                await command_handler.stop_task(writer, args)
+            else:
+                command_handler.send_command_help(writer, "stop")
+        elif action == "status":
+            command_handler.get_status(writer, args if args else ["all"])
+        elif action == "restart":
+            if args:
+                await command_handler.restart_task(writer, args)
+            else:
+                command_handler.send_command_help(writer, "restart")
+        elif action == "pid":
+            command_handler.get_pid(writer, args if args else ["all"])
+        elif action == "trace":
+            if args:
+                command_handler.get_trace(writer, args)
+            else:
+                command_handler.send_command_help(writer, "trace")
+        elif action == "stats":
+            command_handler.get_stats(writer, args if args else ["all"])
+        elif action in ("quit", "exit"):
+            return False
+        elif action == "config":
+            if args:
+                config_yaml = " ".join(args)
+                try:
+                    config_path = config_yaml
+                    config_data = yaml.safe_load(config_yaml)
+                    if config_data:
+                        self.config_path = config_path
+                        if config_path and not os.path.isfile(config_path):
+                            print(f"Error: The specified configuration file '{config_path}' does not exist.")
+                            self.logger.error(f"Error: The specified configuration file '{config_path}' does not "
+                                              f"exist.")
+                            writer.write(f"Error: The specified configuration file '{config_path}' does not "
+                                               f"exist.".encode())
                         else:
-                            response = "Error: Group name is missing.\n"
-                            client_socket.send(response.encode())
+                            writer.write("Configuration was added, need to reload with command: reload for "
+                                               "apply changes\n".encode())
                     else:
-                        response = "Error: Command should be in the format 'status group_name:process_name'\n" \
-                                   "Or 'status group_name:'\n"
-                        client_socket.send(response.encode())
-                else:
-                    response = "Error: Command should be in the format 'status group_name:process_name'\n" \
-                                   "Or 'status group_name:'\n"
-                    client_socket.send(response.encode())
-            elif action == "restart":
-                if args:
-                    task_name = " ".join(args)
-                    group_name, process_name = task_name.split(":")
-                    command_handler.restart_task(client_socket, group_name, process_name)
-                else:
-                    command_handler.send_command_help(client_socket, "restart")
-            elif action == "pid":
-                if args:
-                    task_name = " ".join(args)
+                        print("Failed to deserialize configuration data.")
+                except Exception as e:
+                    print(f"Error deserializing configuration: {str(e)}")
+            else:
+                command_handler.send_command_help(writer, "config")
+        elif action == "reexec":
+            await self.reexec(writer)
+        elif action == "reload":
+            await command_handler.reload_task(self.config_path, writer, self.reload_configuration)
+        elif action == "help":
+            if args:
+                cmd_to_help = args[0]
+                command_handler.send_command_help(writer, cmd_to_help)
+            else:
+                command_handler.send_help_info(writer)
+        elif action == "version":
+            response = "1.0\n"
+            writer.write(response.encode())
+        elif action == "attach":
+            if args:
+                task_name = " ".join(args)
+                if ":" in task_name:
                     group_name, process_name = task_name.split(":")
-                    command_handler.get_pid(client_socket, group_name, process_name)
-                else:
-                    command_handler.send_command_help(client_socket, "pid")
-            elif action in ("quit", "exit"):
-                break
-            elif action == "config":
-                if args:
-                    config_yaml = " ".join(args)
-                    try:
-                        config_path = config_yaml
-                        config_data = yaml.safe_load(config_yaml)
-                        if config_data:
-                            self.config_path = config_path
-                            if config_path and not os.path.isfile(config_path):
-                                print(f"Error: The specified configuration file '{config_path}' does not exist.")
-                                self.logger.error(f"Error: The specified configuration file '{config_path}' does not "
-                                                  f"exist.")
-                                client_socket.send(f"Error: The specified configuration file '{config_path}' does not "
-                                                   f"exist.".encode())
-                            else:
-                                client_socket.send("Configuration was added, need to reload with command: reload for "
-                                                   "apply changes\n".encode())
-                        else:
-                            print("Failed to deserialize configuration data.")
-                    except Exception as e:
-                        print(f"Error deserializing configuration: {str(e)}")
+                    if group_name is not None and len(process_name) > 0:
+                        await command_handler.attach(writer, group_name, process_name, reader)
+                    else:
+                        response = "Error: Group name and Process name are missing.\n"
+                        writer.write(response.encode())
                 else:
-                    command_handler.send_command_help(client_socket, "config")
-            elif action == "reload":
-                config_data = self.config_path
-                command_handler.reload_task(config_data, client_socket)
-            elif action == "help":
-                if args:
-                    cmd_to_help = args[0]
-                    command_handler.send_command_help(client_socket, cmd_to_help)
+                    response = "Error: Command should be in the format 'attach group_name:process_name'\n"
+                    writer.write(response.encode())
+        elif action == "progress":
+            command_handler.get_progress(writer)
+        elif action == "tail":
+            if args and ":" in args[0]:
+                group_name, process_name = args[0].split(":")
+                if len(args) > 1 and not args[1].isdigit():
+                    response = "Error: Command should be in the format 'tail group_name:process_name [bytes]'\n"
+                    writer.write(response.encode())
                 else:
-                    command_handler.send_help_info(client_socket)
-            elif action == "version":
-                response = "1.0\n"
-                client_socket.send(response.encode())
-            elif action == "attach":
-                if args:
-                    task_name = " ".join(args)
-                    if ":" in task_name:
-                        group_name, process_name = task_name.split(":")
-                        if group_name is not None and len(process_name) > 0:
-                            command_handler.attach(client_socket, group_name, process_name)
-                        else:
-                            response = "Error: Group name and Process name are missing.\n"
-                            client_socket.send(response.encode())
-                    else:
-                        response = "Error: Command should be in the format 'attach group_name:process_name'\n"
-                        client_socket.send(response.encode())
+                    command_handler.tail(writer, group_name, process_name, int(args[1]) if len(args) > 1 else 1600)
             else:
-                response = f"*** Unknown syntax: {command}\n"
-                client_socket.send(response.encode())
+                command_handler.send_command_help(writer, "tail")
+        else:
+            response = f"*** Unknown syntax: {command}\n"
+            writer.write(response.encode())
+
+        return True
 
     def run(self):
-        self.start()
-        while not self.should_exit:
+        asyncio.run(self.serve())
+
+    async def serve(self):
+        await self.start()
+        async with self.server:
             try:
-                readable, _, _ = select.select([self.server_socket] + self.client_sockets, [], [])
-                for sock in readable:
-                    if sock == self.server_socket:
-                        time.sleep(1)
-                        client_socket, _ = self.server_socket.accept()
-                        self.client_sockets.append(client_socket)
-                    else:
-                        self.handle_client(sock)
-            except KeyboardInterrupt:
-                self.shutdown_server()
-            except OSError as e:
-                if e.errno == 9:
-                    self.client_sockets = [sock for sock in self.client_sockets if sock.fileno() != -1]
+                await self.server.serve_forever()
+            except asyncio.CancelledError:
+                pass
 
     def handle_signal(self, signum, frame):
         if signum in (signal.SIGTERM, signal.SIGINT, signal.SIGQUIT):
@@ -186,23 +281,74 @@ class TaskMasterCtlServer:
         elif signum == signal.SIGHUP:
             print("Received SIGHUP signal. Reloading configuration...")
             self.logger.info("Received SIGHUP signal. Reloading configuration...")
-            self.reload_configuration()
+            self.schedule_reload()
+        elif signum == signal.SIGUSR2:
+            self.logger.info("Received SIGUSR2 signal. Re-executing...")
+            asyncio.ensure_future(self.reexec())
 
     def shutdown_server(self):
-        for client_socket in self.client_sockets:
-            client_socket.close()
-        self.server_socket.close()
+        for writer in list(self.client_writers):
+            writer.close()
+        self.server.close()
+        if self.metrics_server is not None:
+            self.metrics_server.close()
+        if self.watcher is not None:
+            self.watcher.stop()
         self.should_exit = True
 
-    def reload_configuration(self):
-        if self.config_path is not None:
-            prs = config_parser.create_parser(self.config_path, self.logger)
-            self.config = prs.parse()["programs"]
-            self.taskmaster.reload(self.config)
-        else:
-            prs = config_parser.create_parser(None, self.logger)
-            self.config = prs.parse()["programs"]
-            self.taskmaster.reload(self.config)
+    async def reexec(self, writer=None):
+        """
+        Replaces the daemon image in place: the pid stays the same so every child stays ours,
+            the new image adopts them from the journal instead of starting them again
+        The new image loads the configuration from disk and exits if it cannot, so it is
+            checked first: a re-exec onto a broken file would leave every child unmanaged
+        """
+        if not self.taskmaster.journaled:
+            self.logger.error("Re-exec needs the journal (--journal), the daemon keeps running")
+            if writer is not None:
+                writer.write("Error: re-exec needs the journal, start the daemon with --journal\n".encode())
+            return
+        async with self.reload_lock:
+            try:
+                prs = config_parser.create_parser(self.config_path, self.logger)
+                await self.loop.run_in_executor(None, prs.parse)
+            except config_parser.ConfigError as e:
+                self.logger.error(f"Re-exec refused, the configuration on disk does not load: {e}")
+                if writer is not None:
+                    writer.write(f"Error: re-exec refused, the configuration on disk does not load: {e}\n".encode())
+                return
+            self.logger.info("Re-executing the daemon, running processes are kept")
+            if writer is not None:
+                writer.write("Re-executing, running processes are kept\n".encode())
+                finish = getattr(writer, "finish", writer.drain) # a framed reply must be complete, the request never returns
+                await finish()
+            self.shutdown_server()
+            self.taskmaster.handover()
+            os.execv(sys.executable, sys.orig_argv)
+
+    def schedule_reload(self):
+        asyncio.ensure_future(self.reload_configuration())
+
+    async def reload_configuration(self):
+        """
+        Parses and validates in a worker thread, then swaps the config in on the loop:
+            commands never see a half applied config and an invalid one keeps the current config
+        Reloads are serialized, so the programs reported changed are always relative to the applied config
+        Returns None once applied, otherwise why the configuration was refused
+        """
+        async with self.reload_lock:
+            try:
+                prs = config_parser.create_parser(self.config_path, self.logger)
+                config = await self.loop.run_in_executor(None, prs.parse)
+            except config_parser.ConfigError as e:
+                self.logger.error(f"Reload failed, keeping the current configuration: {e}")
+                return str(e)
+            self.config = config["programs"]
+            self.taskmaster.reload(self.config, prs.changed)
+            if self.watcher is not None:
+                self.watcher.watch(prs.watched)
+            self.logger.info("Configuration reloaded")
+            return None
 
 
 def setup_logger():
@@ -227,15 +373,39 @@ def setup_logger():
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Taskmaster Server")
     parser.add_argument("socket_path", help="Path to the socket file")
+    parser.add_argument("--backlog", type=int, default=socket.SOMAXCONN, help="Listen backlog of the control socket")
+    parser.add_argument("--startparallelism", type=int, default=64, help="Max concurrent process spawns across all groups")
+    parser.add_argument("--status-file", default=None,
+                        help="Shared memory status segment read by python -m taskmaster.statusreader, "
+                             "<socket_path>.status by default (one per daemon), empty - disabled")
+    parser.add_argument("--status-slots", type=int, default=65536, help="Max processes published in the status segment")
+    parser.add_argument("--metrics", default="", help="Prometheus endpoint: host:port (e.g. 127.0.0.1:9105) or a UNIX socket path, empty - disabled")
+    parser.add_argument("--trace-size", type=int, default=65536, help="Lifecycle events kept for the trace command, 0 - tracing disabled")
+    parser.add_argument("--restart-rate", type=float, default=100, help="Max automatic restarts per second across all groups, 0 - unlimited")
+    parser.add_argument("--restart-burst", type=int, default=100, help="Automatic restarts allowed at once before --restart-rate applies")
+    parser.add_argument("--journal", default="", help="Process state journal, lets a re-exec'd or restarted daemon adopt running children, empty - disabled")
+    parser.add_argument("--watch", action="store_true", help="Reload automatically when the configuration files change (inotify)")
+    parser.add_argument("--watch-debounce", type=float, default=0.2, help="Seconds without changes before a watched change is reloaded")
+    parser.add_argument("--sample-interval", type=float, default=5.0, help="Seconds between /proc sweeps of the stats command, 0 - disabled")
 
     args = parser.parse_args()
 
     socket_path = args.socket_path
+    status_file = args.status_file if args.status_file is not None else os.path.abspath(socket_path) + ".status"
     setup_logger_debug = setup_logger()
     setup_logger_debug.info(f"Server listen to socket: {socket_path}")
-    taskmaster = Taskmaster(setup_logger_debug)
-    prs = config_parser.create_parser(None, setup_logger_debug)
-    config = prs.parse()["programs"]
+    taskmaster = Taskmaster(setup_logger_debug, args.startparallelism, status_file, args.status_slots,
+                            args.sample_interval, args.trace_size, args.restart_rate, args.restart_burst, args.journal)
+    try:
+        prs = config_parser.create_parser(None, setup_logger_debug)
+        config = prs.parse()["programs"]
+    except config_parser.ConfigError as e:
+        print(e)
+        setup_logger_debug.error(str(e))
+        taskmaster.close()
+        exit(1)
     taskmaster.reload(config)
-    server = TaskMasterCtlServer(socket_path, taskmaster, config, setup_logger_debug)
+    server = TaskMasterCtlServer(socket_path, taskmaster, config, setup_logger_debug, args.backlog, args.metrics,
+                                 args.watch_debounce if args.watch else None)
     server.run()
+    taskmaster.close()
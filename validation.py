@@ -2,84 +2,136 @@ import os
 import sys
 import signal
 
-from umask import validate_umask
+from umask import umask_error
+from taskmaster.listeners import parse_address, MAX_SOCKETS
+from taskmaster.zygote import entry_point
 
 # Purpose: Parse config file and validate it
 
-def validate_config(config):
-    if 'programs' not in config:
-        print("Error: 'programs' section is missing in the configuration.")
-        return False
+AUTORESTART = ['never', 'always', 'on_failure']
+SPAWN_BACKENDS = ['posix_spawn', 'fork', 'zygote']
+STOPSIGNAL = [signal.Signals(i).name for i in signal.Signals]
 
-    programs = config['programs']
-    if not isinstance(programs, dict):
-        print("Error: 'programs' must be a dictionary.")
-        return False
+_stopsignals = frozenset(STOPSIGNAL)
 
-    for program_name, program_config in programs.items():
-        if not isinstance(program_config, dict):
-            print(f"Error: Configuration for program '{program_name}' must be a dictionary.")
-            return False
 
-        required_params = ['command']
-        autorestart = ['never', 'always', 'on_failure']
-        stopsignal = [signal.Signals(i).name for i in signal.Signals]
+class ValidationError(ValueError):
+    """
+    Raised on the first invalid setting, the message says which and why
+    """
 
-        for param in required_params:
-            if param not in program_config:
-                print(f"Error: Required parameter '{param}' is missing in the configuration for program '{program_name}'.")
-                return False
 
-        if program_config.get('numprocs') is not None and (not isinstance(program_config['numprocs'], int) or program_config['numprocs'] <= 0 or program_config['numprocs'] > 100):
-            print(f"Error: 'numprocs' must be a positive integer less than or equal to 100 in the configuration for program '{program_name}'.")
-            return False
+def _integer(low, high=None):
+    return lambda value: isinstance(value, int) and value >= low and (high is None or value <= high)
 
-        if program_config.get('startsecs') is not None and (not isinstance(program_config['startsecs'], int) or program_config['startsecs'] < 0 or program_config['startsecs'] > 3600):
-            print(f"Error: 'startsecs' must be a non-negative integer less than or equal to 3600 in the configuration for program '{program_name}'.")
-            return False
 
-        if program_config.get('startretries') is not None and (not isinstance(program_config['startretries'], int) or program_config['startretries'] < 0 or program_config['startretries'] > 3600):
-            print(f"Error: 'startretries' must be a non-negative integer less than or equal to 3600 in the configuration for program '{program_name}'.")
-            return False
+def _number(low, high=None):
+    return lambda value: isinstance(value, (int, float)) and not isinstance(value, bool) and value >= low and (high is None or value <= high)
 
-        if program_config.get('stopwaitsecs') is not None and (not isinstance(program_config['stopwaitsecs'], int) or program_config['stopwaitsecs'] < 0 or program_config['stopwaitsecs'] > 3600):
-            print(f"Error: 'stopwaitsecs' must be a non-negative integer less than or equal to 3600 in the configuration for program '{program_name}'.")
-            return False
 
-        if program_config.get('umask') is not None:
-            umask_value = program_config['umask']
-            validate_umask(umask_value, program_name)
+def _of_type(kind):
+    return lambda value: isinstance(value, kind)
 
-        if program_config.get('stopsignal') is not None and (not isinstance(program_config['stopsignal'], str) or program_config['stopsignal'] not in stopsignal):
-            print(f"Error: 'stopsignal' must be a string from the list {stopsignal} in the configuration for program '{program_name}'.")
-            return False
 
-        if program_config.get('environment') is not None and (not isinstance(program_config['environment'], dict)):
-            print(f"Error: 'environment' must be a dictionary in the configuration for program '{program_name}'.")
-            return False
+def _addresses(value):
+    if not isinstance(value, list) or len(value) > MAX_SOCKETS or len(set(value)) != len(value):
+        return False
 
-        if not isinstance(program_config['command'], str):
-            print(f"Error: 'command' must be a str in the configuration for program '{program_name}'.")
-            return False
+    try:
+        for address in value:
+            parse_address(address)
+    except ValueError:
+        return False
 
-        if program_config.get('autostart') is not None and (not isinstance(program_config['autostart'], bool)):
-            print(f"Error: 'autostart' must be a boolean value in the configuration for program '{program_name}'.")
-            return False
+    return True
 
-        if program_config.get('autorestart') is not None and (not isinstance(program_config['autorestart'], str) or program_config['autorestart'] not in autorestart):
-            print(f"Error: 'autorestart' must be a string from the list {autorestart} in the configuration for program '{program_name}'.")
-            return False
 
-        if program_config.get('stdout') is not None and (not os.path.exists(program_config['stdout'])):
-            print(f"Error: 'stdout' path '{program_config['stdout']}' does not exist for program '{program_name}'.")
-            return False
+# Compiled once: (parameter, check of a present value, error), checked in this order.
+# The error is formatted with the program name and the offending value, then raised
+RULES = (
+    ('numprocs', _integer(1), "'numprocs' must be a positive integer in the configuration for program '{program}'."),
+    ('startparallelism', _integer(1), "'startparallelism' must be a positive integer in the configuration for program '{program}'."),
+    ('startsecs', _integer(0, 3600), "'startsecs' must be a non-negative integer less than or equal to 3600 in the configuration for program '{program}'."),
+    ('startretries', _integer(0, 3600), "'startretries' must be a non-negative integer less than or equal to 3600 in the configuration for program '{program}'."),
+    ('stopwaitsecs', _integer(0, 3600), "'stopwaitsecs' must be a non-negative integer less than or equal to 3600 in the configuration for program '{program}'."),
+    ('stopsignal', lambda value: isinstance(value, str) and value in _stopsignals,
+     f"'stopsignal' must be a string from the list {STOPSIGNAL} in the configuration for program '{{program}}'."),
+    ('environment', _of_type(dict), "'environment' must be a dictionary in the configuration for program '{program}'."),
+    ('command', _of_type(str), "'command' must be a str in the configuration for program '{program}'."),
+    ('autostart', _of_type(bool), "'autostart' must be a boolean value in the configuration for program '{program}'."),
+    ('autorestart', lambda value: isinstance(value, str) and value in AUTORESTART,
+     f"'autorestart' must be a string from the list {AUTORESTART} in the configuration for program '{{program}}'."),
+    ('stdout', os.path.exists, "'stdout' path '{value}' does not exist for program '{program}'."),
+    ('stderr', os.path.exists, "'stderr' path '{value}' does not exist for program '{program}'."),
+    ('capture', _of_type(bool), "'capture' must be a boolean value in the configuration for program '{program}'."),
+    ('maxbytes', _integer(0), "'maxbytes' must be a non-negative integer in the configuration for program '{program}'."),
+    ('backups', _integer(0, 1000), "'backups' must be a non-negative integer less than or equal to 1000 in the configuration for program '{program}'."),
+    ('spawn', lambda value: value in SPAWN_BACKENDS,
+     f"'spawn' must be a string from the list {SPAWN_BACKENDS} in the configuration for program '{{program}}'."),
+    ('backoffsecs', _number(0), "'backoffsecs' must be a non-negative number in the configuration for program '{program}'."),
+    ('backoffmaxsecs', _number(0), "'backoffmaxsecs' must be a non-negative number in the configuration for program '{program}'."),
+    ('backoffjitter', _number(0, 1), "'backoffjitter' must be a number between 0 and 1 in the configuration for program '{program}'."),
+    ('sockets', _addresses,
+     f"'sockets' must be a list of at most {MAX_SOCKETS} distinct 'tcp://host:port' or 'unix:///path' addresses in the configuration for program '{{program}}'."),
+    ('preload', lambda value: isinstance(value, list) and all(isinstance(module, str) for module in value),
+     "'preload' must be a list of module names in the configuration for program '{program}'."),
+    ('reuseport', _of_type(bool), "'reuseport' must be a boolean value in the configuration for program '{program}'."),
+    ('workingdir', _of_type(str), "'workingdir' must be a string in the configuration for program '{program}'."),
+)
+REQUIRED_PARAMS = ['command']
+
+
+def validate_program(program_name, program_config):
+    if not isinstance(program_config, dict):
+        raise ValidationError(f"Configuration for program '{program_name}' must be a dictionary.")
+
+    for param in REQUIRED_PARAMS:
+        if param not in program_config:
+            raise ValidationError(f"Required parameter '{param}' is missing in the configuration for program '{program_name}'.")
+
+    error = umask_error(program_config['umask'], program_name) if program_config.get('umask') is not None else None
+    if error is not None:
+        raise ValidationError(error)
+
+    for param, check, error in RULES:
+        value = program_config.get(param)
+
+        if value is not None and not check(value):
+            raise ValidationError(error.format(program=program_name, value=value))
+
+    if program_config.get('spawn') == 'zygote':
+        try:
+            entry_point(program_config['command'].split())
+        except ValueError as error:
+            raise ValidationError(f"'spawn: zygote' needs a python command for program '{program_name}': {error}.")
+
+    if program_config.get('reuseport') is True and \
+            any(address.startswith('unix://') for address in program_config.get('sockets') or []):
+        raise ValidationError(f"'reuseport' only applies to tcp:// sockets, unix sockets cannot be bound several times for program '{program_name}'.")
+
+
+def validate_config(config, validated=None):
+    """
+    validated: programs of a previous config which passed, the programs still equal to
+        them are not checked again
+    Raises ValidationError on the first problem found
+    """
+    if 'programs' not in config and 'include' not in config:
+        raise ValidationError("'programs' section is missing in the configuration.")
+
+    include = config.get('include')
+    if include is not None and not isinstance(include, str) and \
+            (not isinstance(include, list) or not all(isinstance(pattern, str) for pattern in include)):
+        raise ValidationError("'include' must be a path pattern or a list of path patterns.")
+
+    programs = config.get('programs', {})
+    if not isinstance(programs, dict):
+        raise ValidationError("'programs' must be a dictionary.")
 
-        if program_config.get('stderr') is not None and (not os.path.exists(program_config['stderr'])):
-            print(f"Error: 'stderr' path '{program_config['stderr']}' does not exist for program '{program_name}'.")
-            return False
+    validated = validated if validated is not None else {}
 
-        if program_config.get('workingdir') is not None and (not isinstance(program_config['workingdir'], str)):
-            print(f"Error: 'workingdir' must be a string in the configuration for program '{program_name}'.")
-            return False
+    for program_name, program_config in programs.items():
+        if validated.get(program_name) == program_config:
+            continue
 
-    return True
+        validate_program(program_name, program_config)